@@ -4,6 +4,7 @@ from . import flim
 from . import image_processing
 from . import io
 from . import metrics
+from . import pipeline
 from . import visualization
 
 
@@ -12,5 +13,6 @@ __all__ = [
     'image_processing',
     'io',
     'metrics',
+    'pipeline',
     'visualization',
     ]
\ No newline at end of file
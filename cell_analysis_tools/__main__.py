@@ -0,0 +1,106 @@
+import argparse
+import os
+from pathlib import Path
+
+from cell_analysis_tools.pipeline import (build_manifest, collect_features,
+                                          feature_spec, load_manifest,
+                                          run_omi_pipeline)
+from cell_analysis_tools.pipeline.manifest import LIFETIME_FILES
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="cell_analysis_tools",
+        description="Dataset level tools of cell_analysis_tools.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    omi = subparsers.add_parser(
+        "omi",
+        help="compute OMI features of every image set of a dataset",
+        description="Finds the image sets of a dataset (or reads a manifest csv), "
+        "computes their OMI features across worker processes and writes one "
+        "partition per set, then collects them into a single csv.",
+    )
+    omi.add_argument("path_dataset", type=Path, help="dataset directory")
+    omi.add_argument("--output", type=Path, default=None,
+                     help="output directory, default path_dataset/outputs")
+    omi.add_argument("--manifest", type=Path, default=None,
+                     help="manifest csv to use instead of searching path_dataset")
+    omi.add_argument("--mask-suffix", default="n_photons_cellmask.tif",
+                     help="suffix of the mask files, default %(default)s")
+    omi.add_argument("--no-fad", action="store_true", help="nadh only dataset")
+    omi.add_argument("--stain-intensity", action="store_true", help="add stain photons")
+    omi.add_argument("--stain-lifetime", action="store_true", help="add stain a1, a2, t1, t2")
+    omi.add_argument("--intensity-weighted", action="store_true",
+                     help="add intensity weighted means of lifetime parameters")
+    omi.add_argument("--other-props", nargs="*", default=["area", "eccentricity"],
+                     help="regionprops of the masks, default %(default)s")
+    omi.add_argument("--quantiles", nargs="*", type=float, default=None,
+                     help="quantiles in [0, 1] of every parameter")
+    omi.add_argument("--workers", type=int, default=os.cpu_count(),
+                     help="number of worker processes, default %(default)s")
+    omi.add_argument("--no-resume", action="store_true",
+                     help="recompute every image set, even if its inputs and the spec are unchanged")
+    return parser
+
+
+def _run_omi(args):
+    path_output = args.path_dataset / "outputs" if args.output is None else args.output
+    path_output.mkdir(parents=True, exist_ok=True)
+
+    if args.manifest is not None:
+        df_manifest = load_manifest(args.manifest)
+    else:
+        channels = {"nadh": LIFETIME_FILES}
+        if not args.no_fad:
+            channels["fad"] = LIFETIME_FILES
+        if args.stain_intensity or args.stain_lifetime:
+            channels["stain"] = LIFETIME_FILES if args.stain_lifetime else ["photons"]
+        df_manifest = build_manifest(
+            args.path_dataset,
+            mask_suffix=args.mask_suffix,
+            channels=channels,
+            path_output=path_output / "manifest.csv",
+        )
+
+    spec = feature_spec(
+        fad=not args.no_fad,
+        stain_intensity=args.stain_intensity,
+        stain_lifetime=args.stain_lifetime,
+        intensity_weighted=args.intensity_weighted,
+        other_props=args.other_props,
+        quantiles=args.quantiles,
+    )
+    summary = run_omi_pipeline(
+        df_manifest,
+        path_output,
+        spec=spec,
+        n_workers=args.workers,
+        resume=not args.no_resume,
+    )
+    collect_features(
+        path_output,
+        path_csv=path_output / f"{args.path_dataset.stem}_features.csv",
+        manifest=df_manifest,
+    )
+    return 0 if len(summary.failed) == 0 else 1
+
+
+def main(argv=None):
+    """
+    Console entry point, e.g.
+
+    .. code-block:: console
+
+        cell_analysis_tools omi path/to/dataset --workers 8 --stain-intensity
+
+    """
+    args = _parser().parse_args(argv)
+    if args.command == "omi":
+        return _run_omi(args)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,4 @@
+from .aggregate_roi_decays import aggregate_roi_decays
 from .bin_image import bin_image
 from .draw_universal_semicircle import draw_universal_semicircle
 from .estimate_and_shift_irf import estimate_and_shift_irf
@@ -5,9 +6,21 @@ from .ideal_sample_phasor import ideal_sample_phasor
 from .phasor_calibration import phasor_calibration
 from .phasor_to_rectangular import phasor_to_rectangular
 from .regionprops_omi import regionprops_omi
+from .derived_image_cache import DerivedImageCache
+from .feature_table import FeatureTable, FeatureTableAccumulator
+from .omi_features import (omi_feature_names, omi_feature_table, omi_features,
+                           omi_parameters, omi_run_parameters)
 from .lifetime_to_phasor import lifetime_to_phasor
 from .rectangular_to_phasor import rectangular_to_phasor
 from .phasor_calculator import phasor_calculator
+from .roi_phasor_table import roi_phasor_table
+from .time_series import FLIMTimeSeries, flim_time_series
+from .phasor_filter import (phasor_median_filter,
+                            phasor_intensity_weighted_filter,
+                            phasor_wavelet_filter)
+from .simulate import (simulate_flim_image,
+                       simulate_label_image,
+                       simulate_omi_images)
 
 __all__ = [
     "bin_image",
@@ -19,6 +32,24 @@ __all__ = [
     "lifetime_to_phasor",
     "phasor_to_rectangular",
     "rectangular_to_phasor",
-    'phasor_calculator'
+    'phasor_calculator',
+    'phasor_median_filter',
+    'phasor_intensity_weighted_filter',
+    'phasor_wavelet_filter',
+    'simulate_flim_image',
+    'simulate_label_image',
+    'simulate_omi_images',
+    'aggregate_roi_decays',
+    'roi_phasor_table',
+    'FLIMTimeSeries',
+    'flim_time_series',
+    'omi_features',
+    'omi_feature_names',
+    'omi_parameters',
+    'omi_run_parameters',
+    'omi_feature_table',
+    'FeatureTable',
+    'FeatureTableAccumulator',
+    'DerivedImageCache',
     
 ]
@@ -0,0 +1,61 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=32)
+def _phasor_basis_cached(timebins_bytes, f, harmonics):
+    timebins = np.frombuffer(timebins_bytes, dtype=np.float64)
+    w = 2 * np.pi * f
+    wt = w * np.asarray(harmonics, dtype=float)[np.newaxis, :] * timebins[:, np.newaxis]
+    basis = np.concatenate([np.cos(wt), np.sin(wt)], axis=1)
+    basis.setflags(write=False)
+    return basis
+
+
+def phasor_basis(timebins, f, harmonics=(1,)):
+    """
+    Cosine and sine basis used to project decays onto phasor coordinates.
+    Results are cached so every decay matrix computed with the same
+    timebins, frequency and harmonics reuses the same basis.
+
+    Parameters
+    ----------
+    timebins : ndarray
+        1D array of timebins.
+    f : float
+        laser repetition rate, in units of 1/timebins.
+    harmonics : tuple, optional
+        harmonics of f to compute. The default is (1,).
+
+    Returns
+    -------
+    basis : ndarray
+        read only (t, 2 * n_harmonics) array, the first n_harmonics columns
+        are cos(h w t) and the last n_harmonics columns are sin(h w t).
+    """
+    timebins = np.ascontiguousarray(timebins, dtype=np.float64)
+    return _phasor_basis_cached(timebins.tobytes(), float(f), tuple(harmonics))
+
+
+def calibrate_phasor(g_decay, s_decay, g_irf, s_irf):
+    """
+    Rotates and scales uncalibrated decay phasors by the IRF phasor, same
+    transform as phasor_calculator.
+
+    Parameters
+    ----------
+    g_decay, s_decay : ndarray
+        uncalibrated decay phasor coordinates.
+    g_irf, s_irf : float
+        uncalibrated IRF phasor coordinates.
+
+    Returns
+    -------
+    g, s : ndarray
+        calibrated phasor coordinates.
+    """
+    norm = g_irf ** 2 + s_irf ** 2
+    g = (g_irf * g_decay + s_irf * s_decay) / norm
+    s = (-s_irf * g_decay + g_irf * s_decay) / norm
+    return g, s
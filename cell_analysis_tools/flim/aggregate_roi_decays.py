@@ -0,0 +1,127 @@
+import collections as coll
+
+import matplotlib.pylab as plt
+import numpy as np
+from scipy import sparse
+
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
+
+RoiDecays = coll.namedtuple("RoiDecays", "decays labels")
+
+
+def _index_sum_matrix(label_index, dtype):
+    """
+    Sparse (n_labels, n_pixels) one-hot matrix built directly from the CSR
+    arrays of a LabelIndex, row i selects the pixels of labels[i].
+    Multiplying it with a (n_pixels, t) array sums the decays of every roi in
+    a single pass over the foreground pixels.
+    """
+    n_pixels = int(np.prod(label_index.shape))
+    return sparse.csr_matrix(
+        (np.ones(len(label_index.indices), dtype=dtype), label_index.indices, label_index.indptr),
+        shape=(len(label_index.labels), n_pixels),
+    )
+
+
+def _accumulate_dtype(dtype):
+    # float32 keeps photon counts exact up to 2**24 per roi and timebin and
+    # avoids upcasting (copying) the whole cube inside the sparse product
+    return np.float64 if dtype == np.float64 else np.float32
+
+
+def aggregate_roi_decays(label_image, sdt_cube, label_index=None, debug=False):
+    """
+    Sums the decays of every roi in a labeled mask with one label indexed
+    reduction. The cube can be an in memory (x, y, t) array or an iterable of
+    (row_start, block) chunks like the ones yielded by
+    ``cell_analysis_tools.io.iter_sdt_rows``, so the full cube never has to be
+    loaded.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        2d array of labeled rois, 0 is background.
+    sdt_cube : ndarray or iterable
+        3d array of photons (x, y, t) or an iterable of (row_start, block)
+        tuples where block is a (rows, y, t) slab of the cube starting at
+        row_start.
+    label_index : LabelIndex, optional
+        precomputed index of label_image. The default is None.
+    debug : bool, optional
+        Show the intensity of the label image and the summed decays.
+        The default is False.
+
+    Returns
+    -------
+    decays : ndarray
+        (n_labels, t) float64 array, one summed decay per roi.
+    labels : ndarray
+        roi value of each row of decays, in increasing order.
+
+    .. code-block:: python
+
+        decays, labels = aggregate_roi_decays(label_image, sdt_cube)
+
+        # streaming from disk one block of rows at a time
+        decays, labels = aggregate_roi_decays(label_image,
+                                              iter_sdt_rows(path_sdt, channel=0))
+
+    """
+    label_image = np.asarray(label_image)
+    label_index = as_label_index(label_image, label_index)
+    list_labels = label_index.labels
+    n_cols = label_image.shape[1]
+
+    if isinstance(sdt_cube, np.ndarray):
+        chunks = [(0, sdt_cube)]
+    else:
+        chunks = sdt_cube
+
+    decays = None
+    m_labels = {}  # one sum matrix per accumulation dtype
+    for row_start, block in chunks:
+        block = np.asarray(block)
+        n_rows, n_cols_block, n_timebins = block.shape
+        assert n_cols_block == n_cols and 0 <= row_start and row_start + n_rows <= label_image.shape[0], (
+            f"Error: cube block {block.shape[:2]} at row {row_start} does not match label image {label_image.shape}"
+        )
+        if decays is None:
+            decays = np.zeros((len(list_labels), n_timebins), dtype=np.float64)
+
+        dtype = _accumulate_dtype(block.dtype)
+        if dtype not in m_labels:
+            # columns of a csc matrix slice without scanning the other blocks
+            m_labels[dtype] = _index_sum_matrix(label_index, dtype).tocsc()
+        m_block = m_labels[dtype][:, row_start * n_cols: (row_start + n_rows) * n_cols]
+        decays += m_block @ block.reshape(-1, n_timebins).astype(dtype, copy=False)
+
+    if decays is None:
+        decays = np.zeros((len(list_labels), 0), dtype=np.float64)
+
+    if debug:
+        fig, ax = plt.subplots(1, 2, figsize=(10, 5))
+        fig.suptitle(f"roi decays | {len(list_labels)} rois")
+        ax[0].imshow(label_image)
+        ax[0].set_axis_off()
+        ax[1].plot(decays.T)
+        ax[1].set_xlabel("timebin")
+        plt.show()
+
+    return RoiDecays(decays=decays, labels=list_labels)
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    from cell_analysis_tools.flim.simulate import (simulate_flim_image,
+                                                   simulate_label_image)
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    sim = simulate_flim_image(label_image, lifetimes=[0.4e-9, 2.5e-9],
+                              amplitudes=[0.7, 0.3], photons=500)
+    decays, labels = aggregate_roi_decays(label_image, sim.cube, debug=True)
+    print(decays.shape, labels)
@@ -0,0 +1,113 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import numpy.ma as ma
+
+
+def _nbytes(image):
+    """ memory held by an array, including the mask of masked arrays """
+    nbytes = np.asarray(ma.getdata(image)).nbytes
+    if isinstance(image, ma.MaskedArray) and image.mask is not ma.nomask:
+        nbytes += image.mask.nbytes
+    return nbytes
+
+
+class DerivedImageCache:
+    """
+    Bounded least recently used cache of derived parameter images (tau_mean,
+    redox ratios, FLIRR...) shared across omi_features calls. Entries are
+    keyed on the parameter and on its input images, so running the whole
+    cell, cytoplasm and nuclei masks of the same image computes every derived
+    image once.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        memory budget of the cached images, least recently used images are
+        evicted past it. The default is 512 MB.
+    by_content : bool, optional
+        key input images on a hash of their contents instead of their
+        identity. Use it when images are loaded again for every call, e.g.
+        from the same files. The default is False.
+
+    Note
+    ----
+        Identity keys keep a reference to the input images while their
+        entries are cached, so an input can't be freed and its id reused by a
+        different array. Inputs must not be modified in place while cached.
+
+    .. code-block:: python
+
+        cache = DerivedImageCache(max_bytes=2 ** 30)
+        for mask in [mask_cell, mask_cytoplasm, mask_nuclei]:
+            dict_omi = omi_features(base_name, mask, images, cache=cache)
+
+    """
+
+    def __init__(self, max_bytes=512 * 2 ** 20, by_content=False):
+        self.max_bytes = max_bytes
+        self.by_content = by_content
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __repr__(self):
+        return (f"DerivedImageCache({len(self)} images, {self.nbytes / 2 ** 20:.1f} MB, "
+                f"{self.hits} hits, {self.misses} misses)")
+
+    def image_key(self, image):
+        """ key of an input image, its identity or a hash of its contents """
+        data = np.asarray(ma.getdata(image))
+        if self.by_content:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(np.ascontiguousarray(data).tobytes())
+            digest.update(np.ascontiguousarray(ma.getmaskarray(image)).tobytes())
+            return ("content", data.shape, data.dtype.str, digest.hexdigest())
+        return ("identity", id(image), data.__array_interface__["data"][0],
+                data.shape, data.strides, data.dtype.str)
+
+    def get(self, key, default=None):
+        """ cached image of key, marked as most recently used """
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, image, inputs=()):
+        """
+        Caches image under key, evicting least recently used images to stay
+        within max_bytes. Images larger than max_bytes are not cached.
+
+        Parameters
+        ----------
+        key : hashable
+            cache key.
+        image : ndarray
+            derived image.
+        inputs : tuple, optional
+            input images referenced by key, kept alive with the entry.
+        """
+        nbytes = _nbytes(image)
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[2]
+        self._entries[key] = (image, tuple(inputs), nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (_, _, nbytes_evicted) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes_evicted
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
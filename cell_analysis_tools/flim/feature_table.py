@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_column(values):
+    """ 1D numeric array if possible, object array otherwise (e.g. bbox tuples) """
+    if isinstance(values, pd.api.extensions.ExtensionArray):
+        return values  # nullable Int64 / boolean columns of FeatureTableAccumulator
+    try:
+        column = np.asarray(values)
+    except ValueError:  # ragged values
+        column = None
+    if column is None or column.ndim != 1:
+        column = np.empty(len(values), dtype=object)
+        column[:] = list(values)
+    return column
+
+
+def _empty_like(column, n):
+    """ column of n missing values with the dtype of column, int and bool columns are zero filled """
+    if column.dtype.kind in "fc":
+        return np.full(n, np.nan, dtype=column.dtype)
+    if column.dtype.kind in "iub":
+        return np.zeros(n, dtype=column.dtype)
+    return np.full(n, None, dtype=object)
+
+
+def _has_missing_mask(buffer):
+    """ int and bool columns can't hold nan, their missing values are tracked in a mask """
+    return buffer.dtype.kind in "iub"
+
+
+def _fill_missing(buffer, missing):
+    """ missing values of a buffer promoted from int or bool to float or object """
+    buffer[missing] = np.nan if buffer.dtype.kind in "fc" else None
+    return buffer
+
+
+def _nullable_column(values, missing):
+    """ pandas nullable Int64 / boolean array of an int or bool column with missing values """
+    if values.dtype.kind == "b":
+        return pd.arrays.BooleanArray(values, missing)
+    return pd.arrays.IntegerArray(values, missing)
+
+
+class FeatureTable:
+    """
+    Columnar table of per roi features. Every column is a contiguous 1D
+    array of the same length, so conversion to pandas or Arrow doesn't copy
+    numeric columns.
+
+    Parameters
+    ----------
+    columns : dict
+        {column name : 1D array-like}, all of the same length.
+
+    .. code-block:: python
+
+        table = omi_feature_table("image_1", label_image, images)
+        table["nadh_t1_mean"]  # float64 array, one value per roi
+        df = table.to_pandas()
+
+    """
+
+    def __init__(self, columns):
+        self.columns = {name: _as_column(values) for name, values in columns.items()}
+        lengths = {len(column) for column in self.columns.values()}
+        assert len(lengths) <= 1, f"Error: columns have different lengths {lengths}"
+
+    def __len__(self):
+        if len(self.columns) == 0:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __repr__(self):
+        return f"FeatureTable({len(self)} rows x {len(self.columns)} columns)"
+
+    @property
+    def column_names(self):
+        return list(self.columns)
+
+    def to_pandas(self, index_name=None):
+        """
+        Converts the table to a DataFrame without copying numeric columns.
+
+        Parameters
+        ----------
+        index_name : str, optional
+            if given and the table has image_id and mask_label columns, the
+            index is set to f"{image_id}_{mask_label}" like the keys of
+            regionprops_omi. The default is None, a range index.
+
+        Returns
+        -------
+        pd.DataFrame
+        """
+        df = pd.DataFrame(self.columns, copy=False)
+        if index_name is not None:
+            df.index = pd.Index(
+                [f"{image_id}_{label}" for image_id, label
+                 in zip(self.columns["image_id"], self.columns["mask_label"])],
+                name=index_name,
+            )
+        return df
+
+    def to_arrow(self):
+        """
+        Converts the table to a pyarrow Table, numeric columns are not copied.
+        Requires the optional pyarrow dependency.
+
+        Returns
+        -------
+        pyarrow.Table
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as err:
+            raise ImportError(
+                "to_arrow requires pyarrow, install it with pip install cell-analysis-tools[arrow]"
+            ) from err
+        return pa.table({name: _arrow_column(pa, column) for name, column in self.columns.items()})
+
+    def to_dict(self):
+        """
+        Nested dictionary {f"{image_id}_{mask_label}" : {feature : value}}
+        like regionprops_omi returns.
+        """
+        features = [name for name in self.columns if name != "image_id"]
+        dict_rows = {}
+        for row in range(len(self)):
+            key = f"{self.columns['image_id'][row]}_{self.columns['mask_label'][row]}"
+            dict_rows[key] = {name: self.columns[name][row] for name in features}
+        return dict_rows
+
+    @classmethod
+    def concatenate(cls, tables):
+        """ Stacks tables with the same or overlapping columns, see FeatureTableAccumulator """
+        accumulator = FeatureTableAccumulator()
+        for table in tables:
+            accumulator.append(table)
+        return accumulator.to_table()
+
+
+def _arrow_column(pa, column):
+    if column.dtype == object:
+        return pa.array(list(column))
+    return pa.array(column)
+
+
+class FeatureTableAccumulator:
+    """
+    Appends FeatureTables, e.g. one per image of a dataset, in amortized O(1)
+    per row. Column buffers double in capacity when full instead of being
+    copied on every append like repeated pd.concat calls. Columns keep their
+    dtype. Columns missing from some tables are filled with nan, None for
+    non numeric columns, and int or bool columns with missing values become
+    pandas nullable Int64 or boolean arrays.
+
+    .. code-block:: python
+
+        accumulator = FeatureTableAccumulator()
+        for image_id, label_image, images in dataset:
+            accumulator.append(omi_feature_table(image_id, label_image, images))
+        df = accumulator.to_table().to_pandas()
+
+    """
+
+    def __init__(self, capacity=1024):
+        self._capacity = capacity
+        self._buffers = {}
+        self._missing = {}  # missing rows of int and bool buffers
+        self.n_rows = 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def _reserve(self, n_rows):
+        if n_rows <= self._capacity:
+            return
+        while self._capacity < n_rows:
+            self._capacity *= 2
+        for name, buffer in self._buffers.items():
+            grown = _empty_like(buffer, self._capacity)
+            grown[: self.n_rows] = buffer[: self.n_rows]
+            self._buffers[name] = grown
+        for name, missing in self._missing.items():
+            grown = np.zeros(self._capacity, dtype=bool)
+            grown[: self.n_rows] = missing[: self.n_rows]
+            self._missing[name] = grown
+
+    def _set_missing(self, name, start, stop, missing=True):
+        buffer = self._buffers[name]
+        if _has_missing_mask(buffer):
+            self._missing.setdefault(name, np.zeros(self._capacity, dtype=bool))[start:stop] = missing
+        elif np.any(missing):
+            rows = np.arange(start, stop)[np.broadcast_to(missing, stop - start)]
+            _fill_missing(buffer, rows)
+
+    def append(self, table):
+        """
+        Appends the rows of a FeatureTable.
+
+        Parameters
+        ----------
+        table : FeatureTable
+            rows to append.
+        """
+        n_new = len(table)
+        self._reserve(self.n_rows + n_new)
+        start, stop = self.n_rows, self.n_rows + n_new
+
+        for name, column in table.columns.items():
+            missing = False
+            if isinstance(column, pd.api.extensions.ExtensionArray):  # nullable column of a previous table
+                missing = column.isna()
+                column = column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=0)
+            buffer = self._buffers.get(name)
+            if buffer is None:
+                buffer = _empty_like(column, self._capacity)
+                self._buffers[name] = buffer
+                if start != 0:
+                    self._set_missing(name, 0, start)
+            elif column.dtype == object and buffer.dtype != object \
+                    or column.dtype != object and np.result_type(buffer.dtype, column.dtype) != buffer.dtype:
+                # e.g. an int column receives floats, float32 receives float64 or a
+                # numeric column receives strings
+                buffer = buffer.astype(np.result_type(buffer.dtype, column.dtype)
+                                       if column.dtype != object else object)
+                self._buffers[name] = buffer
+                if name in self._missing and not _has_missing_mask(buffer):
+                    _fill_missing(buffer, np.flatnonzero(self._missing.pop(name)[: start]))
+            buffer[start:stop] = column
+            self._set_missing(name, start, stop, missing)
+
+        for name in self._buffers:
+            if name not in table.columns:
+                self._set_missing(name, start, stop)
+
+        self.n_rows = stop
+
+    def to_table(self):
+        """ FeatureTable of the rows appended so far, columns are views of the buffers """
+        columns = {}
+        for name, buffer in self._buffers.items():
+            missing = self._missing.get(name)
+            if missing is not None and np.any(missing[: self.n_rows]):
+                columns[name] = _nullable_column(buffer[: self.n_rows], missing[: self.n_rows].copy())
+            else:
+                columns[name] = buffer[: self.n_rows]
+        return FeatureTable(columns)
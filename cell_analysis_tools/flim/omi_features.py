@@ -0,0 +1,534 @@
+import collections as coll
+
+import numpy as np
+import numpy.ma as ma
+from skimage.measure import regionprops
+
+from cell_analysis_tools.flim.feature_table import FeatureTable
+from cell_analysis_tools.image_processing import (label_quantiles,
+                                                 label_statistics,
+                                                 label_weighted_statistics)
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
+
+# products exported by SPCImage for every channel, images are keyed f"{channel}_{product}"
+PRODUCTS = ["intensity", "a1", "a2", "t1", "t2", "chi"]
+
+# parameters it makes sense to compute intensity weighted values for
+LIFETIME_PRODUCTS = ["a1", "a2", "t1", "t2", "tau_mean"]
+
+STATISTICS = ["mean", "stdev"]
+
+OmiRunParameters = coll.namedtuple("OmiRunParameters", "parameters intensity_weighted")
+
+
+def _tau_mean(im_a1, im_a2, im_t1, im_t2):
+    # a1/a2 are percents
+    return (im_a1 / 100 * im_t1) + (im_a2 / 100 * im_t2)
+
+
+# derived images don't depend on the mask, statistics only read roi pixels,
+# so they can be shared across the masks of an image. Masked division
+# excludes zero denominators instead of producing infinite values
+
+
+def _redox_ratio(im_nadh_intensity, im_fad_intensity):
+    return ma.asarray(im_nadh_intensity) / ma.asarray(im_fad_intensity)
+
+
+def _redox_ratio_norm(im_nadh_intensity, im_fad_intensity):
+    masked_im_nadh_intensity = ma.asarray(im_nadh_intensity)
+    masked_im_fad_intensity = ma.asarray(im_fad_intensity)
+    return masked_im_nadh_intensity / (masked_im_fad_intensity + masked_im_nadh_intensity)
+
+
+def _flirr(im_nadh_a2, im_fad_a1):
+    # fluorescence lifetime imaging redox ratio aka FLIRR, bound portions of NADH/FAD
+    return (ma.asarray(im_nadh_a2) / 100) / (ma.asarray(im_fad_a1) / 100)
+
+
+def _channels(image_names):
+    """ channels in order of appearance of f"{channel}_{product}" image names """
+    channels = []
+    for name in image_names:
+        channel, product = name.rsplit("_", 1)
+        assert product in PRODUCTS, (
+            f"Error: image {name} should be named channel_product with product in {PRODUCTS}"
+        )
+        if channel not in channels:
+            channels.append(channel)
+    return channels
+
+
+def derived_parameters(image_names):
+    """
+    Dependency graph of parameter images that can be computed from others.
+
+    Parameters
+    ----------
+    image_names : iterable
+        names of the available f"{channel}_{product}" images.
+
+    Returns
+    -------
+    dict
+        {parameter : (list of input parameters, function(*inputs))}
+    """
+    graph = {}
+    for channel in _channels(image_names):
+        graph[f"{channel}_tau_mean"] = (
+            [f"{channel}_a1", f"{channel}_a2", f"{channel}_t1", f"{channel}_t2"],
+            _tau_mean,
+        )
+    graph["redox_ratio"] = (["nadh_intensity", "fad_intensity"], _redox_ratio)
+    graph["redox_ratio_norm"] = (["nadh_intensity", "fad_intensity"], _redox_ratio_norm)
+    graph["flirr"] = (["nadh_a2", "fad_a1"], _flirr)
+    return graph
+
+
+def _is_available(parameter, image_names, graph):
+    if parameter in image_names:
+        return True
+    if parameter in graph:
+        return all(_is_available(p, image_names, graph) for p in graph[parameter][0])
+    return False
+
+
+def omi_parameters(image_names):
+    """
+    Every parameter available from a set of images, raw and derived, in the
+    regionprops_omi order: per channel intensity, a1, a2, t1, t2, tau_mean,
+    then redox_ratio, redox_ratio_norm, flirr and finally chi of each channel.
+
+    Parameters
+    ----------
+    image_names : iterable
+        names of the available f"{channel}_{product}" images.
+
+    Returns
+    -------
+    list
+        parameter names.
+    """
+    image_names = list(image_names)
+    graph = derived_parameters(image_names)
+    list_parameters = []
+    for channel in _channels(image_names):
+        for product in ["intensity", "a1", "a2", "t1", "t2", "tau_mean"]:
+            list_parameters.append(f"{channel}_{product}")
+    list_parameters += ["redox_ratio", "redox_ratio_norm", "flirr"]
+    list_parameters += [f"{channel}_chi" for channel in _channels(image_names)]
+    return [p for p in list_parameters if _is_available(p, image_names, graph)]
+
+
+def omi_run_parameters(
+    image_names,
+    fad=True,
+    stain_intensity=True,
+    stain_lifetime=True,
+    chi=False,
+    intensity_weighted=False,
+):
+    """
+    Parameters and intensity weighted parameters of a regionprops_omi_run
+    style analysis, selected with its channel flags, shared by
+    regionprops_omi_run, runCALICO and the omi pipeline so they produce the
+    same columns.
+
+    Parameters
+    ----------
+    image_names : iterable
+        names of the available f"{channel}_{product}" images, parameters
+        that can't be computed from them are left out.
+    fad : bool, optional
+        fad lifetime parameters, redox ratios and flirr. The default is True.
+    stain_intensity : bool, optional
+        stain intensity. The default is True.
+    stain_lifetime : bool, optional
+        stain a1, a2, t1 and t2. The default is True.
+    chi : bool, optional
+        nadh and fad chi squared. The default is False.
+    intensity_weighted : bool, optional
+        intensity weighted values of the nadh and fad parameters.
+        The default is False.
+
+    Returns
+    -------
+    parameters : list
+        parameters to compute, see omi_features.
+    intensity_weighted : list
+        parameters to compute intensity weighted values of.
+    """
+    list_parameters = ["nadh_intensity", "nadh_a1", "nadh_a2", "nadh_t1", "nadh_t2", "nadh_tau_mean"]
+    if fad:
+        list_parameters += [
+            "fad_intensity", "fad_a1", "fad_a2", "fad_t1", "fad_t2", "fad_tau_mean",
+            "redox_ratio", "redox_ratio_norm", "flirr",
+        ]
+    if stain_intensity:
+        list_parameters += ["stain_intensity"]
+    if stain_lifetime:
+        list_parameters += ["stain_a1", "stain_a2", "stain_t1", "stain_t2"]
+    if chi:
+        list_parameters += ["nadh_chi", "fad_chi"]
+
+    # keep parameters that can be computed from the images
+    list_available = omi_parameters(image_names)
+    list_parameters = [p for p in list_parameters if p in list_available]
+
+    # intensity weighted values only for nadh and fad lifetime parameters
+    list_weighted = []
+    if intensity_weighted:
+        list_weighted = [p for p in list_parameters if p.split("_")[0] in ["nadh", "fad"]]
+    return OmiRunParameters(parameters=list_parameters, intensity_weighted=list_weighted)
+
+
+def _weight_parameter(parameter):
+    """ intensity image a lifetime parameter is weighted by """
+    for lifetime_product in LIFETIME_PRODUCTS:
+        if parameter.endswith(f"_{lifetime_product}"):
+            return parameter[: -len(lifetime_product)] + "intensity"
+    return None
+
+
+def _resolve_spec(image_names, parameters, intensity_weighted):
+    """ requested parameters and the weighted parameters with their weights """
+    image_names = list(image_names)
+    graph = derived_parameters(image_names)
+    if parameters is None:
+        parameters = omi_parameters(image_names)
+    parameters = list(parameters)
+    for parameter in parameters:
+        if not _is_available(parameter, image_names, graph):
+            raise ValueError(f"Parameter {parameter} can't be computed from images {image_names}")
+
+    if intensity_weighted is True:
+        candidates = parameters
+    elif not intensity_weighted:
+        candidates = []
+    else:
+        candidates = [p for p in parameters if p in list(intensity_weighted)]
+    dict_weights = {}
+    for parameter in candidates:
+        weight = _weight_parameter(parameter)
+        if weight is not None and _is_available(weight, image_names, graph):
+            dict_weights[parameter] = weight
+    return parameters, dict_weights
+
+
+def _quantile_key(q):
+    return f"p{q * 100:g}"
+
+
+def omi_feature_names(
+    image_names,
+    parameters=None,
+    statistics=STATISTICS,
+    quantiles=None,
+    intensity_weighted=True,
+    other_props=None,
+):
+    """
+    Names of the features omi_features returns for a spec, in output order,
+    without loading or computing any image.
+
+    Parameters
+    ----------
+    image_names : iterable
+        names of the available f"{channel}_{product}" images.
+    parameters, statistics, quantiles, intensity_weighted, other_props :
+        see omi_features.
+
+    Returns
+    -------
+    list
+        feature names, starting with mask_label.
+    """
+    parameters, dict_weights = _resolve_spec(image_names, parameters, intensity_weighted)
+    list_quantiles = [] if quantiles is None else list(quantiles)
+    list_names = ["mask_label"]
+    for parameter in parameters:
+        list_names += [f"{parameter}_{stat}" for stat in statistics]
+        if parameter.endswith("_chi"):
+            list_names.append(f"{parameter}_median")
+        list_names += [f"{parameter}_{_quantile_key(q)}" for q in list_quantiles]
+        if parameter in dict_weights:
+            list_names += [
+                f"{parameter}_intensity_weighted_mean",
+                f"{parameter}_intensity_weighted_stdev",
+            ]
+    if other_props is not None:
+        list_names += list(other_props)
+    return list_names
+
+
+class _ParameterImages:
+    """
+    Lazily evaluated parameter images. Raw images are arrays or zero argument
+    callables that load them, derived images are computed from the dependency
+    graph the first time they are requested and kept for reuse, or taken
+    from a DerivedImageCache shared across calls.
+    """
+
+    def __init__(self, images, cache=None):
+        self.images = dict(images)
+        self.graph = derived_parameters(self.images)
+        self.cache = cache
+        self.evaluated = {}
+        self.keys = {}
+
+    def key(self, parameter):
+        """ cache key of a parameter image, derived keys are built from their inputs """
+        if parameter not in self.keys:
+            if parameter in self.images:
+                self.keys[parameter] = self.cache.image_key(self[parameter])
+            else:
+                list_inputs, _ = self.graph[parameter]
+                self.keys[parameter] = (parameter, tuple(self.key(p) for p in list_inputs))
+        return self.keys[parameter]
+
+    def _compute(self, parameter):
+        list_inputs, function = self.graph[parameter]
+        if self.cache is None:
+            return function(*[self[p] for p in list_inputs])
+        key = self.key(parameter)
+        image = self.cache.get(key)
+        if image is None:
+            inputs = [self[p] for p in list_inputs]
+            image = function(*inputs)
+            self.cache.put(key, image, inputs=inputs)
+        return image
+
+    def __getitem__(self, parameter):
+        if parameter not in self.evaluated:
+            if parameter in self.images:
+                image = self.images[parameter]
+                self.evaluated[parameter] = image() if callable(image) else image
+            else:
+                self.evaluated[parameter] = self._compute(parameter)
+        return self.evaluated[parameter]
+
+
+def _omi_feature_columns(
+    label_image,
+    images,
+    parameters,
+    statistics,
+    quantiles,
+    intensity_weighted,
+    other_props,
+    label_index=None,
+    cache=None,
+):
+    """ roi labels and {feature : per roi values} in omi_feature_names order """
+    for stat in statistics:
+        assert stat in STATISTICS, f"Error: statistic {stat} not in {STATISTICS}"
+    parameters, dict_weights = _resolve_spec(images, parameters, intensity_weighted)
+    list_quantiles = [] if quantiles is None else list(quantiles)
+    parameter_images = _ParameterImages(images, cache=cache)
+    # pixels of every label are found once and shared by every statistic
+    label_index = as_label_index(label_image, label_index)
+
+    # EQUALLY WEIGHTED PARAMETERS OF ALL IMAGES IN ONE PASS
+    list_stat_keys = parameters if len(statistics) != 0 else []
+    stats = label_statistics(label_image, [parameter_images[p] for p in list_stat_keys],
+                             label_index=label_index)
+
+    # MEDIANS OF CHI IMAGES AND QUANTILES, values are sorted once
+    list_quantile_keys = [
+        p for p in parameters if p.endswith("_chi") or len(list_quantiles) != 0
+    ]
+    quantile_stats = label_quantiles(
+        label_image,
+        [parameter_images[p] for p in list_quantile_keys],
+        [0.5] + list_quantiles,
+        label_index=label_index,
+    )
+
+    # INTENSITY WEIGHTED PARAMETERS
+    list_weighted_keys = list(dict_weights)
+    weighted_stats = label_weighted_statistics(
+        label_image,
+        [parameter_images[p] for p in list_weighted_keys],
+        [parameter_images[dict_weights[p]] for p in list_weighted_keys],
+        label_index=label_index,
+    )
+
+    labels = stats.labels
+    columns = {}
+    for parameter in parameters:
+        if parameter in list_stat_keys:
+            idx_stat = list_stat_keys.index(parameter)
+            if "mean" in statistics:
+                columns[f"{parameter}_mean"] = stats.mean[idx_stat]
+            if "stdev" in statistics:
+                columns[f"{parameter}_stdev"] = stats.stdev[idx_stat]
+        if parameter in list_quantile_keys:
+            idx_quantile = list_quantile_keys.index(parameter)
+            if parameter.endswith("_chi"):
+                columns[f"{parameter}_median"] = quantile_stats.values[idx_quantile, :, 0]
+            for idx_q, q in enumerate(list_quantiles, start=1):
+                columns[f"{parameter}_{_quantile_key(q)}"] = quantile_stats.values[idx_quantile, :, idx_q]
+        if parameter in dict_weights:
+            idx_weighted = list_weighted_keys.index(parameter)
+            columns[f"{parameter}_intensity_weighted_mean"] = weighted_stats.mean[idx_weighted]
+            columns[f"{parameter}_intensity_weighted_stdev"] = weighted_stats.stdev[idx_weighted]
+
+    # ADD OTHER MASK REGIONPROP VALUES
+    if other_props is not None and len(other_props) != 0:
+        regions = regionprops(label_image)
+        for prop in other_props:
+            columns[prop] = [region[prop] for region in regions]
+
+    return labels, columns
+
+
+def omi_features(
+    image_id,
+    label_image,
+    images,
+    parameters=None,
+    statistics=STATISTICS,
+    quantiles=None,
+    intensity_weighted=True,
+    other_props=None,
+    label_index=None,
+    cache=None,
+):
+    """
+    Computes per roi features of OMI parameter images from a declarative
+    spec. Images are given per channel (nadh, fad, stain or any other dye)
+    and product (intensity, a1, a2, t1, t2, chi). Derived parameters
+    (tau_mean of every channel, redox_ratio, redox_ratio_norm, flirr) are
+    only computed if a requested feature needs them, and raw images passed
+    as callables are only loaded when needed.
+
+    Parameters
+    ----------
+    image_id : str
+        base name of the image, rois are keyed f"{image_id}_{label}".
+    label_image : ndarray
+        labeled mask image.
+    images : dict
+        {f"{channel}_{product}" : ndarray or callable returning an ndarray},
+        e.g. {"nadh_intensity": im, "nadh_t1": lambda: load_image(path)}.
+    parameters : list, optional
+        parameters to compute features for, raw or derived. The default is
+        every parameter available from images, see omi_parameters.
+    statistics : list, optional
+        equally weighted statistics, any of "mean" and "stdev".
+        The default is ["mean", "stdev"].
+    quantiles : list, optional
+        quantiles in [0, 1] to add as {parameter}_p10 ... keys.
+        The default is None.
+    intensity_weighted : bool or list, optional
+        add intensity weighted mean and stdev of lifetime parameters
+        (a1, a2, t1, t2, tau_mean), weighted by the intensity of the same
+        channel. True for every lifetime parameter or a list of parameters.
+        The default is True.
+    other_props : list, optional
+        string list of additional regionprops attributes to compute on the
+        binary mask. The default is None.
+    label_index : LabelIndex, optional
+        precomputed index of label_image, e.g. shared with other analyses
+        of the same mask. The default is None.
+    cache : DerivedImageCache, optional
+        cache of derived images shared across calls, e.g. the whole cell,
+        cytoplasm and nuclei masks of the same images. The default is None.
+
+    Returns
+    -------
+    dict
+        {f"{image_id}_{label}" : {feature : value}} with features in the order
+        given by omi_feature_names. chi parameters also get a _median.
+        See omi_feature_table for the same features as columns.
+
+    .. code-block:: python
+
+        images = {"nadh_intensity": im_nadh_intensity, "nadh_a1": im_nadh_a1,
+                  "nadh_a2": im_nadh_a2, "nadh_t1": im_nadh_t1, "nadh_t2": im_nadh_t2}
+        dict_omi = omi_features("image_1", label_image, images,
+                                parameters=["nadh_tau_mean"], statistics=["mean"])
+
+    """
+    labels, columns = _omi_feature_columns(
+        np.asarray(label_image), images, parameters, statistics,
+        quantiles, intensity_weighted, other_props, label_index, cache,
+    )
+    dict_omi = {}
+    for idx_label, label in enumerate(labels):
+        dict_roi = {"mask_label": int(label)}
+        for feature, values in columns.items():
+            dict_roi[feature] = values[idx_label]
+        dict_omi[f"{image_id}_{label}"] = dict_roi
+    return dict_omi
+
+
+def omi_feature_table(
+    image_id,
+    label_image,
+    images,
+    parameters=None,
+    statistics=STATISTICS,
+    quantiles=None,
+    intensity_weighted=True,
+    other_props=None,
+    label_index=None,
+    cache=None,
+):
+    """
+    Same features as omi_features as a columnar FeatureTable, one contiguous
+    float64 array per feature plus image_id and mask_label columns. Tables of
+    many images can be stacked with a FeatureTableAccumulator and converted
+    to pandas or Arrow without copying.
+
+    Parameters
+    ----------
+    image_id : str
+        base name of the image, stored in the image_id column.
+    label_image, images, parameters, statistics, quantiles :
+        see omi_features.
+    intensity_weighted, other_props, label_index, cache :
+        see omi_features.
+
+    Returns
+    -------
+    FeatureTable
+        columns image_id, mask_label and the features of omi_feature_names.
+
+    .. code-block:: python
+
+        table = omi_feature_table("image_1", label_image, images)
+        df = table.to_pandas(index_name="base_name")
+
+    """
+    labels, columns = _omi_feature_columns(
+        np.asarray(label_image), images, parameters, statistics,
+        quantiles, intensity_weighted, other_props, label_index, cache,
+    )
+    image_ids = np.empty(len(labels), dtype=object)
+    image_ids[:] = image_id
+    return FeatureTable({
+        "image_id": image_ids,
+        "mask_label": labels.astype(np.int64),
+        **columns,
+    })
+
+
+if __name__ == "__main__":
+
+    from pprint import pprint
+
+    from cell_analysis_tools.flim.simulate import (simulate_label_image,
+                                                   simulate_omi_images)
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    images = {
+        key.replace("im_", "", 1): im
+        for key, im in simulate_omi_images(label_image).items()
+    }
+    print(omi_feature_names(images, parameters=["redox_ratio", "fad_tau_mean"]))
+    dict_omi = omi_features("simulated", label_image, images,
+                            parameters=["redox_ratio", "fad_tau_mean"])
+    pprint(dict_omi["simulated_1"])
+    print(omi_feature_table("simulated", label_image, images).to_pandas().head())
@@ -20,6 +20,7 @@ from cell_analysis_tools.io import load_sdt_file
 
 import numpy as np
 from cell_analysis_tools.flim import draw_universal_semicircle
+from cell_analysis_tools.flim._phasor_basis import phasor_basis
 
 
 def phasor_calculator(f, time, decays, IRF):
@@ -67,14 +68,13 @@ def phasor_calculator(f, time, decays, IRF):
     w = 2*np.pi*f
     
     # row=pixels, cols=photons
-    decays = np.reshape(decays,(-1,256))
+    decays = np.reshape(decays,(-1,len(time)))
     
-    
-    dim_time = len(decays.shape) -1
-    G_decay = np.dot(decays, np.cos(w*time))/np.sum(decays, axis=dim_time)
-    S_decay = np.dot(decays, np.sin(w*time))/np.sum(decays, axis=dim_time)
-    G_IRF = np.dot(IRF,np.cos(w*time))/np.sum(IRF)
-    S_IRF = np.dot(IRF, np.sin(w*time))/np.sum(IRF)
+    # cached [cos(wt), sin(wt)] columns
+    basis = phasor_basis(time, f)
+    photons = np.sum(decays, axis=1)
+    G_decay, S_decay = (np.dot(decays, basis)/photons[:,np.newaxis]).T
+    G_IRF, S_IRF = np.dot(IRF, basis)/np.sum(IRF)
     GS = np.dot(np.array([[G_IRF, S_IRF], [-S_IRF, G_IRF]]), np.array([G_decay, S_decay]))/(G_IRF**2 + S_IRF**2)
     
     g = GS[0,:]
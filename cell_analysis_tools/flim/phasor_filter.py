@@ -0,0 +1,419 @@
+import collections as coll
+from functools import lru_cache
+
+import matplotlib.pylab as plt
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+PhasorImages = coll.namedtuple("PhasorImages", "g s")
+
+
+@lru_cache(maxsize=8)
+def _window_index(shape, size):
+    """
+    Flat pixel indices of the size x size neighbourhood of every pixel.
+    Positions falling outside the image are set to -1. The index only depends
+    on the image shape and window size so it is cached and shared between the
+    g and s images, every repeat and every image of a stack.
+
+    Parameters
+    ----------
+    shape : tuple
+        (rows, cols) of the phasor images.
+    size : int
+        odd window length.
+
+    Returns
+    -------
+    index : ndarray
+        (rows*cols, size*size) array of flat pixel indices.
+    """
+    assert size % 2 == 1, "Error: window size must be odd."
+    rows, cols = shape
+    radius = size // 2
+    flat_index = np.arange(rows * cols, dtype=np.intp).reshape(rows, cols)
+    padded = np.pad(flat_index, radius, mode="constant", constant_values=-1)
+    windows = sliding_window_view(padded, (size, size))
+    index = np.ascontiguousarray(windows.reshape(rows * cols, size * size))
+    index.setflags(write=False)
+    return index
+
+
+def _valid_pixels(g, s, mask):
+    """ Boolean array of pixels with finite g and s that are inside the mask """
+    valid = np.isfinite(g) & np.isfinite(s)
+    if mask is not None:
+        valid &= np.broadcast_to(np.asarray(mask, dtype=bool), g.shape)
+    return valid
+
+
+def _as_stack(image):
+    """ Returns a float (n, rows, cols) view of a 2d image or image stack """
+    image = np.asarray(image)
+    dtype = np.result_type(image.dtype, np.float32)
+    image = image.astype(dtype, copy=False)
+    if image.ndim == 2:
+        return image[np.newaxis]
+    assert image.ndim == 3, "Error: expected (rows, cols) or (n, rows, cols) images."
+    return image
+
+
+def _gather_windows(values, index):
+    """
+    Gathers the windows of one or more flattened images. A NaN sentinel is
+    appended so positions outside the image (index -1) read as NaN.
+
+    values : (k, n_pixels) array -> returns (k, n_pixels, window_length)
+    """
+    padded = np.concatenate(
+        [values, np.full((values.shape[0], 1), np.nan, dtype=values.dtype)], axis=1
+    )
+    return padded[:, index]
+
+
+def _median_positions(valid, index):
+    """
+    Positions of the lower and upper middle values of every sorted window.
+    Masked pixels do not change between repeats so the number of valid values
+    per window, and therefore these positions, are computed once.
+    """
+    valid_padded = np.append(valid, False)
+    n_valid = valid_padded[index].sum(axis=-1)
+    lower = np.clip((n_valid - 1) // 2, 0, None)
+    upper = np.clip(n_valid // 2, 0, None)
+    return lower, upper
+
+
+def phasor_median_filter(g, s, size=3, repeats=3, mask=None, debug=False):
+    """
+    Repeated median filtering of g and s phasor images. Masked pixels and
+    pixels with NaN g/s values are excluded from every window and remain NaN
+    in the output, so the same mask is applied before and after filtering.
+
+    Parameters
+    ----------
+    g : ndarray
+        g image (rows, cols) or stack of g images (n, rows, cols).
+    s : ndarray
+        s image(s), same shape as g.
+    size : int, optional
+        odd length of the square median window. The default is 3.
+    repeats : int, optional
+        number of times the median filter is applied. The default is 3.
+    mask : ndarray, optional
+        boolean mask of pixels to keep (rows, cols) or same shape as g.
+        The default is None.
+    debug : bool, optional
+        Show the original and filtered phasor images. The default is False.
+
+    Returns
+    -------
+    g : ndarray
+        filtered g image(s).
+    s : ndarray
+        filtered s image(s).
+
+    Note
+    ----
+        The window indices are computed once per image shape and reused for
+        g and s, every repeat and every image of a stack.
+    """
+    ndim = np.ndim(g)
+    g_stack, s_stack = _as_stack(g), _as_stack(s)
+    assert g_stack.shape == s_stack.shape, "Error: g and s must have the same shape."
+    n_images, rows, cols = g_stack.shape
+    index = _window_index((rows, cols), size)
+
+    g_filtered = np.empty_like(g_stack)
+    s_filtered = np.empty_like(s_stack)
+    for idx in range(n_images):
+        valid = _valid_pixels(
+            g_stack[idx], s_stack[idx], None if mask is None else _mask_at(mask, idx, ndim)
+        ).ravel()
+        values = np.stack([g_stack[idx].ravel(), s_stack[idx].ravel()])
+        values[:, ~valid] = np.nan
+        lower, upper = _median_positions(valid, index)
+        pixels = np.arange(index.shape[0])
+
+        for _ in range(repeats):
+            # NaNs (masked pixels and outside the image) are sorted to the end
+            windows = _gather_windows(values, index)
+            windows.sort(axis=-1)
+            values = (windows[:, pixels, lower] + windows[:, pixels, upper]) / 2
+            values[:, ~valid] = np.nan
+
+        g_filtered[idx] = values[0].reshape(rows, cols)
+        s_filtered[idx] = values[1].reshape(rows, cols)
+
+    if ndim == 2:
+        g_filtered, s_filtered = g_filtered[0], s_filtered[0]
+
+    if debug:
+        _show_filtered(g, s, g_filtered, s_filtered, f"median {size}x{size} x{repeats}")
+
+    return PhasorImages(g=g_filtered, s=s_filtered)
+
+
+def phasor_intensity_weighted_filter(
+    g, s, intensity, size=3, repeats=1, mask=None, debug=False
+):
+    """
+    Intensity weighted mean filtering of g and s phasor images. Each output
+    pixel is the phasor of the summed decays in its window, i.e. the
+    neighbouring g and s values weighted by their photon counts.
+
+    Parameters
+    ----------
+    g : ndarray
+        g image (rows, cols) or stack of g images (n, rows, cols).
+    s : ndarray
+        s image(s), same shape as g.
+    intensity : ndarray
+        photon count image(s) used as weights, same shape as g.
+    size : int, optional
+        odd length of the square window. The default is 3.
+    repeats : int, optional
+        number of times the filter is applied. The default is 1.
+    mask : ndarray, optional
+        boolean mask of pixels to keep. The default is None.
+    debug : bool, optional
+        Show the original and filtered phasor images. The default is False.
+
+    Returns
+    -------
+    g : ndarray
+        filtered g image(s).
+    s : ndarray
+        filtered s image(s).
+    """
+    ndim = np.ndim(g)
+    g_stack, s_stack = _as_stack(g), _as_stack(s)
+    intensity_stack = _as_stack(intensity)
+    assert g_stack.shape == s_stack.shape == intensity_stack.shape, (
+        "Error: g, s and intensity must have the same shape."
+    )
+    n_images, rows, cols = g_stack.shape
+    index = _window_index((rows, cols), size)
+
+    g_filtered = np.empty_like(g_stack)
+    s_filtered = np.empty_like(s_stack)
+    for idx in range(n_images):
+        valid = _valid_pixels(
+            g_stack[idx], s_stack[idx], None if mask is None else _mask_at(mask, idx, ndim)
+        ).ravel()
+        weights = np.where(valid, intensity_stack[idx].ravel(), 0)
+        g_values = np.where(valid, g_stack[idx].ravel(), 0)
+        s_values = np.where(valid, s_stack[idx].ravel(), 0)
+
+        for _ in range(repeats):
+            windows = _gather_windows(
+                np.stack([weights * g_values, weights * s_values, weights]), index
+            )
+            sums = np.nansum(windows, axis=-1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                g_values = sums[0] / sums[2]
+                s_values = sums[1] / sums[2]
+            g_values[~valid] = 0
+            s_values[~valid] = 0
+
+        g_values[~valid] = np.nan
+        s_values[~valid] = np.nan
+        g_filtered[idx] = g_values.reshape(rows, cols)
+        s_filtered[idx] = s_values.reshape(rows, cols)
+
+    if ndim == 2:
+        g_filtered, s_filtered = g_filtered[0], s_filtered[0]
+
+    if debug:
+        _show_filtered(g, s, g_filtered, s_filtered, f"intensity weighted {size}x{size}")
+
+    return PhasorImages(g=g_filtered, s=s_filtered)
+
+
+def _haar_2d(image):
+    """ One level orthonormal 2d haar transform of (..., 2m, 2n) arrays """
+    lo = (image[..., 0::2, :] + image[..., 1::2, :]) / np.sqrt(2)
+    hi = (image[..., 0::2, :] - image[..., 1::2, :]) / np.sqrt(2)
+    ll = (lo[..., 0::2] + lo[..., 1::2]) / np.sqrt(2)
+    lh = (lo[..., 0::2] - lo[..., 1::2]) / np.sqrt(2)
+    hl = (hi[..., 0::2] + hi[..., 1::2]) / np.sqrt(2)
+    hh = (hi[..., 0::2] - hi[..., 1::2]) / np.sqrt(2)
+    return ll, (lh, hl, hh)
+
+
+def _inverse_haar_2d(ll, details):
+    """ Inverse of _haar_2d """
+    lh, hl, hh = details
+    lo = np.empty(ll.shape[:-1] + (ll.shape[-1] * 2,), dtype=ll.dtype)
+    hi = np.empty_like(lo)
+    lo[..., 0::2] = (ll + lh) / np.sqrt(2)
+    lo[..., 1::2] = (ll - lh) / np.sqrt(2)
+    hi[..., 0::2] = (hl + hh) / np.sqrt(2)
+    hi[..., 1::2] = (hl - hh) / np.sqrt(2)
+    image = np.empty(lo.shape[:-2] + (lo.shape[-2] * 2, lo.shape[-1]), dtype=ll.dtype)
+    image[..., 0::2, :] = (lo + hi) / np.sqrt(2)
+    image[..., 1::2, :] = (lo - hi) / np.sqrt(2)
+    return image
+
+
+def _haar_denoise(image, levels, threshold_scale):
+    """
+    Soft thresholds the detail coefficients of a multi level haar transform.
+    The noise level is estimated from the finest diagonal coefficients
+    (median absolute deviation) and the universal threshold is used.
+    """
+    rows, cols = image.shape[-2:]
+    block = 2 ** levels
+    pad_rows = (-rows) % block
+    pad_cols = (-cols) % block
+    image = np.pad(image, ((0, 0), (0, pad_rows), (0, pad_cols)), mode="reflect")
+
+    ll = image
+    list_details = []
+    for _ in range(levels):
+        ll, details = _haar_2d(ll)
+        list_details.append(details)
+
+    # per image noise estimate from finest diagonal details
+    hh_finest = list_details[0][2]
+    sigma = np.median(np.abs(hh_finest), axis=(-2, -1)) / 0.6745
+    threshold = (
+        threshold_scale * sigma * np.sqrt(2 * np.log(rows * cols))
+    )[:, np.newaxis, np.newaxis]
+
+    for details in reversed(list_details):
+        details = tuple(
+            np.sign(d) * np.clip(np.abs(d) - threshold, 0, None) for d in details
+        )
+        ll = _inverse_haar_2d(ll, details)
+
+    return ll[..., :rows, :cols]
+
+
+def phasor_wavelet_filter(
+    g, s, intensity=None, levels=2, threshold_scale=1.0, mask=None, debug=False
+):
+    """
+    Haar wavelet denoising of g and s phasor images. The intensity weighted
+    phasor components (intensity*g, intensity*s) and the intensity are
+    denoised separately and recombined so that bright pixels dominate the
+    smoothing, as in phasor wavelet filtering.
+
+    Parameters
+    ----------
+    g : ndarray
+        g image (rows, cols) or stack of g images (n, rows, cols).
+    s : ndarray
+        s image(s), same shape as g.
+    intensity : ndarray, optional
+        photon count image(s). If None all pixels are weighted equally.
+        The default is None.
+    levels : int, optional
+        number of wavelet decomposition levels. The default is 2.
+    threshold_scale : float, optional
+        multiplier for the universal soft threshold, larger values remove
+        more noise. The default is 1.0.
+    mask : ndarray, optional
+        boolean mask of pixels to keep. The default is None.
+    debug : bool, optional
+        Show the original and filtered phasor images. The default is False.
+
+    Returns
+    -------
+    g : ndarray
+        filtered g image(s).
+    s : ndarray
+        filtered s image(s).
+    """
+    ndim = np.ndim(g)
+    g_stack, s_stack = _as_stack(g), _as_stack(s)
+    if intensity is None:
+        intensity_stack = np.ones_like(g_stack)
+    else:
+        intensity_stack = _as_stack(intensity)
+    assert g_stack.shape == s_stack.shape == intensity_stack.shape, (
+        "Error: g, s and intensity must have the same shape."
+    )
+
+    if mask is None:
+        valid = np.isfinite(g_stack) & np.isfinite(s_stack)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+        mask = mask if mask.ndim == 3 else mask[np.newaxis]
+        valid = np.isfinite(g_stack) & np.isfinite(s_stack) & mask
+
+    weights = np.where(valid, intensity_stack, 0)
+    # denoise intensity weighted g, s and the intensity in one transform
+    n_images = g_stack.shape[0]
+    components = np.concatenate(
+        [
+            weights * np.where(valid, g_stack, 0),
+            weights * np.where(valid, s_stack, 0),
+            weights,
+        ]
+    )
+    components = _haar_denoise(components, levels, threshold_scale)
+    weighted_g = components[:n_images]
+    weighted_s = components[n_images : 2 * n_images]
+    weights = components[2 * n_images :]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g_filtered = weighted_g / weights
+        s_filtered = weighted_s / weights
+    invalid = ~valid | (weights <= 0)
+    g_filtered[invalid] = np.nan
+    s_filtered[invalid] = np.nan
+
+    if ndim == 2:
+        g_filtered, s_filtered = g_filtered[0], s_filtered[0]
+
+    if debug:
+        _show_filtered(g, s, g_filtered, s_filtered, f"haar wavelet, {levels} levels")
+
+    return PhasorImages(g=g_filtered, s=s_filtered)
+
+
+def _mask_at(mask, idx, ndim):
+    """ Selects the mask of image idx when a stack of masks is passed """
+    mask = np.asarray(mask, dtype=bool)
+    if ndim == 3 and mask.ndim == 3:
+        return mask[idx]
+    return mask
+
+
+def _show_filtered(g, s, g_filtered, s_filtered, title):
+    """ Displays original and filtered g/s images, first image of a stack """
+    if np.ndim(g) == 3:
+        g, s, g_filtered, s_filtered = g[0], s[0], g_filtered[0], s_filtered[0]
+    fig, ax = plt.subplots(2, 2, figsize=(6, 6))
+    fig.suptitle(title)
+    for axis, im, im_title in zip(
+        ax.ravel(),
+        [g, s, g_filtered, s_filtered],
+        ["g", "s", "g filtered", "s filtered"],
+    ):
+        axis.imshow(im)
+        axis.set_title(im_title)
+        axis.set_axis_off()
+    plt.show()
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    rng = np.random.default_rng(seed=0)
+    # two lifetimes, noisy phasors
+    g = np.full((256, 256), 0.7)
+    s = np.full((256, 256), 0.4)
+    g[:, 128:] = 0.4
+    s[:, 128:] = 0.45
+    g = g + rng.normal(0, 0.1, g.shape)
+    s = s + rng.normal(0, 0.1, s.shape)
+    mask = np.ones(g.shape, dtype=bool)
+    mask[100:150, 100:150] = False
+
+    g_median, s_median = phasor_median_filter(g, s, mask=mask, debug=True)
+    g_wavelet, s_wavelet = phasor_wavelet_filter(g, s, mask=mask, debug=True)
@@ -0,0 +1,142 @@
+import matplotlib.pylab as plt
+import numpy as np
+import pandas as pd
+
+from cell_analysis_tools.flim._phasor_basis import calibrate_phasor, phasor_basis
+from cell_analysis_tools.flim.aggregate_roi_decays import aggregate_roi_decays
+from cell_analysis_tools.flim.draw_universal_semicircle import draw_universal_semicircle
+from cell_analysis_tools.flim.estimate_and_shift_irf import estimate_and_shift_irf
+
+
+def _harmonic_suffix(harmonic):
+    return "" if harmonic == 1 else f"_h{harmonic}"
+
+
+def roi_phasor_table(
+    label_image,
+    cube,
+    irf,
+    f,
+    timebins=None,
+    harmonics=(1,),
+    shift_irf=False,
+    image_id=None,
+    debug=False,
+):
+    """
+    Computes IRF calibrated phasors, phase and modulation lifetimes and
+    photon counts for every roi of a label image. Decays are summed per roi
+    and projected onto the phasor basis with a single matrix product.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        2d array of labeled rois, 0 is background.
+    cube : ndarray or iterable
+        3d array of photons (x, y, t) or (row_start, block) chunks from
+        cell_analysis_tools.io.iter_sdt_rows.
+    irf : ndarray
+        1D array capturing the irf decay.
+    f : float
+        laser repetition rate, in units of 1/timebins.
+    timebins : ndarray, optional
+        1D array of timebins. The default spans one laser period, 1/f.
+    harmonics : tuple, optional
+        harmonics of f to compute. The default is (1,).
+    shift_irf : bool, optional
+        Align the IRF to the summed decay of all rois with
+        estimate_and_shift_irf before calibrating. The default is False.
+    image_id : str, optional
+        if given rows are indexed by f"{image_id}_{label}" like
+        regionprops_omi. The default is None.
+    debug : bool, optional
+        Show the roi phasors on the universal semicircle. The default is False.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        one row per roi with columns mask_label, photons, g, s, tau_phi, tau_m
+        and g_h{n}, s_h{n}, tau_phi_h{n}, tau_m_h{n} for every other harmonic,
+        plus irf_shift when shift_irf is True.
+
+    Note
+    ----
+        Lifetimes are in units of timebins. tau_phi = s / (h w g) and
+        tau_m = sqrt(1 / m^2 - 1) / (h w) for harmonic h. Rois without
+        photons get nan phasors.
+
+    .. code-block:: python
+
+        df = roi_phasor_table(label_image, sdt_cube, irf, f=80e6, timebins=timebins,
+                              harmonics=(1, 2))
+
+    """
+    decays, list_labels = aggregate_roi_decays(label_image, cube)
+    n_timebins = decays.shape[1]
+    if timebins is None:
+        timebins = np.linspace(0, 1 / f, n_timebins, endpoint=False)
+    timebins = np.asarray(timebins, dtype=float)
+    assert len(timebins) == n_timebins, "Error: timebins must have one value per timebin"
+
+    irf = np.asarray(irf, dtype=float)
+    irf_shift = None
+    if shift_irf:
+        irf, irf_shift = estimate_and_shift_irf(decays.sum(axis=0), irf)
+
+    harmonics = tuple(harmonics)
+    n_harmonics = len(harmonics)
+    basis = phasor_basis(timebins, f, harmonics)
+
+    photons = decays.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gs_decay = (decays @ basis) / photons[:, np.newaxis]
+    gs_irf = (irf @ basis) / irf.sum()
+
+    dict_table = {"mask_label": list_labels, "photons": photons}
+    for idx, harmonic in enumerate(harmonics):
+        g, s = calibrate_phasor(gs_decay[:, idx], gs_decay[:, n_harmonics + idx],
+                                gs_irf[idx], gs_irf[n_harmonics + idx])
+
+        w = 2 * np.pi * f * harmonic
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tau_phi = s / (w * g)
+            tau_m = np.sqrt(1 / (g ** 2 + s ** 2) - 1) / w
+
+        suffix = _harmonic_suffix(harmonic)
+        dict_table[f"g{suffix}"] = g
+        dict_table[f"s{suffix}"] = s
+        dict_table[f"tau_phi{suffix}"] = tau_phi
+        dict_table[f"tau_m{suffix}"] = tau_m
+
+    if shift_irf:
+        dict_table["irf_shift"] = np.full(len(list_labels), irf_shift)
+
+    df = pd.DataFrame(dict_table)
+    if image_id is not None:
+        df.index = [f"{image_id}_{label}" for label in list_labels]
+
+    if debug:
+        draw_universal_semicircle(laser_angular_frequency=f,
+                                  title=f"{len(df)} rois",
+                                  suptitle="roi phasors")
+        plt.scatter(df["g"], df["s"], s=3)
+        plt.show()
+
+    return df
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    from cell_analysis_tools.flim.simulate import (simulate_flim_image,
+                                                   simulate_label_image)
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    lifetimes = np.linspace(0.5e-9, 4e-9, 30)[:, np.newaxis]
+    sim = simulate_flim_image(label_image, lifetimes=lifetimes, photons=500)
+    df = roi_phasor_table(label_image, sim.cube, sim.irf, f=80e6,
+                          timebins=sim.timebins, harmonics=(1, 2), debug=True)
+    print(df.head())
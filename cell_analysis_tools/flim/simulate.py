@@ -0,0 +1,296 @@
+import collections as coll
+
+import matplotlib.pylab as plt
+import numpy as np
+from skimage.draw import disk
+
+SimulatedFLIM = coll.namedtuple("SimulatedFLIM", "cube timebins irf label_image")
+
+
+def simulate_label_image(shape=(256, 256), n_rois=20, radius=(6, 12), seed=0):
+    """
+    Generates a labeled mask of randomly placed disk shaped rois.
+
+    Parameters
+    ----------
+    shape : tuple, optional
+        (rows, cols) of the label image. The default is (256, 256).
+    n_rois : int, optional
+        number of rois to place. The default is 20.
+    radius : tuple, optional
+        (min, max) radius of the disks in pixels. The default is (6, 12).
+    seed : int, optional
+        seed for the random number generator. The default is 0.
+
+    Returns
+    -------
+    label_image : ndarray
+        labels image, 0 is background and rois are labeled 1..n_rois.
+        Later rois are drawn over earlier ones where they overlap so
+        some labels can be partially covered.
+    """
+    rng = np.random.default_rng(seed=seed)
+    label_image = np.zeros(shape, dtype=np.uint16)
+    radii = rng.integers(radius[0], radius[1] + 1, size=n_rois)
+    centers_row = rng.integers(0, shape[0], size=n_rois)
+    centers_col = rng.integers(0, shape[1], size=n_rois)
+    for label_value, (row, col, r) in enumerate(
+        zip(centers_row, centers_col, radii), start=1
+    ):
+        rr, cc = disk((row, col), r, shape=shape)
+        label_image[rr, cc] = label_value
+    return label_image
+
+
+def gaussian_irf(timebins, center, fwhm):
+    """
+    Gaussian instrument response function normalized to sum to 1.
+
+    Parameters
+    ----------
+    timebins : ndarray
+        1D array of timebins.
+    center : float
+        time of the IRF peak, same units as timebins.
+    fwhm : float
+        full width at half maximum, same units as timebins.
+
+    Returns
+    -------
+    irf : ndarray
+        1D array with the IRF.
+    """
+    sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    irf = np.exp(-0.5 * ((timebins - center) / sigma) ** 2)
+    return irf / irf.sum()
+
+
+def _per_label(values, n_labels, name):
+    """ Broadcasts values to one row per label (n_labels, n_components) """
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    if values.ndim == 1:
+        values = np.broadcast_to(values, (n_labels, values.shape[0]))
+    assert values.shape[0] == n_labels, (
+        f"Error: {name} must have one row per label ({n_labels}), got {values.shape[0]}"
+    )
+    return values
+
+
+def simulate_flim_image(
+    label_image,
+    lifetimes,
+    amplitudes=None,
+    photons=1000,
+    n_timebins=256,
+    laser_frequency=80e6,
+    irf=None,
+    irf_center=0.5e-9,
+    irf_fwhm=0.2e-9,
+    background=0,
+    seed=0,
+    debug=False,
+):
+    """
+    Generates a photon cube (x, y, t) with multi-exponential decays per region.
+    Every label gets its own decay, convolved with the IRF and scaled by the
+    expected photon count of each pixel. Background photons are spread
+    uniformly across timebins and Poisson noise is applied to every bin.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        2d labeled mask, 0 is background and only receives background photons.
+    lifetimes : array-like
+        lifetimes of each exponential component in seconds. Either
+        (n_components,) used for every label or (n_labels, n_components)
+        with one row per label in increasing label value.
+    amplitudes : array-like, optional
+        relative amplitudes of each component, same layout as lifetimes. They
+        are normalized to sum to 1. The default is equal amplitudes.
+    photons : float or ndarray, optional
+        expected photons per roi pixel, a scalar, one value per label or a
+        2d image. The default is 1000.
+    n_timebins : int, optional
+        number of timebins. The default is 256.
+    laser_frequency : float, optional
+        laser repetition rate in Hz, sets the timebin range. The default is 80e6.
+    irf : ndarray, optional
+        1D IRF of length n_timebins. The default is a gaussian IRF.
+    irf_center : float, optional
+        peak of the default gaussian IRF in seconds. The default is 0.5e-9.
+    irf_fwhm : float, optional
+        fwhm of the default gaussian IRF in seconds. The default is 0.2e-9.
+    background : float, optional
+        expected background photons per pixel. The default is 0.
+    seed : int, optional
+        seed for the random number generator. The default is 0.
+    debug : bool, optional
+        Show the intensity image and decays. The default is False.
+
+    Returns
+    -------
+    cube : ndarray
+        float32 array of photon counts (x, y, t).
+    timebins : ndarray
+        1D array of timebins in seconds.
+    irf : ndarray
+        1D IRF used in the simulation, normalized to sum to 1.
+    label_image : ndarray
+        the input label image.
+
+    Note
+    ----
+        Decays are periodic with the laser repetition rate, they include the
+        tails of previous pulses and are convolved circularly with the IRF.
+
+    .. code-block:: python
+
+        label_image = simulate_label_image((256, 256), n_rois=30)
+        sim = simulate_flim_image(label_image, lifetimes=[0.4e-9, 2.5e-9],
+                                  amplitudes=[0.7, 0.3], photons=500)
+        sim.cube.shape  # (256, 256, 256)
+
+    """
+    rng = np.random.default_rng(seed=seed)
+    label_image = np.asarray(label_image)
+    list_labels = np.unique(label_image)
+    list_labels = list_labels[list_labels != 0]
+    n_labels = len(list_labels)
+
+    period = 1 / laser_frequency
+    timebins = np.linspace(0, period, n_timebins, endpoint=False)
+
+    if irf is None:
+        irf = gaussian_irf(timebins, irf_center, irf_fwhm)
+    else:
+        irf = np.asarray(irf, dtype=float)
+        assert len(irf) == n_timebins, "Error: irf must have n_timebins values."
+        irf = irf / irf.sum()
+
+    lifetimes = _per_label(lifetimes, n_labels, "lifetimes")
+    if amplitudes is None:
+        amplitudes = np.ones_like(lifetimes)
+    amplitudes = _per_label(amplitudes, n_labels, "amplitudes")
+    amplitudes = amplitudes / amplitudes.sum(axis=1, keepdims=True)
+
+    # periodic decays (n_labels, t), including tails of previous pulses
+    tau = lifetimes[..., np.newaxis]
+    decays = np.sum(
+        amplitudes[..., np.newaxis]
+        * np.exp(-timebins / tau)
+        / (1 - np.exp(-period / tau)),
+        axis=1,
+    )
+    # circular convolution with the IRF, normalized to one photon
+    decays = np.real(np.fft.ifft(np.fft.fft(decays, axis=1) * np.fft.fft(irf), axis=1))
+    decays = np.clip(decays, 0, None)
+    decays /= decays.sum(axis=1, keepdims=True)
+
+    # row 0 of the templates is background, no decay
+    templates = np.zeros((n_labels + 1, n_timebins), dtype=np.float32)
+    templates[1:] = decays
+    label_idx = np.searchsorted(list_labels, label_image)
+    label_idx = np.where(label_image == 0, 0, label_idx + 1)
+
+    # expected photons per pixel
+    photons = np.asarray(photons, dtype=float)
+    if photons.ndim == 0:
+        im_photons = np.where(label_idx > 0, photons, 0)
+    elif photons.ndim == 1:
+        assert len(photons) == n_labels, "Error: photons must have one value per label."
+        im_photons = np.concatenate([[0], photons])[label_idx]
+    else:
+        im_photons = np.where(label_idx > 0, photons, 0)
+
+    expected = im_photons.astype(np.float32)[..., np.newaxis] * templates[label_idx]
+    if background:
+        expected += np.float32(background / n_timebins)
+    cube = rng.poisson(expected).astype(np.float32)
+
+    if debug:
+        fig, ax = plt.subplots(1, 2, figsize=(8, 4))
+        fig.suptitle("simulated flim image")
+        ax[0].imshow(cube.sum(axis=2))
+        ax[0].set_axis_off()
+        ax[1].plot(timebins * 1e9, decays.T)
+        ax[1].set_xlabel("Time (ns)")
+        plt.show()
+
+    return SimulatedFLIM(cube=cube, timebins=timebins, irf=irf, label_image=label_image)
+
+
+def simulate_omi_images(label_image, noise=0.1, seed=0):
+    """
+    Generates a set of SPCImage like parameter images (photons, a1[%], a2[%],
+    t1, t2, chi) for the NADH and FAD channels. Every roi gets random mean
+    values which are perturbed per pixel by multiplicative gaussian noise.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        2d labeled mask.
+    noise : float, optional
+        relative standard deviation of the per pixel noise. The default is 0.1.
+    seed : int, optional
+        seed for the random number generator. The default is 0.
+
+    Returns
+    -------
+    dict
+        parameter images keyed by regionprops_omi argument names
+        (im_nadh_intensity, im_nadh_a1, ... im_fad_chi) so it can be
+        passed as ``regionprops_omi(image_id, label_image, **images)``.
+    """
+    rng = np.random.default_rng(seed=seed)
+    label_image = np.asarray(label_image)
+    n_values = int(label_image.max()) + 1
+
+    # (low, high) of per roi means, a1/a2 are percents and lifetimes in ps
+    ranges = {
+        "nadh_intensity": (200, 2000),
+        "nadh_a1": (60, 85),
+        "nadh_t1": (300, 600),
+        "nadh_t2": (2000, 3500),
+        "nadh_chi": (0.8, 1.5),
+        "fad_intensity": (100, 1500),
+        "fad_a1": (55, 80),
+        "fad_t1": (200, 500),
+        "fad_t2": (1800, 3000),
+        "fad_chi": (0.8, 1.5),
+    }
+
+    dict_images = {}
+    for name, (low, high) in ranges.items():
+        roi_means = rng.uniform(low, high, size=n_values)
+        pixel_noise = 1 + noise * rng.standard_normal(label_image.shape)
+        dict_images[name] = np.clip(roi_means[label_image] * pixel_noise, 0, None)
+
+    # a2 is the complement of a1 like SPCImage outputs
+    for channel in ["nadh", "fad"]:
+        dict_images[f"{channel}_a1"] = np.clip(dict_images[f"{channel}_a1"], 0, 100)
+        dict_images[f"{channel}_a2"] = 100 - dict_images[f"{channel}_a1"]
+
+    order = [
+        "nadh_intensity", "nadh_a1", "nadh_a2", "nadh_t1", "nadh_t2",
+        "fad_intensity", "fad_a1", "fad_a2", "fad_t1", "fad_t2",
+        "nadh_chi", "fad_chi",
+    ]
+    return {f"im_{name}": dict_images[name] for name in order}
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    sim = simulate_flim_image(
+        label_image,
+        lifetimes=[0.4e-9, 2.5e-9],
+        amplitudes=[0.7, 0.3],
+        photons=500,
+        background=20,
+        debug=True,
+    )
+    print(sim.cube.shape, sim.cube.sum())
@@ -0,0 +1,250 @@
+import collections as coll
+from pathlib import Path
+
+import matplotlib.pylab as plt
+import numpy as np
+
+from cell_analysis_tools.flim._phasor_basis import calibrate_phasor, phasor_basis
+from cell_analysis_tools.flim.aggregate_roi_decays import (_accumulate_dtype,
+                                                           _index_sum_matrix)
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
+from cell_analysis_tools.io import load_sdt_file
+
+FrameResult = coll.namedtuple(
+    "FrameResult", "frame intensity g s roi_decays roi_g roi_s labels cube"
+)
+
+
+class FLIMTimeSeries:
+    """
+    Accumulates FLIM frames of a time series one at a time. Keeps running
+    totals (window=None) or sums over the last ``window`` frames of the
+    intensity image, pixel phasor numerators, roi decays and optionally the
+    photon cube. Phasors are linear in the decay so windowed phasors are
+    exact, not averages of per frame phasors.
+
+    Parameters
+    ----------
+    f : float
+        laser repetition rate, in units of 1/timebins.
+    timebins : ndarray
+        1D array of timebins.
+    irf : ndarray
+        1D array capturing the irf decay.
+    label_image : ndarray, optional
+        2d array of labeled rois for per roi decays and phasors.
+        The default is None.
+    window : int, optional
+        number of frames to sum over, None keeps a running total of all
+        frames. The default is None.
+    keep_cube : bool, optional
+        also accumulate the (x, y, t) photon cube. The default is False.
+    label_index : LabelIndex, optional
+        precomputed index of label_image. The default is None.
+
+    Note
+    ----
+        Memory is constant in the length of the series: one accumulator per
+        quantity plus, for windowed sums, the contributions of the last
+        ``window`` frames so they can be subtracted when they leave the window.
+
+    .. code-block:: python
+
+        series = FLIMTimeSeries(f=80e6, timebins=timebins, irf=irf,
+                                label_image=label_image, window=5)
+        for path_sdt in list_path_sdts:
+            result = series.add_frame(load_sdt_file(path_sdt)[0])
+
+    """
+
+    def __init__(self, f, timebins, irf, label_image=None, window=None, keep_cube=False,
+                 label_index=None):
+        assert window is None or window >= 1, "Error: window must be None or >= 1"
+        self.f = f
+        self.timebins = np.asarray(timebins, dtype=float)
+        self.window = window
+        self.keep_cube = keep_cube
+
+        self._basis = phasor_basis(self.timebins, f)
+        irf = np.asarray(irf, dtype=float)
+        self._gs_irf = (irf @ self._basis) / irf.sum()
+
+        self.label_image = None if label_image is None else np.asarray(label_image)
+        self.label_index = None
+        self.labels = None
+        self._m_labels = None
+        if self.label_image is not None:
+            self.label_index = as_label_index(self.label_image, label_index)
+            self.labels = self.label_index.labels
+
+        self.n_frames = 0
+        self._sums = None
+        self._frames = coll.deque()
+
+    def _frame_contribution(self, cube):
+        """ per frame quantities that are summed over frames """
+        cube = np.asarray(cube)
+        n_rows, n_cols, n_timebins = cube.shape
+        assert n_timebins == len(self.timebins), "Error: cube must have one value per timebin"
+        dtype = _accumulate_dtype(cube.dtype)
+        decays = cube.reshape(-1, n_timebins).astype(dtype, copy=False)
+
+        contribution = {
+            "intensity": decays.sum(axis=1, dtype=np.float64).reshape(n_rows, n_cols),
+            "gs": (decays @ self._basis.astype(dtype)).astype(np.float64).reshape(n_rows, n_cols, 2),
+        }
+        if self.label_image is not None:
+            if self._m_labels is None:
+                self._m_labels = _index_sum_matrix(self.label_index, dtype)
+            contribution["roi_decays"] = np.asarray(self._m_labels @ decays, dtype=np.float64)
+        if self.keep_cube:
+            contribution["cube"] = np.asarray(cube, dtype=np.float64)
+        return contribution
+
+    def add_frame(self, cube):
+        """
+        Adds a frame to the accumulators and returns the accumulated results.
+
+        Parameters
+        ----------
+        cube : ndarray
+            3d array of photons (x, y, t) for this frame.
+
+        Returns
+        -------
+        FrameResult
+            frame index, accumulated intensity image, calibrated pixel g and
+            s, roi decays (n_labels, t), calibrated roi g and s, roi labels and
+            the accumulated cube (None unless keep_cube).
+        """
+        contribution = self._frame_contribution(cube)
+        if self._sums is None:
+            self._sums = {key: value.copy() for key, value in contribution.items()}
+        else:
+            for key, value in contribution.items():
+                self._sums[key] += value
+
+        if self.window is not None:
+            self._frames.append(contribution)
+            if len(self._frames) > self.window:
+                for key, value in self._frames.popleft().items():
+                    self._sums[key] -= value
+
+        self.n_frames += 1
+        return self.result()
+
+    def result(self):
+        """ Accumulated results of the frames added so far """
+        assert self._sums is not None, "Error: no frames added"
+        g_irf, s_irf = self._gs_irf
+
+        intensity = self._sums["intensity"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            gs = self._sums["gs"] / intensity[..., np.newaxis]
+        g, s = calibrate_phasor(gs[..., 0], gs[..., 1], g_irf, s_irf)
+
+        roi_decays = roi_g = roi_s = None
+        if self.label_image is not None:
+            roi_decays = self._sums["roi_decays"]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                roi_gs = (roi_decays @ self._basis) / roi_decays.sum(axis=1, keepdims=True)
+            roi_g, roi_s = calibrate_phasor(roi_gs[:, 0], roi_gs[:, 1], g_irf, s_irf)
+
+        return FrameResult(
+            frame=self.n_frames - 1,
+            intensity=intensity.copy(),
+            g=g,
+            s=s,
+            roi_decays=None if roi_decays is None else roi_decays.copy(),
+            roi_g=roi_g,
+            roi_s=roi_s,
+            labels=self.labels,
+            cube=self._sums["cube"].copy() if self.keep_cube else None,
+        )
+
+
+def flim_time_series(
+    frames,
+    f,
+    timebins,
+    irf,
+    label_image=None,
+    window=None,
+    keep_cube=False,
+    channel=0,
+    label_index=None,
+    debug=False,
+):
+    """
+    Generator over a FLIM time series that yields accumulated results after
+    every frame, see FLIMTimeSeries.
+
+    Parameters
+    ----------
+    frames : iterable
+        (x, y, t) cubes or paths to sdt files, loaded one at a time.
+    f : float
+        laser repetition rate, in units of 1/timebins.
+    timebins : ndarray
+        1D array of timebins.
+    irf : ndarray
+        1D array capturing the irf decay.
+    label_image : ndarray, optional
+        2d array of labeled rois. The default is None.
+    window : int, optional
+        number of frames to sum over, None keeps a running total.
+        The default is None.
+    keep_cube : bool, optional
+        also accumulate the photon cube. The default is False.
+    channel : int, optional
+        channel to use when frames are sdt paths. The default is 0.
+    label_index : LabelIndex, optional
+        precomputed index of label_image. The default is None.
+    debug : bool, optional
+        Show the accumulated intensity of every frame. The default is False.
+
+    Yields
+    ------
+    FrameResult
+        accumulated results after each frame.
+
+    .. code-block:: python
+
+        for result in flim_time_series(list_path_sdts, f=80e6, timebins=timebins,
+                                       irf=irf, label_image=label_image, window=3):
+            print(result.frame, result.roi_g)
+
+    """
+    series = FLIMTimeSeries(f, timebins, irf, label_image=label_image,
+                            window=window, keep_cube=keep_cube, label_index=label_index)
+    for frame in frames:
+        if isinstance(frame, (str, Path)):
+            frame = load_sdt_file(frame)[channel]
+        result = series.add_frame(frame)
+
+        if debug:
+            plt.title(f"frame {result.frame}")
+            plt.imshow(result.intensity)
+            plt.axis("off")
+            plt.show()
+
+        yield result
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    from cell_analysis_tools.flim.simulate import (simulate_flim_image,
+                                                   simulate_label_image)
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((128, 128), n_rois=10, seed=0)
+    frames = (simulate_flim_image(label_image, lifetimes=[2e-9], photons=20, seed=seed).cube
+              for seed in range(10))
+    sim = simulate_flim_image(label_image, lifetimes=[2e-9], photons=20)
+    for result in flim_time_series(frames, 80e6, sim.timebins, sim.irf,
+                                   label_image=label_image, window=3):
+        print(result.frame, np.nanmean(result.roi_g))
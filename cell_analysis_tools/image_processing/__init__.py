@@ -5,7 +5,11 @@ from .fill_and_label_rois import fill_and_label_rois
 from .four_color_theorem.four_color_theorem_to_unique_values import four_color_to_unique
 from .four_color_theorem.four_colors import four_color_theorem
 from .kmeans_threshold import kmeans_threshold
+from .label_statistics import (label_quantiles, label_statistics,
+                               label_weighted_statistics)
 from .normalize import normalize
+from .region_adjacency import greedy_coloring, region_adjacency_graph
+from .sparse_label_index import LabelIndex, label_centroids
 from .rgb2gray import rgb2gray
 from .rgb2labels import rgb2labels
 from .sum_pool_3d import sum_pool_3d
@@ -23,5 +27,12 @@ __all__ = [
     "fill_and_label_rois",
     "four_color_theorem",
     "four_color_to_unique",
-    "remove_small_areas_fill_regions"
+    "remove_small_areas_fill_regions",
+    "LabelIndex",
+    "label_centroids",
+    "label_statistics",
+    "label_weighted_statistics",
+    "label_quantiles",
+    "region_adjacency_graph",
+    "greedy_coloring",
 ]
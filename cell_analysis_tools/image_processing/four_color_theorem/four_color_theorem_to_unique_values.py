@@ -4,15 +4,15 @@ import matplotlib as mpl
 import matplotlib.pylab as plt
 
 mpl.rcParams["figure.dpi"] = 300
-from collections import OrderedDict
 from pprint import pprint
 
 import numpy as np
 import tifffile
-from scipy.ndimage import label
-from skimage.measure import regionprops
+from skimage.measure import label
 from skimage.morphology import binary_closing, dilation, disk, remove_small_objects
 
+from cell_analysis_tools.image_processing.sparse_label_index import LabelIndex
+
 
 def four_color_to_unique(mask: np.ndarray, debug: bool = False) -> np.ndarray:
     """
@@ -35,44 +35,23 @@ def four_color_to_unique(mask: np.ndarray, debug: bool = False) -> np.ndarray:
         :width: 400
         :alt: Image showing mask with 5 labels converted to 284 unique labels 
     """
-    # determine unique labels and exclude bg(0)
-    list_unique_values = list(np.unique(mask))
-    list_unique_values.remove(0)  # remove bg
-
-    # label counter and placeholder array
-    roi_counter = 1
-    inter_mask = np.zeros_like(mask)
-
-    # iterate through 4 color labels
-    for value in list_unique_values:
-        pass
-        temp_mask = np.array(mask == value, dtype=np.uint16)
-
-        labels, _ = label(temp_mask)
-
-        unique_labels = list(np.unique(labels))
-        unique_labels.remove(0)
-        for roi_value in unique_labels:
-            inter_mask[labels == roi_value] = roi_counter
-            roi_counter += 1  # increment roi_value
-
-        # compute regionprops
-        # sort by centroid
-        props = regionprops(inter_mask)
-        dict_value_location = OrderedDict({roi.label: roi.centroid for roi in props})
-
-        # sort dict by tuple (rows, cols)
-        dict_value_location_sorted = sorted(
-            dict_value_location.items(), key=lambda item: (item[1][0], item[1][1])
-        )
-
-        # reoder roi values in increasing order
-        roi_counter = 1
-        output_mask = np.zeros_like(inter_mask)
-        for roi_val, _ in dict_value_location_sorted:
-            pass
-            output_mask[inter_mask == roi_val] = roi_counter
-            roi_counter += 1
+    mask = np.asarray(mask)
+
+    # connected components of every color in one pass, skimage only connects
+    # pixels of the same value (4-connectivity like scipy.ndimage.label)
+    components = label(mask, connectivity=1, background=0)
+    label_index = LabelIndex(components)
+    n_rois = len(label_index.labels)
+
+    # sort by centroid (rows, cols), ties by color value then first pixel
+    centroids = label_index.centroids()
+    first_pixels = label_index.first_pixels()
+    order = np.lexsort((first_pixels, mask.ravel()[first_pixels], centroids[:, 1], centroids[:, 0]))
+
+    # reorder roi values in increasing order with one lookup table
+    lut = np.zeros(int(components.max()) + 1, dtype=mask.dtype)
+    lut[label_index.labels[order]] = np.arange(1, n_rois + 1)
+    output_mask = lut[components]
 
     if debug:
         plt.imshow(output_mask)
@@ -6,16 +6,20 @@ import matplotlib as mpl
 import matplotlib.pylab as plt
 
 mpl.rcParams["figure.dpi"] = 300
-from collections import OrderedDict
 from pprint import pprint
 
 import numpy as np
 import tifffile
 from scipy.ndimage import label
-from skimage.morphology import dilation, disk
 
+from cell_analysis_tools.image_processing.region_adjacency import (
+    greedy_coloring, region_adjacency_graph)
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
 
-def four_color_theorem(mask: np.ndarray) -> np.ndarray:
+
+def four_color_theorem(mask: np.ndarray, label_index=None, distance=3,
+                       strategy="largest_first") -> np.ndarray:
     """
     Converts a n-labeled image to an up to 4 color image.
 
@@ -23,6 +27,14 @@ def four_color_theorem(mask: np.ndarray) -> np.ndarray:
     ----------
     mask : np.ndarray
         labeled mask with unique rois.
+    label_index : LabelIndex, optional
+        precomputed index of mask. The default is None.
+    distance : float, optional
+        rois with pixels within this distance are neighbors and get
+        different colors. The default is 3.
+    strategy : str, optional
+        greedy coloring order, "largest_first" or "dsatur", see
+        greedy_coloring. The default is "largest_first".
 
     Returns
     -------
@@ -37,102 +49,26 @@ def four_color_theorem(mask: np.ndarray) -> np.ndarray:
         :alt: Image showing mask with 256 unique labels converted to 5 labels 
     """
 
-    ### Generate Agencency Matrix
-    id_nodes = list(np.unique(mask))
-    id_nodes.remove(0)  # remove bg
-    dict_nodes_key_roi_value = {}
-    dict_nodes_key_idx = {}
-
-    for idx, roi_value in enumerate(id_nodes):
-        dict_nodes_key_roi_value[roi_value] = {}
-        dict_nodes_key_roi_value[roi_value]["adj_mat_idx"] = idx
-        dict_nodes_key_roi_value[roi_value]["colors"] = ["b", "c", "m", "y", 'r', 'g']
-        dict_nodes_key_idx[idx] = roi_value
-
-    adjacency_matrix = np.zeros((len(id_nodes), len(id_nodes)))
-
-    for roi_value in dict_nodes_key_roi_value:
-        pass
-        roi_idx = dict_nodes_key_roi_value[roi_value]["adj_mat_idx"]
-        mask_roi = np.array(mask == roi_value, dtype=np.uint16)
-        # plt.imshow(mask_roi)
-        # plt.show()
-
-        # determine neighbors / degree
-        # dilate and overlap with labeled mask to determine neighbors
-        mask_roi_dialated = dilation(mask_roi, disk(3))
-        mask_overlap = mask * mask_roi_dialated
-        nodes_neighbors = list(np.unique(mask_overlap))
-        nodes_neighbors.remove(roi_value)  # remove current roi
-        nodes_neighbors.remove(0)  # remove bg
-
-        #  populate adgacency matrix
-        if nodes_neighbors:
-            for neighbor_value in nodes_neighbors:
-                neighbor_index = dict_nodes_key_roi_value[neighbor_value]["adj_mat_idx"]
-                adjacency_matrix[roi_idx][neighbor_index] = 1
-                adjacency_matrix[neighbor_index][roi_idx] = 1
-
-        # dict increase degree
-        dict_nodes_key_roi_value[roi_value]["degree"] = len(nodes_neighbors)
-
-    ### Sort dictionary by largest to smallest degree
-    # this will color regions with many neighbors first
-    sorted_nodes = sorted(
-        dict_nodes_key_roi_value.items(),
-        key=lambda item: item[1]["degree"],
-        reverse=True,
+    ### Generate sparse adjacency graph in one pass over the mask
+    label_index = as_label_index(mask, label_index)
+    rag = region_adjacency_graph(mask, distance=distance, label_index=label_index)
+
+    # Main Algorithm, regions with many neighbors colored first
+    colors = greedy_coloring(rag.adjacency, strategy=strategy)
+    list_colors = ["b", "c", "m", "y", "r", "g"]
+    assert len(colors) == 0 or colors.max() < len(list_colors), (
+        f"Error: mask needs {colors.max() + 1} colors, more than {len(list_colors)}"
     )
-    nodes = OrderedDict(sorted_nodes)
-
-    # Main Algorithm
-    solution_nodes = {}  # roi_value : color
-    for roi_value in nodes.keys():  # iterate through roi_values
-        pass
-        # get list of colors in current roi, choose current color for roi
-        list_roi_colors = nodes[roi_value]["colors"]
-        # if roi_value == 302:
-        #     print('stop')
-        curr_color = list_roi_colors[0]
-        solution_nodes[roi_value] = curr_color  # set solutions
-
-        # get adjacency matrix to compare color against neighbors
-        adjacent_nodes = adjacency_matrix[
-            nodes[roi_value]["adj_mat_idx"]
-        ]  # get adj_matrix row at this index
-
-        # iterate through each row/neighbor in adj matrix
-        for pos in range(len(adjacent_nodes)):
-            pass
-            # if it's a neighbor and it has the color in it's list, remove it for that neighbors list
-            adj_node_idx = dict_nodes_key_idx[pos]
-            if adjacent_nodes[pos] == 1 and (
-                curr_color in nodes[adj_node_idx]["colors"]
-            ):
-                nodes[adj_node_idx]["colors"].remove(curr_color)
-
-    # create array to store solution
-    four_color_mask = np.zeros_like(mask)
+    solution_nodes = {roi_value: list_colors[color] for roi_value, color in zip(rag.labels, colors)}
 
     # convert from color to an intensity value for each color
-    for roi_value in solution_nodes:
-        pass
-        # convert color to intensity
-        if solution_nodes[roi_value] == "b":
-            value = 50
-        elif solution_nodes[roi_value] == "c":
-            value = 100
-        elif solution_nodes[roi_value] == "m":
-            value = 150
-        elif solution_nodes[roi_value] == "r":
-            value = 200
-        elif solution_nodes[roi_value] == "g":
-            value = 225
-        elif solution_nodes[roi_value] == "y":
-            value = 255
-
-        # change roi color to value
-        four_color_mask[mask == roi_value] = value
+    dict_color_values = {"b": 50, "c": 100, "m": 150, "r": 200, "g": 225, "y": 255}
+    values = np.array([dict_color_values[color] for color in list_colors])[colors]
+
+    # create array to store solution, change roi colors to values in one pass
+    four_color_mask = np.zeros(np.shape(mask), dtype=np.asarray(mask).dtype)
+    foreground = label_index.index >= 0
+    four_color_mask.ravel()[foreground] = values[label_index.index[foreground]]
 
     return four_color_mask, solution_nodes
 
@@ -0,0 +1,296 @@
+import collections as coll
+
+import matplotlib.pylab as plt
+import numpy as np
+import numpy.ma as ma
+
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
+
+LabelStatistics = coll.namedtuple(
+    "LabelStatistics", "labels count sum sum_squares mean stdev"
+)
+LabelWeightedStatistics = coll.namedtuple(
+    "LabelWeightedStatistics", "labels sum_weights mean stdev"
+)
+LabelQuantiles = coll.namedtuple("LabelQuantiles", "labels quantiles values")
+
+
+def _labels_and_index(label_image, label_index):
+    """ labels and flat index of the given LabelIndex, or of a new one """
+    label_index = as_label_index(label_image, label_index)
+    return label_index.labels, label_index.index
+
+
+def _stack_images(images):
+    """ list of 2d images or masked arrays -> list of images, single image flag """
+    if isinstance(images, np.ndarray) and images.ndim == 2:
+        return [images], True
+    return list(images), False
+
+
+def _stack_label_values(label_image, index, n_labels, list_images):
+    """
+    Foreground pixel values of every image, (n_images, n_foreground) arrays of
+    the (image, label) bin of each value, the values and whether they are
+    valid (not masked).
+    """
+    foreground = index >= 0
+    index_fg = index[foreground]
+    n_images = len(list_images)
+
+    values = np.empty((n_images, index_fg.size), dtype=np.float64)
+    valid = np.empty((n_images, index_fg.size), dtype=bool)
+    for idx, image in enumerate(list_images):
+        assert np.shape(image) == label_image.shape, (
+            f"Error: image {idx} shape {np.shape(image)} does not match label image {label_image.shape}"
+        )
+        values[idx] = np.ravel(ma.getdata(image))[foreground]
+        valid[idx] = ~np.ravel(ma.getmaskarray(image))[foreground]
+
+    # one bin per (image, label) pair
+    bins = np.arange(n_images)[:, np.newaxis] * n_labels + index_fg
+    return bins, values, valid
+
+
+def label_statistics(label_image, images, label_index=None, debug=False):
+    """
+    Computes the pixel count, sum, sum of squares, mean and standard deviation
+    of every label for a set of images in a single pass. All images are
+    stacked and reduced with one bincount over a flattened (image, label)
+    index instead of one regionprops call per image.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask, 0 is background.
+    images : ndarray or list
+        a single image or a list/stack of images with the shape of
+        label_image. Masked arrays are supported, masked pixels are
+        excluded from every statistic like regionprops does.
+    label_index : LabelIndex, optional
+        precomputed index of label_image, shared across calls.
+        The default is None, computed here.
+    debug : bool, optional
+        Show the label image and the mean of each label per image.
+        The default is False.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    count : ndarray
+        number of valid pixels, (n_images, n_labels) or (n_labels,) for a
+        single image.
+    sum : ndarray
+        sum of pixel values.
+    sum_squares : ndarray
+        sum of squared pixel values.
+    mean : ndarray
+        mean pixel value, nan for labels without valid pixels.
+    stdev : ndarray
+        population standard deviation (ddof=0), computed in two passes
+        around the mean for numerical accuracy.
+
+    .. code-block:: python
+
+        stats = label_statistics(label_image, [im_nadh_intensity, im_fad_intensity])
+        stats.mean[0]  # nadh intensity mean of every label
+
+    """
+    label_image = np.asarray(label_image)
+    labels, index = _labels_and_index(label_image, label_index)
+    n_labels = len(labels)
+    list_images, single_image = _stack_images(images)
+    n_images = len(list_images)
+
+    bins, values, valid = _stack_label_values(label_image, index, n_labels, list_images)
+    bins = bins[valid]
+    values = values[valid]
+    n_bins = n_images * n_labels
+
+    count = np.bincount(bins, minlength=n_bins)
+    total = np.bincount(bins, weights=values, minlength=n_bins)
+    sum_squares = np.bincount(bins, weights=values ** 2, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        deviation = values - mean[bins]
+        stdev = np.sqrt(np.bincount(bins, weights=deviation ** 2, minlength=n_bins) / count)
+
+    shape = (n_labels,) if single_image else (n_images, n_labels)
+    stats = LabelStatistics(
+        labels=labels,
+        count=count.reshape(shape),
+        sum=total.reshape(shape),
+        sum_squares=sum_squares.reshape(shape),
+        mean=mean.reshape(shape),
+        stdev=stdev.reshape(shape),
+    )
+
+    if debug:
+        fig, ax = plt.subplots(1, 2, figsize=(10, 5))
+        ax[0].imshow(label_image)
+        ax[0].set_axis_off()
+        ax[1].plot(labels, np.atleast_2d(stats.mean).T, ".")
+        ax[1].set_xlabel("label")
+        ax[1].set_ylabel("mean")
+        plt.show()
+
+    return stats
+
+
+def label_weighted_statistics(label_image, images, weights, label_index=None):
+    """
+    Computes the weighted mean and standard deviation of every label for a
+    set of images with weighted bincounts, e.g. intensity weighted lifetimes.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask, 0 is background.
+    images : ndarray or list
+        a single image or a list/stack of images with the shape of
+        label_image. Masked pixels are excluded.
+    weights : ndarray or list
+        a single weight image used for every image or one weight image per
+        image. Masked weights exclude the pixel.
+    label_index : LabelIndex, optional
+        precomputed index of label_image, shared across calls.
+        The default is None, computed here.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    sum_weights : ndarray
+        sum of weights, (n_images, n_labels) or (n_labels,) for a single image.
+    mean : ndarray
+        sum(w * x) / sum(w), nan for labels whose weights sum to zero.
+    stdev : ndarray
+        sqrt(sum(w * (x - mean)^2) / sum(w)), 0 for labels whose weights
+        sum to zero.
+
+    .. code-block:: python
+
+        stats = label_weighted_statistics(label_image, [im_nadh_t1, im_nadh_t2],
+                                          im_nadh_intensity)
+
+    """
+    label_image = np.asarray(label_image)
+    labels, index = _labels_and_index(label_image, label_index)
+    n_labels = len(labels)
+    list_images, single_image = _stack_images(images)
+    n_images = len(list_images)
+    list_weights, single_weight = _stack_images(weights)
+    if single_weight:
+        list_weights = list_weights * n_images
+    assert len(list_weights) == n_images, "Error: weights must be one image or one image per image"
+
+    bins, values, valid = _stack_label_values(label_image, index, n_labels, list_images)
+    _, values_weights, valid_weights = _stack_label_values(label_image, index, n_labels, list_weights)
+    valid &= valid_weights
+    bins = bins[valid]
+    values = values[valid]
+    values_weights = values_weights[valid]
+    n_bins = n_images * n_labels
+
+    sum_weights = np.bincount(bins, weights=values_weights, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(bins, weights=values_weights * values, minlength=n_bins) / sum_weights
+        deviation = values - mean[bins]
+        variance = np.bincount(bins, weights=values_weights * deviation ** 2, minlength=n_bins) / sum_weights
+    stdev = np.where(sum_weights == 0, 0, np.sqrt(variance))
+
+    shape = (n_labels,) if single_image else (n_images, n_labels)
+    return LabelWeightedStatistics(
+        labels=labels,
+        sum_weights=sum_weights.reshape(shape),
+        mean=mean.reshape(shape),
+        stdev=stdev.reshape(shape),
+    )
+
+
+def label_quantiles(label_image, images, quantiles=(0.5,), label_index=None):
+    """
+    Computes quantiles of every label for a set of images. Values of all
+    images are sorted once by (image, label, value) and every quantile is read
+    from the sorted segments with linear interpolation like np.quantile.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask, 0 is background.
+    images : ndarray or list
+        a single image or a list/stack of images with the shape of
+        label_image. Masked pixels are excluded.
+    quantiles : sequence of float, optional
+        quantiles to compute in [0, 1]. The default is (0.5,), the median.
+    label_index : LabelIndex, optional
+        precomputed index of label_image, shared across calls.
+        The default is None, computed here.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    quantiles : ndarray
+        the requested quantiles.
+    values : ndarray
+        (n_images, n_labels, n_quantiles) or (n_labels, n_quantiles) for a
+        single image. nan for labels without valid pixels or with nan values.
+
+    .. code-block:: python
+
+        result = label_quantiles(label_image, [im_nadh_chi, im_fad_chi], quantiles=[0.1, 0.5, 0.9])
+        result.values[0, :, 1]  # nadh chi median of every label
+
+    """
+    label_image = np.asarray(label_image)
+    labels, index = _labels_and_index(label_image, label_index)
+    n_labels = len(labels)
+    list_images, single_image = _stack_images(images)
+    n_images = len(list_images)
+    quantiles = np.atleast_1d(np.asarray(quantiles, dtype=float))
+    assert np.all((quantiles >= 0) & (quantiles <= 1)), "Error: quantiles must be in [0, 1]"
+
+    bins, values, valid = _stack_label_values(label_image, index, n_labels, list_images)
+    bins = bins[valid]
+    values = values[valid]
+    n_bins = n_images * n_labels
+
+    count = np.bincount(bins, minlength=n_bins)
+    has_nan = np.bincount(bins, weights=np.isnan(values), minlength=n_bins) > 0
+    start = np.cumsum(count) - count
+
+    # sort once, every (image, label) bin becomes a contiguous sorted segment
+    values = values[np.lexsort((values, bins))]
+
+    # linear interpolation between the closest ranks of each segment
+    position = np.clip(count - 1, 0, None)[:, np.newaxis] * quantiles[np.newaxis, :]
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+
+    result = np.full(position.shape, np.nan)
+    filled = (count > 0) & ~has_nan
+    values_lower = values[start[filled, np.newaxis] + lower[filled]]
+    values_upper = values[start[filled, np.newaxis] + upper[filled]]
+    result[filled] = values_lower + (values_upper - values_lower) * fraction[filled]
+
+    shape = (n_labels, len(quantiles)) if single_image else (n_images, n_labels, len(quantiles))
+    return LabelQuantiles(labels=labels, quantiles=quantiles, values=result.reshape(shape))
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    from cell_analysis_tools.flim.simulate import (simulate_label_image,
+                                                   simulate_omi_images)
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    images = simulate_omi_images(label_image)
+    stats = label_statistics(label_image, list(images.values()), debug=True)
+    print(stats.mean.shape)
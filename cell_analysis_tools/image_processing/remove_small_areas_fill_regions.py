@@ -7,6 +7,7 @@ import numpy as np
 from skimage.measure import regionprops
 from skimage.morphology import closing, disk, remove_small_objects, label
 from cell_analysis_tools.visualization import compare_images
+from cell_analysis_tools.image_processing.sparse_label_index import as_label_index
 from tqdm import tqdm
 import tifffile
 
@@ -17,6 +18,7 @@ mpl.rcParams['figure.dpi'] = 300
 def remove_small_areas_fill_regions(mask : np.array,
                                     region_min_size : int = 100,
                                     footprint_area_closing : int = 2,
+                                    label_index=None,
                                     debug=False):
     """
     Function was created to clean up masks that may have stray pixels or regions. 
@@ -29,6 +31,8 @@ def remove_small_areas_fill_regions(mask : np.array,
         minimum size of connected component to be removed. The default is 100.
     footprint_area_closing : int, optional
         When merging images radius of disk to use. The default is 2.
+    label_index : LabelIndex, optional
+        precomputed index of mask. The default is None.
     debug : TYPE, optional
         Enable/Disable display of intermediate images for debugging function. The default is False.
 
@@ -56,11 +60,16 @@ def remove_small_areas_fill_regions(mask : np.array,
         plt.show()
      
     mask_revised = np.zeros_like(mask)
+    label_index = as_label_index(mask, label_index)
+    # closing reaches 2 radii around a roi, work on crops padded past that
+    padding = 2 * footprint_area_closing + 1
     for label_value in np.unique(mask_no_small_objects):
         pass
+        if label_value == 0:
+            continue
     
         # isolate roi
-        mask_roi = mask == label_value
+        mask_roi, slices = label_index.crop(label_value, padding=padding)
         
         # get largest region
         mask_roi_labels_mask = label(mask_roi)
@@ -69,7 +78,7 @@ def remove_small_areas_fill_regions(mask : np.array,
 
         # fill holes in roi
         mask_closing = closing(mask_largest,footprint=disk(footprint_area_closing))
-        mask_revised[mask_closing] = label_value
+        mask_revised[slices][mask_closing] = label_value
     
     if debug:
         plt.title("final output")
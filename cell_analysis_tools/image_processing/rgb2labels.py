@@ -10,6 +10,8 @@ mpl.rcParams["figure.dpi"] = 300
 import tifffile
 from scipy.ndimage import label
 
+from cell_analysis_tools.image_processing.sparse_label_index import LabelIndex
+
 
 def rgb2labels(im, debug=False):
     """
@@ -56,11 +58,10 @@ def rgb2labels(im, debug=False):
     for value in unique_values:  # iterate through values
         im_rois = (flat == value).astype(int)
         labeled_mask, n_rois = label(im_rois)
-        # iterate through labels
-        for roi_label in np.unique(labeled_mask)[1:]:  # exclude gb mask
-            roi = (labeled_mask == roi_label).astype(int) * idx
-            mask = mask + roi
-            idx += 1
+        # offset labels of this color past the ones already assigned
+        rois = labeled_mask > 0
+        mask[rois] = labeled_mask[rois] + idx - 1
+        idx += n_rois
     if debug:
         plt.title("intermediate mask")
         plt.imshow(mask)
@@ -68,19 +69,14 @@ def rgb2labels(im, debug=False):
 
     ###### reorder index to increasing values
 
-    iter_mask = mask.copy().astype(int)
-    n_rows, n_cols = iter_mask.shape
-
-    label_id = 1  # starting label
-    for row in np.arange(n_rows):
-        print(f"processing row: {row}")
-        for col in np.arange(n_cols):
-            if iter_mask[row, col] != 0:  # mask found
-                # print(f"value: {mask[row,col]}")
-                roi_value = mask[row, col]
-                mask[iter_mask == roi_value] = label_id  # replace mask value
-                iter_mask[iter_mask == roi_value] = 0  # clear out mask in iter_mask
-                label_id += 1  # increment index
+    # labels numbered in raster order of their first pixel
+    label_index = LabelIndex(mask.astype(int))
+    order = np.argsort(label_index.first_pixels())
+    label_ids = np.empty(len(order), dtype=np.int64)
+    label_ids[order] = np.arange(1, len(order) + 1)
+    foreground = label_index.index >= 0
+    mask = np.zeros(mask.shape)
+    mask.ravel()[foreground] = label_ids[label_index.index[foreground]]
     if debug:
         plt.title("incrementing order of labels")
         plt.imshow(mask)
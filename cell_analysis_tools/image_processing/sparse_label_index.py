@@ -0,0 +1,210 @@
+import matplotlib.pylab as plt
+import numpy as np
+
+
+class LabelIndex:
+    """
+    Pixels of every label of a label image in CSR form, built once so per
+    label work scales with the size of the roi instead of the size of the
+    image times the number of rois (``mask == roi_value`` in a loop).
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask (2d or 3d), 0 is background.
+
+    Attributes
+    ----------
+    shape : tuple
+        shape of the label image.
+    labels : ndarray
+        sorted nonzero label values.
+    index : ndarray
+        flattened position of each pixel's label in labels, -1 for background.
+    indptr, indices : ndarray
+        flat pixel indices of labels[i] are indices[indptr[i]:indptr[i + 1]],
+        in increasing (raster) order.
+    areas : ndarray
+        number of pixels of every label.
+    bboxes : ndarray
+        (n_labels, 2 * ndim) bounding boxes like skimage regionprops,
+        (min_row, min_col, max_row, max_col) with exclusive max in 2d.
+
+    .. code-block:: python
+
+        index = LabelIndex(label_image)
+        for label in index.labels:
+            crop, slices = index.crop(label, padding=3)
+            ...  # work on the bool crop of this roi only
+
+    """
+
+    def __init__(self, label_image):
+        label_image = np.asarray(label_image)
+        self.shape = label_image.shape
+        self.ndim = label_image.ndim
+        labels_flat = label_image.ravel()
+
+        # label -> position lookup table, O(N) for compact integer labels
+        if labels_flat.dtype.kind in "iu" and labels_flat.size != 0 \
+                and labels_flat.min() >= 0 and labels_flat.max() <= 4 * labels_flat.size:
+            present = np.bincount(labels_flat) > 0
+            present[0] = False
+            self.labels = np.flatnonzero(present).astype(labels_flat.dtype)
+            lut = np.full(len(present), -1, dtype=np.int64)
+            lut[self.labels] = np.arange(len(self.labels))
+            self.index = lut[labels_flat]
+        else:
+            labels = np.unique(labels_flat)
+            self.labels = labels[labels != 0]
+            self.index = np.searchsorted(self.labels, labels_flat).astype(np.int64)
+            self.index[labels_flat == 0] = -1
+
+        foreground = np.flatnonzero(self.index >= 0)
+        self.areas = np.bincount(self.index[foreground], minlength=len(self.labels))
+        self.indptr = np.concatenate([[0], np.cumsum(self.areas)]).astype(np.int64)
+        # stable sort keeps raster order within every label
+        self.indices = foreground[np.argsort(self.index[foreground], kind="stable")]
+
+        if len(self.labels) != 0:
+            coords = np.unravel_index(self.indices, self.shape)
+            starts = self.indptr[:-1]
+            self.bboxes = np.concatenate(
+                [np.minimum.reduceat(c, starts)[:, np.newaxis] for c in coords]
+                + [np.maximum.reduceat(c, starts)[:, np.newaxis] + 1 for c in coords],
+                axis=1,
+            )
+        else:
+            self.bboxes = np.zeros((0, 2 * self.ndim), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return f"LabelIndex({len(self)} labels, shape={self.shape})"
+
+    def position(self, label):
+        """ position of a label value (or array of values) in labels """
+        position = np.searchsorted(self.labels, label)
+        assert np.all(self.labels[np.clip(position, 0, len(self.labels) - 1)] == label), (
+            f"Error: label {label} not in label image"
+        )
+        return position
+
+    def pixels(self, label):
+        """ flat indices of the pixels of a label """
+        position = self.position(label)
+        return self.indices[self.indptr[position]: self.indptr[position + 1]]
+
+    def coords(self, label):
+        """ tuple of coordinate arrays of the pixels of a label, like np.nonzero """
+        return np.unravel_index(self.pixels(label), self.shape)
+
+    def values(self, image, label):
+        """ pixel values of image inside a label """
+        return np.ravel(image)[self.pixels(label)]
+
+    def slices(self, label, padding=0):
+        """ bounding box of a label grown by padding and clipped to the image, as slices """
+        bbox = self.bboxes[self.position(label)]
+        return tuple(
+            slice(max(int(bbox[dim]) - padding, 0), min(int(bbox[self.ndim + dim]) + padding, self.shape[dim]))
+            for dim in range(self.ndim)
+        )
+
+    def crop(self, label, padding=0):
+        """
+        Boolean mask of a label cropped to its bounding box grown by padding.
+
+        Returns
+        -------
+        mask : ndarray
+            bool crop, True on the pixels of label.
+        slices : tuple
+            slices of the crop in the label image.
+        """
+        slices = self.slices(label, padding)
+        mask = np.zeros(tuple(s.stop - s.start for s in slices), dtype=bool)
+        coords = self.coords(label)
+        mask[tuple(c - s.start for c, s in zip(coords, slices))] = True
+        return mask, slices
+
+    def relabel_map(self):
+        """ lookup table {label : 1..n_labels} as an array indexed by label value """
+        lut = np.zeros(int(self.labels.max()) + 1 if len(self.labels) else 1, dtype=np.int64)
+        lut[self.labels] = np.arange(1, len(self.labels) + 1)
+        return lut
+
+    def compact(self):
+        """ label image relabeled to consecutive values 1..n_labels in label order """
+        return (self.index + 1).reshape(self.shape)
+
+    def first_pixels(self):
+        """ flat index of the first pixel (raster order) of every label """
+        return self.indices[self.indptr[:-1]]
+
+    def centroids(self):
+        """ (n_labels, ndim) centroid coordinates of every label, like skimage regionprops centroid """
+        centroids = np.zeros((len(self.labels), self.ndim))
+        if len(self.labels) != 0:
+            coords = np.unravel_index(self.indices, self.shape)
+            for dim, coord in enumerate(coords):
+                centroids[:, dim] = np.add.reduceat(coord, self.indptr[:-1]) / self.areas
+        return centroids
+
+    def show(self):
+        """ Shows the label image rebuilt from the index and the bounding boxes """
+        fig, ax = plt.subplots()
+        ax.imshow(self.compact())
+        for bbox in self.bboxes:
+            ax.add_patch(plt.Rectangle((bbox[1] - 0.5, bbox[0] - 0.5), bbox[3] - bbox[1], bbox[2] - bbox[0],
+                                       fill=False, edgecolor="w", linewidth=0.5))
+        ax.set_axis_off()
+        plt.show()
+
+
+def as_label_index(label_image, label_index=None):
+    """ label_index if given, checked against label_image, else a new LabelIndex """
+    if label_index is None:
+        return LabelIndex(label_image)
+    assert label_index.shape == np.shape(label_image), (
+        f"Error: label index shape {label_index.shape} does not match label image {np.shape(label_image)}"
+    )
+    return label_index
+
+
+def label_centroids(label_image, label_index=None):
+    """
+    Centroid of every label, from the label index instead of one regionprops
+    region per label.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask (2d or 3d), 0 is background.
+    label_index : LabelIndex, optional
+        precomputed index of label_image. The default is None.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    centroids : ndarray
+        (n_labels, ndim) centroid coordinates.
+    """
+    label_index = as_label_index(label_image, label_index)
+    return label_index.labels, label_index.centroids()
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+
+    from cell_analysis_tools.flim.simulate import simulate_label_image
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    index = LabelIndex(label_image)
+    print(index, index.areas[:5])
+    index.show()
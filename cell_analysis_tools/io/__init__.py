@@ -1,5 +1,6 @@
+from .feature_store import read_features, write_features
 from .load_image import load_image
-from .load_sdt import load_sdt_data, load_sdt_file
+from .load_sdt import iter_sdt_rows, load_sdt_data, load_sdt_file
 from .read_asc import read_asc
 
 __all__ = [
@@ -7,4 +8,7 @@ __all__ = [
     "load_sdt_file",
     "read_asc",
     "load_image",
+    "iter_sdt_rows",
+    "write_features",
+    "read_features",
 ]
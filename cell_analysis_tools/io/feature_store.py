@@ -0,0 +1,138 @@
+from pathlib import Path
+
+import pandas as pd
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as err:
+        raise ImportError(
+            "the feature store requires pyarrow, install it with pip install cell-analysis-tools[arrow]"
+        ) from err
+    return pa, pq
+
+
+def _to_arrow(features, pa):
+    """ FeatureTable, DataFrame or pyarrow Table -> pyarrow Table """
+    if isinstance(features, pa.Table):
+        return features
+    if isinstance(features, pd.DataFrame):
+        return pa.Table.from_pandas(features, preserve_index=False)
+    return features.to_arrow()  # FeatureTable
+
+
+def _image_files_record(path_store, image_id):
+    """ text file listing the files of image_id, pyarrow skips the _ directory """
+    return Path(path_store) / "_image_files" / f"{image_id}.txt"
+
+
+def _remove_image_files(path_store, image_id):
+    """ deletes the files recorded for image_id, only in the partitions they were written to """
+    path_record = _image_files_record(path_store, image_id)
+    if path_record.exists():
+        for path_relative in path_record.read_text().splitlines():
+            (Path(path_store) / path_relative).unlink(missing_ok=True)
+
+
+def write_features(
+    features,
+    path_store,
+    image_id,
+    metadata=None,
+    partition_cols=None,
+    row_group_size=None,
+):
+    """
+    Appends the feature table of one image to a Parquet feature store. Rows
+    are written to one file per image inside hive style directories of the
+    partition columns, e.g. experiment=glucose/treatment=2DG/, so readers
+    filtering on them skip every other directory. The files of every image
+    are recorded in path_store/_image_files, writing the same image_id again
+    replaces them, so rows rewritten with different partition values (e.g. a
+    corrected treatment) aren't duplicated.
+
+    Parameters
+    ----------
+    features : FeatureTable or pd.DataFrame
+        per roi features of one image, e.g. from omi_feature_table.
+    path_store : str or Path
+        root directory of the store.
+    image_id : str
+        base name of the image, used as file name.
+    metadata : dict, optional
+        constant values added as columns to every row, e.g. the experiment,
+        dish and treatment entries of an image set dictionary.
+        The default is None.
+    partition_cols : list, optional
+        columns to partition the store by, usually metadata keys.
+        The default is None.
+    row_group_size : int, optional
+        maximum rows per Parquet row group. The default is None, pyarrow's
+        default.
+
+    .. code-block:: python
+
+        write_features(omi_feature_table(base_name, mask, images), path_store, base_name,
+                       metadata={"experiment": "glucose", "treatment": "2DG"},
+                       partition_cols=["experiment", "treatment"])
+
+    """
+    pa, pq = _import_pyarrow()
+    table = _to_arrow(features, pa)
+    if metadata is not None:
+        for key, value in metadata.items():
+            table = table.append_column(key, pa.array([value] * table.num_rows))
+
+    _remove_image_files(path_store, image_id)
+    list_files = []
+    pq.write_to_dataset(
+        table,
+        root_path=str(path_store),
+        partition_cols=partition_cols,
+        basename_template=f"{image_id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        row_group_size=row_group_size,
+        file_visitor=lambda written_file: list_files.append(written_file.path),
+    )
+    path_record = _image_files_record(path_store, image_id)
+    path_record.parent.mkdir(parents=True, exist_ok=True)
+    path_record.write_text("".join(
+        f"{Path(path_file).relative_to(Path(path_store)).as_posix()}\n" for path_file in list_files
+    ))
+
+
+def read_features(path_store, columns=None, filters=None):
+    """
+    Reads a Parquet feature store. Only the requested columns are read and
+    filters are pushed down: partition directories and row groups whose
+    statistics can't match are skipped without being read.
+
+    Parameters
+    ----------
+    path_store : str or Path
+        root directory of the store.
+    columns : list, optional
+        columns to read. The default is None, every column.
+    filters : list, optional
+        pyarrow filters, a list of (column, op, value) tuples that must all
+        hold, or a list of such lists any of which holds, e.g.
+        [("treatment", "==", "2DG"), ("nadh_tau_mean_mean", ">", 500)].
+        The default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        the selected rows and columns.
+
+    .. code-block:: python
+
+        df = read_features(path_store, columns=["base", "redox_ratio_mean"],
+                           filters=[("treatment", "==", "2DG")])
+
+    """
+    _, pq = _import_pyarrow()
+    assert Path(path_store).exists(), f"Error: feature store {path_store} does not exist"
+    table = pq.read_table(str(path_store), columns=columns, filters=filters, partitioning="hive")
+    return table.to_pandas()
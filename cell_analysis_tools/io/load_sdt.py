@@ -35,7 +35,17 @@ def load_sdt_file(file_path):
             data = np.frombuffer(data, np.uint16)
 
     # format == [channel, x, y, num_timebins]
+    c, x, y, z = _sdt_shape(len(data))
+    """ order is [CXYT] """
+    numpy_image = np.reshape(data, (c, x, y, z))
+    return np.float32(numpy_image)
+
 
+def _sdt_shape(n_values):
+    """
+    Returns the (channel, x, y, num_timebins) shape of an sdt data block
+    with n_values uint16 values.
+    """
     # todo
     """  figure out how to extract this info from sdt file"""
     img_1_256_256_256 = 16777216
@@ -43,27 +53,60 @@ def load_sdt_file(file_path):
     img_2_512_512_256 = 134217728  # array size
     img_3_512_512_256 = 201326592
     img_2_256_256_256 = 2 * 256 * 256 * 256
-    if len(data) == img_2_512_512_256:
-        c, x, y, z = (2, 512, 512, 256)
-    if len(data) == img_1_256_256_256:
-        c, x, y, z = (1, 256, 256, 256)
-    if len(data) == img_1_512_512_256:
-        c, x, y, z = (1, 512, 512, 256)
-    if len(data) == img_3_512_512_256:
-        c, x, y, z = (3, 512, 512, 256)
-    if len(data) == img_2_256_256_256:
-        c, x, y, z = (2, 256, 256, 256)
-
-        # if c == 1:
-        #     ''' order is [XYT] '''
-        #     numpy_image = np.reshape(data, (x, y, z))
-        #     # if debug: tif.imshow(np.sum(image,axis=2))
-        #     return numpy_image
-
-        # else:
-        """ order is [CXYT] """
-    numpy_image = np.reshape(data, (c, x, y, z))
-    return np.float32(numpy_image)
+    dict_shapes = {
+        img_2_512_512_256: (2, 512, 512, 256),
+        img_1_256_256_256: (1, 256, 256, 256),
+        img_1_512_512_256: (1, 512, 512, 256),
+        img_3_512_512_256: (3, 512, 512, 256),
+        img_2_256_256_256: (2, 256, 256, 256),
+    }
+    if n_values not in dict_shapes:
+        raise ValueError(f"Unknown sdt data block size: {n_values} values")
+    return dict_shapes[n_values]
+
+
+def iter_sdt_rows(file_path, channel=0, n_rows=32):
+    """
+    Streams one channel of an sdt file as blocks of rows so large files can
+    be reduced without loading the whole (c, x, y, t) cube in memory.
+
+    Parameters
+    ----------
+    file_path : pathlib path
+        Path to the sdt file.
+    channel : int, optional
+        channel to read. The default is 0.
+    n_rows : int, optional
+        number of image rows per block. The default is 32.
+
+    Yields
+    ------
+    row_start : int
+        index of the first row in the block.
+    block : np.ndarray
+        float32 array (rows, y, t) of photon counts.
+
+    .. code-block:: python
+
+        for row_start, block in iter_sdt_rows(path_sdt, channel=0):
+            intensity[row_start:row_start + len(block)] = block.sum(axis=2)
+
+    """
+    with zipfile.ZipFile(file_path) as myzip:
+        z1 = myzip.infolist()[0]  # "data_block" or sdt bruker uses "data_block001" for multi-sdt"
+        c, x, y, z = _sdt_shape(z1.file_size // 2)
+        assert 0 <= channel < c, f"Error: channel {channel} not in file with {c} channels"
+
+        row_bytes = y * z * 2  # uint16
+        with myzip.open(z1.filename) as myfile:
+            # skip preceding channels, zip streams can only be read forward
+            for _ in range(channel * x):
+                myfile.read(row_bytes)
+            for row_start in range(0, x, n_rows):
+                rows = min(n_rows, x - row_start)
+                data = myfile.read(rows * row_bytes)
+                block = np.frombuffer(data, np.uint16).reshape(rows, y, z)
+                yield row_start, np.float32(block)
 
 
 def load_sdt_data(filepath):
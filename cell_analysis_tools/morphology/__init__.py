@@ -1,10 +1,28 @@
-from .fractal_dimension.fractal_dim_binary import fractal_dimension_binary
-from .fractal_dimension.fractal_dim_gray import fractal_dimension_gray
+from .fractal_dimension.fractal_dim_binary import (
+    fractal_dimension_binary, fractal_dimension_binary_labels)
+from .fractal_dimension.fractal_dim_gray import (
+    fractal_dimension_gray, fractal_dimension_gray_labels)
+from .intensity_sum import label_intensity
+from .mitochondria_morphology import (mitochondria_morphological_class,
+                                      mitochondria_network_features)
+from .neighborhood import neighborhood_features
 from .regionprops import regionprops, regionprops_table
+from .roi_distance import radius_features
+from .roi_motion import label_centroids, track_labels, track_motion
 
 __all__ = [
     "regionprops",
     "regionprops_table",
     "fractal_dimension_gray",
+    "fractal_dimension_gray_labels",
     "fractal_dimension_binary",
+    "fractal_dimension_binary_labels",
+    "radius_features",
+    "label_centroids",
+    "track_labels",
+    "track_motion",
+    "mitochondria_network_features",
+    "mitochondria_morphological_class",
+    "neighborhood_features",
+    "label_intensity",
 ]
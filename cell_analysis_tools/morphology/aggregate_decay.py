@@ -1,3 +1,26 @@
-def roi_decay():
-    # function to aggregate roi decay and return as a parameter to regionprops
-    raise NotImplementedError
+import numpy as np
+
+
+def roi_decay(regionmask, intensity_image):
+    """
+    Aggregates the decay of a roi, meant to be passed to regionprops as an
+    extra property with the sdt cube (x, y, t) as the intensity image.
+
+    Parameters
+    ----------
+    regionmask : ndarray
+        2d boolean mask of the roi.
+    intensity_image : ndarray
+        3d array of photons (x, y, t) cropped to the roi.
+
+    Returns
+    -------
+    ndarray
+        1d summed decay of the roi.
+
+    Note
+    ----
+        To sum the decays of all rois in an image at once use
+        cell_analysis_tools.flim.aggregate_roi_decays.
+    """
+    return intensity_image[regionmask.astype(bool)].sum(axis=0)
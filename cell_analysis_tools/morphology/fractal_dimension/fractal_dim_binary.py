@@ -6,58 +6,150 @@
 # fractal dimension of a set S in a Euclidean space Rn, or more generally in a
 # metric space (X, d).
 # -----------------------------------------------------------------------------
+import collections as coll
+
 import matplotlib as mpl
 import matplotlib.pylab as plt
 import numpy as np
 import scipy.misc
 from PIL import Image
+from scipy.ndimage import find_objects
 
 mpl.rcParams["figure.dpi"] = 300
 
+BinaryFractalDimensions = coll.namedtuple(
+    "BinaryFractalDimensions", "labels fractal_dimension residuals"
+)
+
+
+def _box_sizes_exponent(shape):
+    """ exponent of the greatest power of 2 less than or equal to the smallest dimension """
+    return int(np.floor(np.log2(min(shape)))) if min(shape) > 0 else 0
+
+
+def box_count_pyramid(Z, n):
+    """
+    Counts the non-empty and non-full boxes of a binary image for box sizes
+    2**n down to 2**2. Box sums come from a 2x2 sum pyramid, every level is
+    the reduction of the previous one, instead of summing the image again at
+    every size. Boxes are aligned to the top left corner, edge boxes are
+    partial.
+
+    Parameters
+    ----------
+    Z : ndarray
+        2d binary image.
+    n : int
+        exponent of the largest box size.
+
+    Returns
+    -------
+    sizes : ndarray
+        box sizes, decreasing.
+    counts : ndarray
+        number of boxes containing both set and unset pixels at every size.
+    """
+    # zero padding to a multiple of 2**n, partial edge boxes keep their sums
+    size_padded = [int(np.ceil(dim / 2 ** n)) * 2 ** n for dim in Z.shape]
+    level = np.zeros(size_padded, dtype=np.int64)
+    level[: Z.shape[0], : Z.shape[1]] = Z
+
+    counts = {}
+    for exponent in range(1, n + 1):
+        rows, cols = level.shape
+        level = level.reshape(rows // 2, 2, cols // 2, 2).sum(axis=(1, 3))
+        k = 2 ** exponent
+        if exponent >= 2:
+            # We count non-empty (0) and non-full boxes (k*k)
+            counts[k] = np.count_nonzero((level > 0) & (level < k * k))
 
-def fractal_dimension_binary(Z, threshold=0.9):
-
-    # Only for 2d image
-    assert len(Z.shape) == 2
+    sizes = 2 ** np.arange(n, 1, -1)
+    return sizes, np.array([counts[k] for k in sizes], dtype=np.int64)
 
-    # From https://github.com/rougier/numpy-100 (#87)
-    def boxcount(Z, k):
-        S = np.add.reduceat(
-            np.add.reduceat(Z, np.arange(0, Z.shape[0], k), axis=0),
-            np.arange(0, Z.shape[1], k),
-            axis=1,
-        )
 
-        # We count non-empty (0) and non-full boxes (k*k)
-        return len(np.where((S > 0) & (S < k * k))[0])
+def _fit_dimension(sizes, counts):
+    """ dimension and rms residual of the log(counts) vs log(sizes) fit """
+    if len(sizes) < 2 or np.any(counts == 0):
+        return np.nan, np.nan
+    x, y = np.log(sizes), np.log(counts)
+    coeffs = np.polyfit(x, y, 1)
+    residuals = np.sqrt(np.mean((np.polyval(coeffs, x) - y) ** 2))
+    return -coeffs[0], residuals
 
-    # Transform Z into a binary array
-    Z = Z < threshold
-    plt.imshow(Z)
-    plt.show()
 
-    # Minimal dimension of image
-    p = min(Z.shape)
+def fractal_dimension_binary(Z, threshold=0.9, debug=False):
 
-    # Greatest power of 2 less than or equal to p
-    n = 2 ** np.floor(np.log(p) / np.log(2))
+    # Only for 2d image
+    assert len(Z.shape) == 2
 
-    # Extract the exponent
-    n = int(np.log(n) / np.log(2))
+    # Transform Z into a binary array
+    Z = Z < threshold
+    if debug:
+        plt.imshow(Z)
+        plt.show()
 
-    # Build successive box sizes (from 2**n down to 2**1)
-    sizes = 2 ** np.arange(n, 1, -1)
+    # Greatest power of 2 less than or equal to the minimal dimension of image
+    n = _box_sizes_exponent(Z.shape)
 
-    # Actual box counting with decreasing size
-    counts = []
-    for size in sizes:
-        counts.append(boxcount(Z, size))
+    # Actual box counting with decreasing size (from 2**n down to 2**2)
+    sizes, counts = box_count_pyramid(Z, n)
 
     # Fit the successive log(sizes) with log (counts)
     coeffs = np.polyfit(np.log(sizes), np.log(counts), 1)
     return -coeffs[0]
 
 
+def fractal_dimension_binary_labels(label_image, debug=False):
+    """
+    Box counting (Minkowski–Bouligand) dimension of every label of a label
+    image, each roi counted on its bounding box from a single find_objects.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        2d labeled mask, 0 is background.
+    debug : bool, optional
+        Plot the dimension of every label. The default is False.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    fractal_dimension : ndarray
+        dimension of every label, nan for rois with fewer than two box
+        sizes (smaller than 8 pixels across) or with empty box counts.
+    residuals : ndarray
+        rms residual of the log-log fit of every label.
+
+    .. code-block:: python
+
+        labels, fd, residuals = fractal_dimension_binary_labels(mask_cell)
+
+    """
+    label_image = np.asarray(label_image)
+    assert label_image.ndim == 2, "Error: label image must be 2d"
+    assert label_image.dtype.kind in "iu", "Error: label image must be integer"
+
+    list_slices = find_objects(label_image)
+    labels = np.array([idx + 1 for idx, slices in enumerate(list_slices) if slices is not None],
+                      dtype=label_image.dtype)
+    fractal_dimension = np.full(len(labels), np.nan)
+    residuals = np.full(len(labels), np.nan)
+    for idx, label in enumerate(labels):
+        roi = label_image[list_slices[label - 1]] == label
+        n = _box_sizes_exponent(roi.shape)
+        sizes, counts = box_count_pyramid(roi, n)
+        fractal_dimension[idx], residuals[idx] = _fit_dimension(sizes, counts)
+
+    if debug:
+        plt.plot(labels, fractal_dimension, ".")
+        plt.xlabel("label")
+        plt.ylabel("fractal dimension")
+        plt.show()
+
+    return BinaryFractalDimensions(labels=labels, fractal_dimension=fractal_dimension, residuals=residuals)
+
+
 if __name__ == "__main__":
     # I = Image.open("sierpienski_triangle.jpg")
     I = Image.open("sierpinski.png")
@@ -2,11 +2,17 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 
 mpl.rcParams["figure.dpi"] = 300
+import collections as coll
 import math
 
 import numpy as np
 from PIL import Image
 
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
+
+FractalDimensions = coll.namedtuple("FractalDimensions", "labels fractal_dimension")
+
 
 def pad_to_square(im, debug=False):
     """
@@ -92,8 +98,11 @@ def fractal_dimension_gray(roi, intensity, mode="standard", debug=False):
     lnsp = np.linspace(1, math.log(b, a), nval)
     sval = a ** lnsp
 
+    dict_counts = {}  # int(S) repeats for small images, count every scale once
     for S in sval:  # range(2,imM//2,(imM//2-2)//100):
-        Ns = differential_box_counting(image, int(S), mode=mode, debug=debug)
+        if int(S) not in dict_counts:
+            dict_counts[int(S)] = differential_box_counting(image, int(S), mode=mode, debug=debug)
+        Ns = dict_counts[int(S)]
         Nr.append(Ns)
         R = S / imM
         # r.append(S) # I think this should be R
@@ -108,9 +117,7 @@ def fractal_dimension_gray(roi, intensity, mode="standard", debug=False):
 
     # search fit error value
     N = len(x)
-    Sum = 0
-    for i in range(N):
-        Sum += (D * x[i] + b - y[i]) ** 2
+    Sum = np.sum((D * x + b - y) ** 2)
 
     errorfit = (1 / N) * math.sqrt(Sum / (1 + D ** 2))
 
@@ -138,6 +145,29 @@ def fractal_dimension_gray(roi, intensity, mode="standard", debug=False):
     return D
 
 
+def _block_min_max(im, s):
+    """
+    min and max of the s x s blocks tiling a square image, edge blocks may be
+    smaller. nan pixels are ignored like in the comparisons of the original
+    loop, blocks without finite pixels have min inf and max -inf.
+    """
+    im = np.asarray(im)
+    if im.dtype.kind in "iub":
+        im = im.astype(np.int64)  # no overflow in the box heights
+        low, high = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+        im_low = im_high = im
+    else:
+        low, high = -np.inf, np.inf
+        nan = np.isnan(im)
+        im_low, im_high = np.where(nan, low, im), np.where(nan, high, im)
+    M = im.shape[0]
+    ngrid = math.ceil(M / s)
+    pad = ((0, ngrid * s - M), (0, ngrid * s - M))
+    block_max = np.pad(im_low, pad, constant_values=low).reshape(ngrid, s, ngrid, s).max(axis=(1, 3))
+    block_min = np.pad(im_high, pad, constant_values=high).reshape(ngrid, s, ngrid, s).min(axis=(1, 3))
+    return block_min, block_max
+
+
 def differential_box_counting(im, s, mode="standard", debug=False):
     """
     differential box counting method for grayscale images
@@ -179,26 +209,21 @@ def differential_box_counting(im, s, mode="standard", debug=False):
 
     ngrid = math.ceil(M / s)
     h = G * (s / M)  # box height
-    grid = np.zeros((ngrid, ngrid), dtype="int32")
 
-    # iterate through larger grid
-    for i in range(ngrid):
-        for j in range(ngrid):
-            maxg = 0
-            ming = 255
-            # iterate through each pixel in sub-grid, the min error bounds
-            for k in range(i * s, min((i + 1) * s, M)):
-                for l in range(j * s, min((j + 1) * s, M)):
-                    if im[k, l] > maxg:
-                        maxg = im[k, l]
-                    if im[k, l] < ming:
-                        ming = im[k, l]
-
-            # box counting methods
-            if mode == "standard":
-                grid[i, j] = math.ceil(maxg / h) - math.ceil(ming / h) + 1
-            if mode == "shifting":
-                grid[i, j] = math.ceil((maxg - ming + 1) / h)
+    # min and max of every s x s box, the image is padded to ngrid * s with
+    # values that don't change the reductions
+    block_min, block_max = _block_min_max(im, s)
+
+    # bounds start at 0 and 255 like the original loop over the pixels of each box
+    maxg = np.maximum(block_max, 0)
+    ming = np.minimum(block_min, 255)
+
+    # box counting methods
+    grid = np.zeros((ngrid, ngrid), dtype="int32")
+    if mode == "standard":
+        grid = (np.ceil(maxg / h) - np.ceil(ming / h) + 1).astype("int32")
+    if mode == "shifting":
+        grid = np.ceil((maxg - ming + 1) / h).astype("int32")
 
     if debug:
         plt.title(f"mode: {mode} \n scale: {s}")
@@ -210,6 +235,58 @@ def differential_box_counting(im, s, mode="standard", debug=False):
     return Ns
 
 
+def fractal_dimension_gray_labels(label_image, intensity_image, mode="standard",
+                                  label_index=None, debug=False):
+    """
+    Computes fractal_dimension_gray of every label of a label image, each
+    on the intensity of its bounding box like the regionprops extra property.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        2d labeled mask, 0 is background.
+    intensity_image : ndarray
+        intensity image.
+    mode : str, optional
+        "standard" or "shifting", see fractal_dimension_gray.
+        The default is "standard".
+    label_index : LabelIndex, optional
+        precomputed index of label_image. The default is None.
+    debug : bool, optional
+        Plot the fractal dimension of every label. The default is False.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    fractal_dimension : ndarray
+        fractal dimension of every label, nan for rois smaller than 4 pixels
+        across.
+
+    .. code-block:: python
+
+        labels, fd = fractal_dimension_gray_labels(label_image, im_nadh_intensity)
+
+    """
+    label_index = as_label_index(label_image, label_index)
+    intensity_image = np.asarray(intensity_image)
+    fractal_dimension = np.full(len(label_index.labels), np.nan)
+    for idx, label in enumerate(label_index.labels):
+        bbox = label_index.bboxes[idx]
+        if max(bbox[2] - bbox[0], bbox[3] - bbox[1]) < 4:  # smallest scale is 2 boxes of 2 pixels
+            continue
+        roi, slices = label_index.crop(label)
+        fractal_dimension[idx] = fractal_dimension_gray(roi, intensity_image[slices], mode=mode)
+
+    if debug:
+        plt.plot(label_index.labels, fractal_dimension, ".")
+        plt.xlabel("label")
+        plt.ylabel("fractal dimension")
+        plt.show()
+
+    return FractalDimensions(labels=label_index.labels, fractal_dimension=fractal_dimension)
+
+
 if __name__ == "__main__":
     path = str(input("Enter path to image:"))
     # make image if nothing passed
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+
+def _feature_columns(features, n_rows):
+    """ dict, DataFrame or FeatureTable of per label columns -> {name: float array} """
+    if features is None:
+        return {}
+    if isinstance(features, pd.DataFrame):
+        names = list(features.columns)
+    elif hasattr(features, "column_names"):  # FeatureTable
+        names = features.column_names
+    else:
+        names = list(features)
+    columns = {name: np.asarray(features[name], dtype=float) for name in names}
+    for name, values in columns.items():
+        assert values.shape == (n_rows,), f"Error: feature {name} must have one value per centroid"
+    return columns
+
+
+def _neighbor_means(graph, columns, suffix):
+    """ mean of every feature over the neighbors of each row of a sparse graph, nan values excluded """
+    means = {}
+    for name, values in columns.items():
+        finite = np.isfinite(values)
+        total = graph @ np.where(finite, values, 0)
+        count = graph @ finite.astype(float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means[f"{name}_{suffix}"] = np.where(count > 0, total / count, np.nan)
+    return means
+
+
+def neighborhood_features(
+    centroids,
+    features=None,
+    radii=(50,),
+    k=1,
+    pixel_size=1,
+    adjacency=None,
+    index=None,
+):
+    """
+    Spatial context of every cell from its centroid: neighbor counts and
+    local density within radii, distances to the k nearest neighbors and the
+    mean of feature columns over the neighbors within each radius. A single
+    KD-tree is built per image and all pairs within the largest radius are
+    found in one query, so no cell is compared to every other cell.
+
+    Parameters
+    ----------
+    centroids : ndarray
+        (n_cells, ndim) centroids in pixels, e.g. from label_centroids or the
+        centroid-0, centroid-1 columns of regionprops_omi other_props.
+    features : pd.DataFrame or dict, optional
+        per cell feature columns to average over neighbors, e.g. redox_ratio_mean.
+        The default is None.
+    radii : list, optional
+        neighborhood radii in units of pixel_size. The default is (50,).
+    k : int, optional
+        number of nearest neighbor distances. The default is 1.
+    pixel_size : float, optional
+        size of a pixel, e.g. in µm, centroids are scaled by it.
+        The default is 1.
+    adjacency : scipy.sparse matrix, optional
+        (n_cells, n_cells) adjacency of touching cells, e.g. from
+        region_adjacency_graph, adds n_adjacent and {feature}_adjacent
+        columns. The default is None.
+    index : array-like, optional
+        index of the output, e.g. the labels. The default is None, the index
+        of features if a DataFrame.
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per cell with columns n_neighbors_r{r}, density_r{r}
+        (neighbors per unit area, or volume in 3d), nn_distance_{i}
+        (nan if there are fewer neighbors) and {feature}_neighbors_r{r}
+        (nan without neighbors).
+
+    .. code-block:: python
+
+        labels, centroids = label_centroids(mask_cell)
+        df_neighbors = neighborhood_features(centroids, df_omi[["redox_ratio_mean"]],
+                                             radii=[20, 50], k=3, pixel_size=0.5,
+                                             adjacency=region_adjacency_graph(mask_cell).adjacency)
+
+    """
+    centroids = np.asarray(centroids, dtype=float) * pixel_size
+    n_cells, ndim = centroids.shape
+    columns = _feature_columns(features, n_cells)
+    radii = sorted(radii)
+    if index is None and isinstance(features, pd.DataFrame):
+        index = features.index
+    dict_features = {}
+
+    tree = cKDTree(centroids)
+    if radii:
+        # all pairs within the largest radius, once
+        pairs = tree.query_pairs(radii[-1], output_type="ndarray")
+        distance = np.linalg.norm(centroids[pairs[:, 0]] - centroids[pairs[:, 1]], axis=1)
+        unit_ball = np.pi if ndim == 2 else 4 / 3 * np.pi
+        for r in radii:
+            within = pairs[distance <= r]
+            graph = sparse.coo_matrix(
+                (np.ones(2 * len(within)), (np.r_[within[:, 0], within[:, 1]], np.r_[within[:, 1], within[:, 0]])),
+                shape=(n_cells, n_cells),
+            ).tocsr()
+            n_neighbors = np.diff(graph.indptr)
+            dict_features[f"n_neighbors_r{r:g}"] = n_neighbors
+            dict_features[f"density_r{r:g}"] = n_neighbors / (unit_ball * r ** ndim)
+            dict_features.update(_neighbor_means(graph, columns, f"neighbors_r{r:g}"))
+
+    if k > 0:
+        # the closest point is the cell itself
+        distances, _ = tree.query(centroids, k=k + 1)
+        distances = np.where(np.isinf(distances), np.nan, distances.reshape(n_cells, k + 1))
+        for i in range(1, k + 1):
+            dict_features[f"nn_distance_{i}"] = distances[:, i]
+
+    if adjacency is not None:
+        adjacency = sparse.csr_matrix(adjacency, dtype=float)
+        assert adjacency.shape == (n_cells, n_cells), "Error: adjacency must be n_cells x n_cells"
+        dict_features["n_adjacent"] = np.diff(adjacency.indptr)
+        dict_features.update(_neighbor_means(adjacency, columns, "adjacent"))
+
+    return pd.DataFrame(dict_features, index=index)
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+    import matplotlib.pylab as plt
+
+    from cell_analysis_tools.flim.simulate import (simulate_label_image,
+                                                   simulate_omi_images)
+    from cell_analysis_tools.flim import omi_features
+    from cell_analysis_tools.image_processing import (label_centroids,
+                                                      region_adjacency_graph)
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    label_image = simulate_label_image((512, 512), n_rois=150, seed=0)
+    images = {key.replace("im_", "", 1): im
+              for key, im in simulate_omi_images(label_image, seed=0).items()}
+    df_omi = pd.DataFrame(omi_features("sim", label_image, images)).T
+
+    labels, centroids = label_centroids(label_image)
+    rag = region_adjacency_graph(label_image)
+    df_neighbors = neighborhood_features(centroids, df_omi[["redox_ratio_mean"]].astype(float),
+                                         radii=[25, 50], k=2, adjacency=rag.adjacency)
+    print(df_neighbors.head())
+
+    plt.scatter(centroids[:, 1], centroids[:, 0], c=df_neighbors["n_neighbors_r50"], s=5)
+    plt.gca().invert_yaxis()
+    plt.colorbar()
+    plt.show()
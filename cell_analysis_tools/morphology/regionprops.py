@@ -1,16 +1,78 @@
 import numpy as np
 from numpy.ma import masked_array
+from scipy import ndimage
 from skimage.measure import label
 from skimage.measure import regionprops as _regionprops
 from skimage.measure import regionprops_table as _regionprops_table
 from skimage.morphology import label
 
-from .fractal_dimension.fractal_dim_gray import fractal_dimension_gray
-from .intensity_sum import intensity_sum
+from cell_analysis_tools.image_processing.sparse_label_index import LabelIndex
+
+from .fractal_dimension.fractal_dim_gray import (fractal_dimension_gray,
+                                                 fractal_dimension_gray_labels)
+from .intensity_sum import intensity_sum, label_intensity
 from .roi_distance import radius_max, radius_mean, radius_median
 
+EXTRA_PROPERTIES = (
+    radius_mean,
+    radius_median,
+    radius_max,
+    intensity_sum,
+    fractal_dimension_gray,
+)
+
+RADIUS_PROPERTIES = ("radius_mean", "radius_median", "radius_max")
+
+
+def _bbox_radii(image):
+    """
+    radius_mean, radius_median and radius_max of a region's bounding box
+    image from one distance transform, same values as the three functions
+    """
+    distance = ndimage.distance_transform_edt(image)
+    return {
+        "radius_mean": np.mean(distance),
+        "radius_median": np.median(distance),
+        "radius_max": np.max(distance),
+    }
+
+
+class _Region:
+    """
+    skimage region whose radius_mean, radius_median and radius_max share one
+    distance transform of the bounding box image, computed on first access.
+    Every other property is read from the skimage region.
+    """
+
+    def __init__(self, region, cache=True):
+        self._region = region
+        self._cache_active = cache
+        self._radii = None
+
+    def _radius(self, name):
+        radii = self._radii
+        if radii is None:
+            radii = _bbox_radii(self._region.image)
+            if self._cache_active:
+                self._radii = radii
+        return radii[name]
+
+    def __getattr__(self, attr):
+        if attr in RADIUS_PROPERTIES:
+            return self._radius(attr)
+        region = self.__dict__.get("_region")
+        if region is None:  # e.g. while unpickling
+            raise AttributeError(attr)
+        return getattr(region, attr)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(list(self._region) + list(RADIUS_PROPERTIES))
 
-def regionprops(label_image, intensity_image=None):
+
+def regionprops(label_image, intensity_image=None, cache=True):
     """ Extended regionprops function adding our own props    
     
     To see a complete docstring for this function see regionprops skimage.
@@ -30,35 +92,101 @@ def regionprops(label_image, intensity_image=None):
     **fractal_dimension** : float
         Fractal dimension, differential box counting method implementation
 
+    Additional properties are only computed when accessed and, with cache=True,
+    once per region. The three radii share a single distance transform and
+    equal radius_mean, radius_median and radius_max of the region's image.
+
     """
-    return _regionprops(
+    label_image = np.asarray(label_image)
+    regions = _regionprops(
         label_image,
         intensity_image=intensity_image,
-        extra_properties=(
-            radius_mean,
-            radius_median,
-            radius_max,
-            intensity_sum,
-            fractal_dimension_gray,
-        ),
+        cache=cache,
+        extra_properties=(intensity_sum, fractal_dimension_gray),
     )
+    return [_Region(region, cache=cache) for region in regions]
 
 
-def regionprops_table(label_image, intensity_image, properties=None):
+def regionprops_table(label_image, intensity_image=None, properties=("label", "bbox")):
+    """
+    Extended regionprops_table, see regionprops_table of skimage for the
+    complete docstring and regionprops above for the additional properties.
+
+    Only the requested additional properties are computed, each for every
+    region at once from whole image implementations instead of per region
+    callbacks:
+
+    **intensity_sum** : label_intensity sums, one intensity_sum-{i} column
+    per channel or timebin of a (x, y, t) intensity image
+    **radius_max**, **radius_mean**, **radius_median** : one distance
+    transform of the bounding box image of each region shared by the three
+    radii, same values as regionprops.
+    **fractal_dimension_gray** : fractal_dimension_gray_labels, nan for regions
+    smaller than 4 pixels across, one fractal_dimension_gray-{i} column per
+    channel of multichannel intensity images.
+
+    Returns
+    -------
+    dict
+        columns of the requested properties, in order, one row per region.
+    """
+    label_image = np.asarray(label_image)
+    properties = list(properties)
+    names_extra = [func.__name__ for func in EXTRA_PROPERTIES]
+    list_extra = [prop for prop in properties if prop in names_extra]
+    list_skimage = [prop for prop in properties if prop not in names_extra]
 
-    return _regionprops_table(
+    table = _regionprops_table(
         label_image,
         intensity_image=intensity_image,
-        properties=properties,
-        extra_properties=(
-            radius_mean,
-            radius_median,
-            radius_max,
-            intensity_sum,
-            fractal_dimension_gray,
-        ),
+        properties=list_skimage + ([] if "label" in list_skimage else ["label"]),
     )
 
+    # vectorized extras over all labels, rows sorted by label like skimage
+    extra = {}
+    if list_extra:
+        label_index = LabelIndex(label_image)
+        if "intensity_sum" in list_extra:
+            assert intensity_image is not None, "Error: intensity_sum requires an intensity image"
+            sums = label_intensity(label_image, intensity_image, label_index=label_index).sum
+            if sums.ndim == 1:
+                extra["intensity_sum"] = sums
+            else:
+                # one column per channel or timebin, named like skimage
+                for idx, column in enumerate(sums.reshape(len(sums), -1).T):
+                    extra[f"intensity_sum-{idx}"] = column
+        if any(prop in RADIUS_PROPERTIES for prop in list_extra):
+            radii = [_bbox_radii(label_index.crop(label)[0]) for label in label_index.labels]
+            for prop in RADIUS_PROPERTIES:
+                if prop in list_extra:
+                    extra[prop] = np.array([region_radii[prop] for region_radii in radii])
+        if "fractal_dimension_gray" in list_extra:
+            assert intensity_image is not None, "Error: fractal_dimension_gray requires an intensity image"
+            if np.ndim(intensity_image) > label_image.ndim:
+                # one column per channel
+                channels = np.reshape(intensity_image, label_image.shape + (-1,))
+                for idx in range(channels.shape[-1]):
+                    extra[f"fractal_dimension_gray-{idx}"] = fractal_dimension_gray_labels(
+                        label_image, channels[..., idx], label_index=label_index
+                    ).fractal_dimension
+            else:
+                extra["fractal_dimension_gray"] = fractal_dimension_gray_labels(
+                    label_image, intensity_image, label_index=label_index
+                ).fractal_dimension
+
+    # requested order, skimage expands some properties into several columns
+    columns = {}
+    for prop in properties:
+        if prop in names_extra:
+            for key, value in extra.items():
+                if key == prop or key.startswith(f"{prop}-"):
+                    columns[key] = value
+        else:
+            for key, value in table.items():
+                if key == prop or key.startswith(f"{prop}-"):
+                    columns[key] = value
+    return columns
+
 
 if __name__ == "__main__":
 
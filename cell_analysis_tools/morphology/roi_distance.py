@@ -1,6 +1,19 @@
+import collections as coll
+
+import matplotlib.pylab as plt
 import numpy as np
 from scipy import ndimage
 
+from cell_analysis_tools.image_processing.label_statistics import (
+    label_quantiles, label_statistics)
+from cell_analysis_tools.image_processing.sparse_label_index import \
+    as_label_index
+
+RadiusFeatures = coll.namedtuple(
+    "RadiusFeatures",
+    "labels radius_max radius_argmax radius_mean radius_median quantiles radius_quantiles",
+)
+
 
 # https://docs.scipy.org/doc/scipy/reference/generated/scipy.ndimage.distance_transform_edt.html#scipy.ndimage.distance_transform_edt
 def radius_max(roi, return_index=False):
@@ -28,7 +41,7 @@ def radius_max(roi, return_index=False):
     References
     ----------
     """
-    distance, indices = ndimage.distance_transform_edt(roi, return_indices=True)
+    distance = ndimage.distance_transform_edt(roi)
     idx_max_value = np.unravel_index(distance.argmax(), roi.shape)
 
     if return_index:
@@ -74,6 +87,121 @@ def radius_median(roi):
     return np.median(ndimage.distance_transform_edt(roi))
 
 
+def touching_boundaries(label_image):
+    """
+    Pixels of a label adjacent (along any axis) to a pixel of a different
+    nonzero label.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask, 0 is background.
+
+    Returns
+    -------
+    ndarray
+        bool image, True on both sides of every boundary between touching labels.
+    """
+    label_image = np.asarray(label_image)
+    boundaries = np.zeros(label_image.shape, dtype=bool)
+    for axis in range(label_image.ndim):
+        before = [slice(None)] * label_image.ndim
+        after = [slice(None)] * label_image.ndim
+        before[axis] = slice(None, -1)
+        after[axis] = slice(1, None)
+        a, b = label_image[tuple(before)], label_image[tuple(after)]
+        touching = (a != b) & (a != 0) & (b != 0)
+        boundaries[tuple(before)] |= touching
+        boundaries[tuple(after)] |= touching
+    return boundaries
+
+
+def radius_features(label_image, quantiles=None, label_index=None, debug=False):
+    """
+    Distance of the pixels of every label to the closest background pixel,
+    from a single distance transform of the whole label image instead of one
+    transform per roi and feature. Boundaries between touching labels are
+    treated as background so each roi is measured on its own.
+
+    Parameters
+    ----------
+    label_image : ndarray
+        labeled mask (2d or 3d), 0 is background.
+    quantiles : list, optional
+        additional quantiles in [0, 1] of the distances of every label.
+        The default is None.
+    label_index : LabelIndex, optional
+        precomputed index of label_image. The default is None.
+    debug : bool, optional
+        Show the distance transform. The default is False.
+
+    Returns
+    -------
+    labels : ndarray
+        sorted nonzero label values.
+    radius_max : ndarray
+        max distance of every label.
+    radius_argmax : ndarray
+        (n_labels, ndim) coordinates of the first (raster order) pixel at
+        the max distance of every label.
+    radius_mean, radius_median : ndarray
+        mean and median distance of the pixels of every label.
+    quantiles : ndarray
+        requested quantiles.
+    radius_quantiles : ndarray
+        (n_labels, n_quantiles) distance quantiles of every label.
+
+    Note
+    ----
+        Distances reach background outside of the roi's bounding box and
+        only the pixels of the roi are reduced, unlike radius_mean and
+        radius_median applied to a regionprops bounding box image.
+
+    .. code-block:: python
+
+        radii = radius_features(mask_cell, quantiles=[0.9])
+        radii.radius_max[radii.labels == 3]
+
+    """
+    label_image = np.asarray(label_image)
+    label_index = as_label_index(label_image, label_index)
+    distance = ndimage.distance_transform_edt((label_image != 0) & ~touching_boundaries(label_image))
+
+    # max and its first position, labels are contiguous segments of the index
+    values = distance.ravel()[label_index.indices]
+    starts = label_index.indptr[:-1]
+    radius_max = np.zeros(len(label_index.labels))
+    radius_argmax = np.zeros((len(label_index.labels), label_image.ndim), dtype=np.int64)
+    if len(label_index.labels) != 0:
+        radius_max = np.maximum.reduceat(values, starts)
+        segment = np.repeat(np.arange(len(label_index.labels)), label_index.areas)
+        at_max = np.flatnonzero(values == radius_max[segment])
+        _, first = np.unique(segment[at_max], return_index=True)
+        radius_argmax = np.stack(
+            np.unravel_index(label_index.indices[at_max[first]], label_image.shape), axis=1
+        )
+
+    stats = label_statistics(label_image, distance, label_index=label_index)
+    quantiles = [] if quantiles is None else list(quantiles)
+    result_quantiles = label_quantiles(label_image, distance, quantiles=[0.5] + quantiles,
+                                       label_index=label_index)
+
+    if debug:
+        plt.imshow(distance if label_image.ndim == 2 else distance.max(axis=0))
+        plt.colorbar()
+        plt.show()
+
+    return RadiusFeatures(
+        labels=label_index.labels,
+        radius_max=radius_max,
+        radius_argmax=radius_argmax,
+        radius_mean=stats.mean,
+        radius_median=result_quantiles.values[:, 0],
+        quantiles=result_quantiles.quantiles[1:],
+        radius_quantiles=result_quantiles.values[:, 1:],
+    )
+
+
 if __name__ == "__main__":
 
     import matplotlib as mpl
@@ -99,3 +227,10 @@ if __name__ == "__main__":
 
     # MEDIAN RADIUS
     print(f"median radius: {radius_median(roi)}")
+
+    # ALL LABELS, one distance transform
+    from cell_analysis_tools.flim.simulate import simulate_label_image
+
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    radii = radius_features(label_image, quantiles=[0.9], debug=True)
+    print(f"max radius of each label: {radii.radius_max}")
@@ -1,3 +1,11 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from cell_analysis_tools.image_processing.sparse_label_index import (
+    LabelIndex, as_label_index, label_centroids)
+
+
 def magnitude(roi):
     """The magnitude of a vector, which can be computed at either a pixel or mitochondrion level.
 
@@ -31,3 +39,251 @@ def median_std_intensity(roi):
 
     """
     raise NotImplementedError
+
+
+def label_overlap(index_a, index_b):
+    """
+    Pixel overlap of the labels of two label images with the same shape, as
+    a sparse list of overlapping pairs.
+
+    Parameters
+    ----------
+    index_a, index_b : LabelIndex
+        indices of the two label images.
+
+    Returns
+    -------
+    position_a, position_b : ndarray
+        positions in index_a.labels and index_b.labels of every overlapping pair.
+    overlap : ndarray
+        number of pixels shared by every pair.
+    iou : ndarray
+        intersection over union of every pair.
+    """
+    both = (index_a.index >= 0) & (index_b.index >= 0)
+    codes = index_a.index[both] * len(index_b.labels) + index_b.index[both]
+    codes, overlap = np.unique(codes, return_counts=True)
+    position_a, position_b = np.divmod(codes, len(index_b.labels)) if len(codes) else (codes, codes)
+    iou = overlap / (index_a.areas[position_a] + index_b.areas[position_b] - overlap)
+    return position_a, position_b, overlap, iou
+
+
+def _link_frames(index_a, centroids_a, index_b, centroids_b, max_distance, tie_distance):
+    """
+    Links the labels of two consecutive frames.
+
+    Returns
+    -------
+    link : ndarray
+        position in frame b of the continuation of every label of frame a, -1 if none.
+    parent : ndarray
+        position in frame a of the label every unlinked label of frame b
+        split from, -1 for new labels and for linked labels.
+    """
+    link = np.full(len(centroids_a), -1, dtype=np.int64)
+    parent = np.full(len(centroids_b), -1, dtype=np.int64)
+    if len(centroids_a) == 0 or len(centroids_b) == 0:
+        return link, parent
+
+    # candidate pairs within max_distance, no all pairs comparison
+    pairs = cKDTree(centroids_a).sparse_distance_matrix(
+        cKDTree(centroids_b), max_distance, output_type="ndarray"
+    )
+    if len(pairs) == 0:
+        return link, parent
+    candidates_a = pairs["i"].astype(np.int64)
+    candidates_b = pairs["j"].astype(np.int64)
+    distance = pairs["v"]
+
+    # iou of the candidate pairs, 0 for pairs that don't overlap
+    overlap_a, overlap_b, _, overlap_iou = label_overlap(index_a, index_b)
+    n_b = len(centroids_b)
+    position = np.searchsorted(overlap_a * n_b + overlap_b, candidates_a * n_b + candidates_b)
+    position = np.clip(position, 0, max(len(overlap_a) - 1, 0))
+    iou = np.zeros(len(pairs))
+    if len(overlap_a):
+        found = (overlap_a[position] == candidates_a) & (overlap_b[position] == candidates_b)
+        iou[found] = overlap_iou[position[found]]
+
+    # nearest first, the larger overlap wins between pairs within tie_distance
+    order = np.lexsort((-iou, np.floor(distance / tie_distance)))
+    linked_b = np.zeros(n_b, dtype=bool)
+    for idx in order:
+        a, b = candidates_a[idx], candidates_b[idx]
+        if link[a] == -1 and not linked_b[b]:
+            link[a] = b
+            linked_b[b] = True
+
+    # unlinked labels overlapping a linked label of frame a split from it
+    for idx in np.argsort(-iou):
+        a, b = candidates_a[idx], candidates_b[idx]
+        if iou[idx] == 0:
+            break
+        if not linked_b[b] and parent[b] == -1 and link[a] != -1:
+            parent[b] = a
+    return link, parent
+
+
+def track_labels(label_images, max_distance=20, tie_distance=1, label_indices=None):
+    """
+    Tracks the labels of a time-lapse of label images. Consecutive frames are
+    linked one to one, nearest centroids first, searching candidates with a
+    KD-tree within max_distance. Between candidates whose distances are
+    within tie_distance the one with the larger overlap (IoU) wins.
+    Labels left unlinked start a new track, with the track of the label
+    they overlap most as parent when they split from it. Tracks of labels
+    that disappear end.
+
+    Parameters
+    ----------
+    label_images : ndarray or list
+        (n_frames, rows, cols) stack or list of label images.
+    max_distance : float, optional
+        max centroid displacement between frames in pixels. The default is 20.
+    tie_distance : float, optional
+        distance under which candidates are ranked by overlap. The default is 1.
+    label_indices : list, optional
+        precomputed LabelIndex of every frame. The default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per label per frame: frame, label, track_id, parent_track_id
+        (-1 if none), area and centroid-0, centroid-1 ... columns.
+
+    .. code-block:: python
+
+        tracks = track_labels([mask_t0, mask_t1, mask_t2], max_distance=15)
+        motion = track_motion(tracks, frame_interval=30)  # seconds
+
+    """
+    label_images = [np.asarray(label_image) for label_image in label_images]
+    if label_indices is None:
+        label_indices = [LabelIndex(label_image) for label_image in label_images]
+    assert len(label_indices) == len(label_images), "Error: one label index per frame required"
+
+    list_frames = []
+    n_tracks = 0
+    previous = None
+    for frame, (label_image, label_index) in enumerate(zip(label_images, label_indices)):
+        label_index = as_label_index(label_image, label_index)
+        labels, centroids = label_centroids(label_image, label_index)
+        track_id = np.full(len(labels), -1, dtype=np.int64)
+        parent_track_id = np.full(len(labels), -1, dtype=np.int64)
+
+        if previous is not None:
+            index_previous, centroids_previous, track_previous = previous
+            link, parent = _link_frames(index_previous, centroids_previous, label_index, centroids,
+                                        max_distance, tie_distance)
+            linked = link >= 0
+            track_id[link[linked]] = track_previous[linked]
+            split = parent >= 0
+            parent_track_id[split] = track_previous[parent[split]]
+
+        # new tracks
+        new = track_id == -1
+        track_id[new] = np.arange(n_tracks, n_tracks + new.sum())
+        n_tracks += new.sum()
+
+        df_frame = pd.DataFrame({
+            "frame": frame,
+            "label": labels,
+            "track_id": track_id,
+            "parent_track_id": parent_track_id,
+            "area": label_index.areas,
+        })
+        for dim in range(centroids.shape[1]):
+            df_frame[f"centroid-{dim}"] = centroids[:, dim]
+        list_frames.append(df_frame)
+        previous = (label_index, centroids, track_id)
+
+    tracks = pd.concat(list_frames, ignore_index=True)
+    # a split label starts a track, its parent applies to the whole track
+    parents = tracks.groupby("track_id")["parent_track_id"].transform("max")
+    tracks["parent_track_id"] = parents
+    return tracks
+
+
+def track_motion(tracks, frame_interval=1, pixel_size=1):
+    """
+    Motion features of every track from track_labels.
+
+    Parameters
+    ----------
+    tracks : pd.DataFrame
+        tracks from track_labels.
+    frame_interval : float, optional
+        time between frames. The default is 1.
+    pixel_size : float, optional
+        size of a pixel. The default is 1.
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by track_id: parent_track_id, frame_start, frame_end,
+        n_frames, path_length, displacement (start to end), speed_mean,
+        speed_max, velocity-0, velocity-1 ... (net displacement over time)
+        and straightness (displacement / path_length). Single frame tracks
+        have nan speeds, velocities and straightness.
+    """
+    columns_centroid = [column for column in tracks.columns if column.startswith("centroid-")]
+    tracks = tracks.sort_values(["track_id", "frame"])
+    track_id = tracks["track_id"].to_numpy()
+    centroids = tracks[columns_centroid].to_numpy() * pixel_size
+    frames = tracks["frame"].to_numpy()
+
+    # steps between consecutive rows of the same track
+    same_track = track_id[1:] == track_id[:-1]
+    step = np.linalg.norm(np.diff(centroids, axis=0), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = step / (np.diff(frames) * frame_interval)
+    df_steps = pd.DataFrame({"track_id": track_id[1:][same_track],
+                             "step": step[same_track],
+                             "speed": speed[same_track]})
+    steps = df_steps.groupby("track_id").agg(
+        path_length=("step", "sum"), speed_max=("speed", "max")
+    )
+
+    grouped = tracks.groupby("track_id")
+    first, last = grouped.first(), grouped.last()
+    motion = pd.DataFrame({
+        "parent_track_id": first["parent_track_id"],
+        "frame_start": first["frame"],
+        "frame_end": last["frame"],
+        "n_frames": grouped.size(),
+    })
+    motion = motion.join(steps)
+    motion["path_length"] = motion["path_length"].fillna(0.0)
+    delta = last[columns_centroid].to_numpy() * pixel_size - first[columns_centroid].to_numpy() * pixel_size
+    duration = (motion["frame_end"] - motion["frame_start"]).to_numpy() * frame_interval
+    with np.errstate(divide="ignore", invalid="ignore"):
+        motion["displacement"] = np.linalg.norm(delta, axis=1)
+        motion["speed_mean"] = np.where(duration > 0, motion["path_length"] / duration, np.nan)
+        for dim in range(delta.shape[1]):
+            motion[f"velocity-{dim}"] = np.where(duration > 0, delta[:, dim] / duration, np.nan)
+        motion["straightness"] = np.where(
+            motion["path_length"] > 0, motion["displacement"] / motion["path_length"], np.nan
+        )
+    return motion
+
+
+if __name__ == "__main__":
+
+    import matplotlib as mpl
+    import matplotlib.pylab as plt
+
+    from cell_analysis_tools.flim.simulate import simulate_label_image
+
+    mpl.rcParams["figure.dpi"] = 300
+
+    # cells drifting 2 pixels per frame
+    label_image = simulate_label_image((256, 256), n_rois=30, seed=0)
+    label_images = [np.roll(label_image, 2 * frame, axis=1) for frame in range(10)]
+    tracks = track_labels(label_images, max_distance=10)
+    motion = track_motion(tracks)
+    print(motion.head())
+
+    for track_id, df_track in tracks.groupby("track_id"):
+        plt.plot(df_track["centroid-1"], df_track["centroid-0"])
+    plt.gca().invert_yaxis()
+    plt.show()
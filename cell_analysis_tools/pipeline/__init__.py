@@ -0,0 +1,15 @@
+from .manifest import build_manifest, load_manifest
+from .omi_pipeline import (collect_features, feature_spec, process_image_set,
+                           run_omi_pipeline)
+from .state import PipelineState, spec_hash
+
+__all__ = [
+    "build_manifest",
+    "load_manifest",
+    "feature_spec",
+    "process_image_set",
+    "run_omi_pipeline",
+    "collect_features",
+    "PipelineState",
+    "spec_hash",
+]
@@ -0,0 +1,129 @@
+from pathlib import Path
+
+import pandas as pd
+
+# SPCImage export suffixes of every product, appended to f"{base}{channel letter}"
+FILE_SUFFIXES = {
+    "photons": "_photons.tiff",
+    "a1": "_a1[%].tiff",
+    "a2": "_a2[%].tiff",
+    "t1": "_t1.tiff",
+    "t2": "_t2.tiff",
+    "chi": "_chi.tiff",
+}
+
+# letter appended to the image set base name for each channel, e.g. img1n_photons.tiff
+CHANNEL_LETTERS = {"nadh": "n", "fad": "f", "stain": "r"}
+
+LIFETIME_FILES = ["photons", "a1", "a2", "t1", "t2"]
+
+DEFAULT_CHANNELS = {"nadh": LIFETIME_FILES, "fad": LIFETIME_FILES}
+
+
+def build_manifest(
+    path_dataset,
+    mask_suffix="n_photons_cellmask.tif",
+    channels=None,
+    file_suffixes=FILE_SUFFIXES,
+    channel_letters=CHANNEL_LETTERS,
+    path_output=None,
+):
+    """
+    Finds the files of every image set of a dataset, one image set per nadh
+    photons image, same naming as runCALICO.py: f"{base}n_photons.tiff",
+    f"{base}f_a1[%].tiff", f"{base}{mask_suffix}", ... Sets missing the mask
+    or any requested file are reported and left out.
+
+    Parameters
+    ----------
+    path_dataset : str or Path
+        directory searched recursively for images.
+    mask_suffix : str, optional
+        suffix of the mask appended to the base name.
+        The default is "n_photons_cellmask.tif".
+    channels : dict, optional
+        {channel : list of products} to find, e.g. adding
+        {"stain": ["photons"]} for stain intensity. The default is nadh and
+        fad photons, a1, a2, t1 and t2.
+    file_suffixes : dict, optional
+        {product : suffix} of the exported files. The default is FILE_SUFFIXES.
+    channel_letters : dict, optional
+        {channel : letter} appended to the base name. The default is
+        CHANNEL_LETTERS.
+    path_output : str or Path, optional
+        if given the manifest is also saved to this csv. The default is None.
+
+    Returns
+    -------
+    pd.DataFrame
+        manifest indexed by base name with a mask column and one
+        f"{channel}_{product}" column of paths per file.
+    """
+    channels = DEFAULT_CHANNELS if channels is None else channels
+    assert "nadh" in channels, "Error: image sets are found from nadh photons images"
+
+    # index file names once instead of searching every path for every file
+    dict_files = {}
+    for path in sorted(Path(path_dataset).rglob("*")):
+        dict_files.setdefault(path.name, str(path))
+
+    suffix_nadh_photons = channel_letters["nadh"] + file_suffixes["photons"]
+    list_bases = sorted(
+        name[: -len(suffix_nadh_photons)]
+        for name in dict_files
+        if name.endswith(suffix_nadh_photons)
+    )
+
+    dict_manifest = {}
+    for base in list_bases:
+        dict_set = {"mask": dict_files.get(base + mask_suffix)}
+        for channel, list_products in channels.items():
+            handle = base + channel_letters[channel]
+            for product in list_products:
+                dict_set[f"{channel}_{product}"] = dict_files.get(handle + file_suffixes[product])
+
+        list_missing = [key for key, path in dict_set.items() if path is None]
+        if len(list_missing) != 0:
+            print(f"{base} | missing {', '.join(list_missing)}, skipping set")
+            continue
+        dict_manifest[base] = dict_set
+
+    columns = ["mask"] + [f"{channel}_{product}" for channel, list_products in channels.items()
+                          for product in list_products]
+    df_manifest = pd.DataFrame.from_dict(dict_manifest, orient="index", columns=columns)
+    df_manifest.index.name = "base"
+
+    if path_output is not None:
+        df_manifest.to_csv(path_output)
+    return df_manifest
+
+
+def load_manifest(path_manifest):
+    """ Reads a manifest saved by build_manifest """
+    df_manifest = pd.read_csv(path_manifest, index_col="base", dtype=str, keep_default_na=False)
+    return df_manifest
+
+
+def manifest_images(row_data):
+    """
+    Maps the file columns of a manifest row to omi_features image names,
+    photons are the channel intensity.
+
+    Parameters
+    ----------
+    row_data : pd.Series or dict
+        manifest row.
+
+    Returns
+    -------
+    dict
+        {f"{channel}_{product}" : path}
+    """
+    images = {}
+    for key, path in dict(row_data).items():
+        if key == "mask" or path == "" or pd.isna(path):
+            continue
+        channel, product = key.split("_", 1)
+        product = "intensity" if product == "photons" else product
+        images[f"{channel}_{product}"] = path
+    return images
@@ -0,0 +1,259 @@
+import collections as coll
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from tqdm import tqdm
+
+from cell_analysis_tools.flim.omi_features import (STATISTICS, omi_feature_table,
+                                                   omi_run_parameters)
+from cell_analysis_tools.io import load_image
+from cell_analysis_tools.pipeline.manifest import load_manifest, manifest_images
+from cell_analysis_tools.pipeline.state import PipelineState, spec_hash
+
+PipelineSummary = coll.namedtuple(
+    "PipelineSummary", "completed skipped failed n_rois seconds"
+)
+
+# same defaults as runCALICO.py
+DEFAULT_SPEC = {
+    "parameters": None,
+    "fad": True,
+    "stain_intensity": True,
+    "stain_lifetime": True,
+    "statistics": STATISTICS,
+    "quantiles": None,
+    "intensity_weighted": False,
+    "other_props": ["area", "eccentricity"],
+}
+
+
+def feature_spec(**kwargs):
+    """
+    Feature spec passed to omi_feature_table for every image set, DEFAULT_SPEC
+    updated with kwargs.
+
+    Parameters
+    ----------
+    **kwargs :
+        any of parameters, fad, stain_intensity, stain_lifetime, statistics,
+        quantiles, intensity_weighted and other_props. With parameters None
+        the parameters and intensity weighted parameters are selected from
+        the channel flags like regionprops_omi_run, see omi_run_parameters,
+        otherwise they are passed to omi_features as is.
+
+    Returns
+    -------
+    dict
+        the feature spec.
+    """
+    for key in kwargs:
+        assert key in DEFAULT_SPEC, f"Error: unknown spec entry {key}, options are {list(DEFAULT_SPEC)}"
+    spec = dict(DEFAULT_SPEC)
+    spec.update(kwargs)
+    return spec
+
+
+def partition_path(path_output, base):
+    """ csv holding the features of one image set """
+    return Path(path_output) / "features" / f"{base}.csv"
+
+
+def _write_csv_atomic(df, path):
+    # write next to the destination then rename, a crash never leaves a partial partition
+    path_tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    df.to_csv(path_tmp)
+    os.replace(path_tmp, path)
+
+
+def process_image_set(base, row_data, path_output, spec):
+    """
+    Loads one image set, computes its OMI features and writes them to its
+    partition.
+
+    Parameters
+    ----------
+    base : str
+        base name of the image set.
+    row_data : pd.Series or dict
+        manifest row with the mask and image paths.
+    path_output : str or Path
+        output directory.
+    spec : dict
+        feature spec, see feature_spec.
+
+    Returns
+    -------
+    tuple
+        base name and number of rois.
+    """
+    label_image = load_image(Path(str(row_data["mask"])))
+    images = {
+        key: (lambda path=path: load_image(Path(str(path))))
+        for key, path in manifest_images(row_data).items()
+    }
+    spec = dict(spec)
+    flags = {key: spec.pop(key) for key in ["fad", "stain_intensity", "stain_lifetime"]}
+    if spec["parameters"] is None:
+        spec["parameters"], spec["intensity_weighted"] = omi_run_parameters(
+            images, intensity_weighted=bool(spec["intensity_weighted"]), **flags
+        )
+    table = omi_feature_table(base, label_image, images, **spec)
+
+    df = table.to_pandas(index_name="base_name")
+    df["base"] = df.pop("image_id")
+    _write_csv_atomic(df, partition_path(path_output, base))
+    return base, len(table)
+
+
+def run_omi_pipeline(manifest, path_output, spec=None, n_workers=1, resume=True):
+    """
+    Computes OMI features of every image set of a dataset manifest across a
+    process pool. Every finished set is checkpointed to its own partition in
+    path_output/features and recorded in path_output/pipeline.sqlite with
+    the hash of its input files and of the spec and library version. A rerun
+    with resume=True only recomputes sets that are new, unfinished or whose
+    inputs or spec changed, collect_features then splices them with the
+    partitions of unchanged sets.
+
+    Parameters
+    ----------
+    manifest : pd.DataFrame or str or Path
+        manifest from build_manifest or the path to its csv.
+    path_output : str or Path
+        output directory.
+    spec : dict, optional
+        feature spec, see feature_spec. The default is DEFAULT_SPEC.
+    n_workers : int, optional
+        number of worker processes, 1 runs in this process.
+        The default is 1.
+    resume : bool, optional
+        skip image sets whose partition is up to date with their inputs and
+        the spec. The default is True.
+
+    Returns
+    -------
+    PipelineSummary
+        completed, skipped and failed base names, number of rois computed
+        and the run time in seconds.
+
+    .. code-block:: python
+
+        df_manifest = build_manifest(path_dataset)
+        summary = run_omi_pipeline(df_manifest, path_output, n_workers=8)
+        df_features = collect_features(path_output)
+
+    """
+    df_manifest = manifest if isinstance(manifest, pd.DataFrame) else load_manifest(manifest)
+    spec = DEFAULT_SPEC if spec is None else spec
+    assert n_workers >= 1, "Error: n_workers must be >= 1"
+    (Path(path_output) / "features").mkdir(parents=True, exist_ok=True)
+
+    state = PipelineState(Path(path_output) / "pipeline.sqlite")
+    hash_spec = spec_hash(spec)
+    dict_input_hashes = {}
+    list_skipped = []
+    list_todo = []
+    for base, row_data in df_manifest.iterrows():
+        try:
+            input_hash = state.input_hash(row_data)
+        except OSError:  # missing input, the set fails and is reported below
+            input_hash = None
+        if (resume and partition_path(path_output, base).exists()
+                and state.is_current(base, input_hash, hash_spec)):
+            list_skipped.append(base)
+        else:
+            dict_input_hashes[base] = input_hash
+            list_todo.append((base, row_data.to_dict()))
+
+    list_completed = []
+    list_failed = []
+    n_rois = 0
+    time_start = time.perf_counter()
+    with state, tqdm(total=len(list_todo), desc="Analyzing image sets") as progress:
+
+        def finished(base, result=None, error=None):
+            nonlocal n_rois
+            if error is None:
+                list_completed.append(base)
+                n_rois += result[1]
+                state.record(base, dict_input_hashes[base], hash_spec)
+            else:
+                # don't leave results of outdated inputs in the output
+                list_failed.append(base)
+                state.forget(base)
+                partition_path(path_output, base).unlink(missing_ok=True)
+                tqdm.write(f"{base} | failed: {error!r}")
+            progress.update()
+
+        if n_workers == 1:
+            for base, row_data in list_todo:
+                try:
+                    finished(base, process_image_set(base, row_data, path_output, spec))
+                except Exception as error:
+                    finished(base, error=error)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = {
+                    executor.submit(process_image_set, base, row_data, path_output, spec): base
+                    for base, row_data in list_todo
+                }
+                for future in as_completed(futures):
+                    try:
+                        finished(futures[future], future.result())
+                    except Exception as error:
+                        finished(futures[future], error=error)
+
+    seconds = time.perf_counter() - time_start
+    print(
+        f"{len(list_completed)} sets ({n_rois} rois) in {seconds:.1f} s | "
+        f"{len(list_completed) / max(seconds, 1e-9):.2f} sets/s, "
+        f"{n_rois / max(seconds, 1e-9):.0f} rois/s | "
+        f"{len(list_skipped)} skipped, {len(list_failed)} failed"
+    )
+    return PipelineSummary(
+        completed=list_completed,
+        skipped=list_skipped,
+        failed=list_failed,
+        n_rois=n_rois,
+        seconds=seconds,
+    )
+
+
+def collect_features(path_output, path_csv=None, manifest=None):
+    """
+    Concatenates the feature partitions of a pipeline output into one table.
+    Only partitions of the image sets of manifest, or of the sets recorded in
+    path_output/pipeline.sqlite, are read, so stale partitions of sets
+    removed from the dataset are left out.
+
+    Parameters
+    ----------
+    path_output : str or Path
+        output directory of run_omi_pipeline.
+    path_csv : str or Path, optional
+        if given the table is also saved to this csv. The default is None.
+    manifest : pd.DataFrame or str or Path, optional
+        manifest of the image sets to collect. The default is None, every
+        set recorded in the pipeline state.
+
+    Returns
+    -------
+    pd.DataFrame
+        features of every roi indexed by f"{base}_{label}".
+    """
+    if manifest is None:
+        with PipelineState(Path(path_output) / "pipeline.sqlite") as state:
+            list_bases = state.bases()
+    else:
+        df_manifest = manifest if isinstance(manifest, pd.DataFrame) else load_manifest(manifest)
+        list_bases = sorted(df_manifest.index)
+    list_paths = [partition_path(path_output, base) for base in list_bases]
+    list_df = [pd.read_csv(path, index_col="base_name", dtype={"base_name": str, "base": str})
+               for path in list_paths if path.exists()]
+    df_features = pd.concat(list_df) if len(list_df) != 0 else pd.DataFrame()
+    if path_csv is not None:
+        df_features.to_csv(path_csv)
+    return df_features
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+import cell_analysis_tools
+
+
+def spec_hash(spec):
+    """
+    Hash of a feature spec and the library version, results computed with a
+    different spec or version are out of date.
+
+    Parameters
+    ----------
+    spec : dict
+        feature spec, see feature_spec.
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+    """
+    payload = {"spec": spec, "version": cell_analysis_tools.__version__}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _hash_file_contents(path, chunk_size=2 ** 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PipelineState:
+    """
+    Small sqlite database next to the pipeline output recording, per image
+    set, the hash of its input files and of the feature spec it was computed
+    with. File hashes are cached by (path, size, modification time) so
+    unchanged files are not read again on every run.
+
+    Parameters
+    ----------
+    path_db : str or Path
+        sqlite file, created if it doesn't exist.
+
+    .. code-block:: python
+
+        with PipelineState(path_output / "pipeline.sqlite") as state:
+            input_hash = state.input_hash(row_data)
+            if not state.is_current(base, input_hash, spec_hash(spec)):
+                ...  # recompute the image set
+                state.record(base, input_hash, spec_hash(spec))
+
+    """
+
+    def __init__(self, path_db):
+        self.path_db = Path(path_db)
+        self.connection = sqlite3.connect(self.path_db)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT
+            );
+            CREATE TABLE IF NOT EXISTS image_sets (
+                base TEXT PRIMARY KEY, input_hash TEXT, spec_hash TEXT
+            );
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def file_hash(self, path):
+        """ sha256 of the file contents, read only if the file changed since last hashed """
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        row = self.connection.execute(
+            "SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        digest = _hash_file_contents(path)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, digest),
+        )
+        self.connection.commit()
+        return digest
+
+    def input_hash(self, row_data):
+        """ hash of every input file of a manifest row (mask, photons, a1 ... t2, chi) """
+        digest = hashlib.sha256()
+        for key, path in sorted(dict(row_data).items()):
+            if path is None or path == "" or (isinstance(path, float) and path != path):
+                continue
+            digest.update(f"{key}:{self.file_hash(path)};".encode())
+        return digest.hexdigest()
+
+    def is_current(self, base, input_hash, spec_hash):
+        """ whether base was recorded with the same input and spec hashes """
+        row = self.connection.execute(
+            "SELECT input_hash, spec_hash FROM image_sets WHERE base = ?", (base,)
+        ).fetchone()
+        return row == (input_hash, spec_hash)
+
+    def record(self, base, input_hash, spec_hash):
+        """ marks base as computed from these inputs and spec """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO image_sets VALUES (?, ?, ?)",
+            (base, input_hash, spec_hash),
+        )
+        self.connection.commit()
+
+    def bases(self):
+        """ sorted base names of every recorded image set """
+        rows = self.connection.execute("SELECT base FROM image_sets ORDER BY base").fetchall()
+        return [row[0] for row in rows]
+
+    def forget(self, base):
+        """ removes the record of base so it is recomputed """
+        self.connection.execute("DELETE FROM image_sets WHERE base = ?", (base,))
+        self.connection.commit()
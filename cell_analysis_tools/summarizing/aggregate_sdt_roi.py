@@ -1,5 +1,7 @@
 import numpy as np
 
+from cell_analysis_tools.flim.aggregate_roi_decays import aggregate_roi_decays
+
 
 def aggregate_sdt_roi(mask, sdt_cube, debug=False):
 
@@ -11,8 +13,9 @@ def aggregate_sdt_roi(mask, sdt_cube, debug=False):
     ----------
     mask : ndarray
         2d array of labeled rois.
-    sdt_cube : ndarray
-        3d array of photons x,y,t.
+    sdt_cube : ndarray or iterable
+        3d array of photons x,y,t or (row_start, block) chunks
+        from cell_analysis_tools.io.iter_sdt_rows.
     debug : bool, optional
         Show debugging output. The default is False.
 
@@ -20,32 +23,11 @@ def aggregate_sdt_roi(mask, sdt_cube, debug=False):
     -------
     list_decays : list
         list of aggregate decays for each roi.
-    list_roi_values : TYPE
+    list_roi_values : ndarray
         roi value from the given mask.
 
     """
-    list_roi_values = np.unique(mask)
-    list_roi_values = np.delete(
-        list_roi_values, np.where(list_roi_values == 0)
-    )  # exclude bg
-
-    # store decays
-    list_decays = []
-    # ITERATE THROUGH ROI's
-    for roi_idx, roi_value in enumerate(list_roi_values):
-        if debug:
-            print(f"processing roi {roi_idx+1}/{len(list_roi_values)}")
-        pass
-
-        # CREATE MASK OF ROI
-        m_roi = (mask == roi_value).astype(int)
-
-        #################
-        # AGGREGATE DECAY
-        masked_sdt_data = (
-            sdt_cube * m_roi[..., np.newaxis]
-        )  # mask out rest of pixels/decays
-        decay = masked_sdt_data.sum(axis=(0, 1))  # sum over x and y, leave t alone
-        list_decays.append(decay)
-
-        return list_decays, list_roi_values
+    decays, list_roi_values = aggregate_roi_decays(mask, sdt_cube, debug=debug)
+    list_decays = list(decays)
+
+    return list_decays, list_roi_values
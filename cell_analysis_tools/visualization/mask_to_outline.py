@@ -15,9 +15,10 @@ from skimage.draw import polygon_perimeter
 import numpy as np
 
 import cell_analysis_tools as cat
+from cell_analysis_tools.image_processing.sparse_label_index import as_label_index
 
 #%%
-def mask_to_outlines(mask, im = None, binary_mask=False, debug=False):
+def mask_to_outlines(mask, im = None, binary_mask=False, label_index=None, debug=False):
     """
     Creates an outline of regions based on the input labels mask.
 
@@ -29,6 +30,8 @@ def mask_to_outlines(mask, im = None, binary_mask=False, debug=False):
         DESCRIPTION. The default is None.
     binary_mask : bool, optional
         Determine if returned array should be boolean. The default is False.
+    label_index : LabelIndex, optional
+        precomputed index of mask. The default is None.
     debug : TYPE, optional
         Displays intermediate images/masks for debugging. The default is False.
 
@@ -50,13 +53,16 @@ def mask_to_outlines(mask, im = None, binary_mask=False, debug=False):
     mask_outline = np.zeros_like(mask)
     
     
-    for idx, label in enumerate(np.unique(mask)[1:]): # skip bg mask
+    label_index = as_label_index(mask, label_index)
+    for idx, label in enumerate(label_index.labels): # skip bg mask
         pass
-        one_roi = (mask == label)
+        # contours of the roi cropped with a one pixel background border
+        one_roi, slices = label_index.crop(label, padding=1)
         contours = find_contours(one_roi)
     
         # plot over figure
         for contour in contours:
+            contour = contour + [slices[0].start, slices[1].start]
             if debug:
                 ax.plot(contour[:, 1], contour[:, 0], linewidth=1)
         
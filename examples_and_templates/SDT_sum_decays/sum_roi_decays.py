@@ -10,6 +10,8 @@ import tifffile
 
 from natsort import natsorted
 from cell_analysis_tools.visualization import compare_images
+from cell_analysis_tools.flim import aggregate_roi_decays
+from cell_analysis_tools.image_processing import LabelIndex
 
 from sdt_read.read_bruker_sdt import read_sdt150
 from sdt_read.read_wiscscan_sdt import read_sdt_wiscscan
@@ -61,38 +63,25 @@ for idx, path_sdt in tqdm(enumerate(list_path_sdts[:])):
     if debug:
         compare_images('sdt', im.sum(axis=2), "mask", labels)
     
-    # placeholder array
-    sdt_decay_summed = np.zeros_like(im) 
-
-    # iterate through labels
-    list_labels = [l for l in np.unique(labels) if l != 0]
-    for label in list_labels:
-        pass
-        mask_label = labels == label 
-        
-        decay_roi = im * mask_label[...,np.newaxis] # mask decays
-        
-        decay_summed = decay_roi.sum(axis=(0,1)) 
-        
-        if debug:
+    # sum the decays of all labels in one pass
+    label_index = LabelIndex(labels)
+    decays, list_labels = aggregate_roi_decays(labels, im, label_index=label_index)
+
+    # placeholder array, row 0 of the lookup table is background
+    decays_lut = np.zeros((len(list_labels) + 1, im.shape[2]), dtype=im.dtype)
+    decays_lut[1:] = decays
+    label_idx = label_index.compact()
+    sdt_decay_summed = decays_lut[label_idx]
 
+    if debug:
+        for label, decay_summed in zip(list_labels, decays):
             fig, ax = plt.subplots(1,2, figsize=(10,5))
             fig.suptitle(f"{path_sdt.name} | label: {label}")
-            ax[0].imshow(decay_roi.sum(axis=2))
+            ax[0].imshow(im.sum(axis=2) * (labels == label))
             ax[0].set_aspect('equal')
             ax[1].plot(decay_summed)
             plt.show()
-            # ax[1].set_aspect('equal')
 
-            # plt.title(f"{path_sdt.name} | label: {label}")
-            # plt.imshow(decay_roi.sum(axis=2))
-            # plt.show()
-            
-            # plt.title(f"label: {label}")
-            # plt.plot(decay_summed)
-            # plt.show()
-        
-        sdt_decay_summed[mask_label] = decay_summed[np.newaxis, np.newaxis,:]
         
         # test 512x512x256
         # temp_array = np.zeros((512,512,256))
@@ -0,0 +1,85 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from cell_analysis_tools.flim import (aggregate_roi_decays,
+                                      bin_image,
+                                      phasor_calculator,
+                                      phasor_median_filter,
+                                      regionprops_omi
+                                      )
+from cell_analysis_tools.flim.simulate import (simulate_flim_image,
+                                               simulate_label_image,
+                                               simulate_omi_images
+                                               )
+from cell_analysis_tools.io import load_sdt_file
+
+#%% Inputs
+'''
+Benchmarks the main FLIM code paths on synthetic data so timings are
+reproducible on any machine. Adjust sizes and repeats here.
+'''
+image_size = 256
+n_timebins = 256
+n_rois = 300
+n_repeats = 3
+seed = 0
+
+#%% generate data
+
+label_image = simulate_label_image((image_size, image_size), n_rois=n_rois, radius=(4, 10), seed=seed)
+sim = simulate_flim_image(label_image,
+                          lifetimes=[0.4e-9, 2.5e-9],
+                          amplitudes=[0.7, 0.3],
+                          photons=200,
+                          n_timebins=n_timebins,
+                          background=5,
+                          seed=seed)
+omi_images = simulate_omi_images(label_image, seed=seed)
+
+#%% benchmarks
+
+def _time(func, n_repeats=n_repeats):
+    """ returns the fastest of n_repeats calls in seconds """
+    list_times = []
+    for _ in range(n_repeats):
+        tic = perf_counter()
+        func()
+        list_times.append(perf_counter() - tic)
+    return min(list_times)
+
+
+results = {}
+with TemporaryDirectory() as tempdir:
+    # sdt files are zip archives with a single uint16 data block (c, x, y, t)
+    path_sdt = Path(tempdir) / "simulated.sdt"
+    with zipfile.ZipFile(path_sdt, "w") as myzip:
+        myzip.writestr("data_block", sim.cube.astype(np.uint16)[np.newaxis].tobytes())
+    results["load_sdt_file"] = _time(lambda: load_sdt_file(path_sdt))
+
+results["cube.sum"] = _time(lambda: sim.cube.sum(axis=(0, 1)))
+results["aggregate_roi_decays"] = _time(lambda: aggregate_roi_decays(label_image, sim.cube))
+
+results["bin_image"] = _time(lambda: bin_image(sim.cube[:64, :64], 2), n_repeats=1)
+
+f = 80e6
+results["phasor_calculator"] = _time(
+    lambda: phasor_calculator(f, sim.timebins, sim.cube, sim.irf))
+
+_, _, g, s = phasor_calculator(f, sim.timebins, sim.cube, sim.irf)
+g = g.reshape(label_image.shape)
+s = s.reshape(label_image.shape)
+results["phasor_median_filter"] = _time(
+    lambda: phasor_median_filter(g, s, repeats=3, mask=label_image > 0))
+
+results["regionprops_omi"] = _time(
+    lambda: regionprops_omi("benchmark", label_image, **omi_images), n_repeats=1)
+
+df_results = pd.DataFrame({"seconds": results})
+df_results.index.name = "function"
+print(f"image: {image_size}x{image_size}x{n_timebins} | rois: {len(np.unique(label_image)) - 1}")
+print(df_results)
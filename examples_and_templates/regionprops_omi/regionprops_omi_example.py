@@ -21,7 +21,7 @@ from tqdm import tqdm
 
 import cell_analysis_tools as cat
 from cell_analysis_tools.flim import regionprops_omi
-from cell_analysis_tools.io import load_image
+from cell_analysis_tools.io import load_image, read_features, write_features
 from natsort import natsorted
 
 mpl.rcParams["figure.dpi"] = 300
@@ -483,8 +483,8 @@ if __name__ == "__main__":
                 other_props=['area', 'perimeter', 'solidity', 'eccentricity', 'axis_major_length', 'axis_minor_length']
             )
 
-            ## create dataframe
-            df = pd.DataFrame(omi_props).transpose()
+            ## create dataframe, columns keep their numeric dtypes
+            df = pd.DataFrame.from_dict(omi_props, orient="index")
             df.index.name = "base_name"
 
             ## add other dictionary data to df
@@ -497,21 +497,22 @@ if __name__ == "__main__":
                 path_output / "features" / f"features_{base_name}_{analysis_type}.csv"
             )
 
+            # or append to a parquet feature store partitioned by metadata (requires pyarrow)
+            # write_features(df.reset_index(), path_output / "feature_store",
+            #                image_id=f"{base_name}_{analysis_type}",
+            #                partition_cols=["experiment", "dish", "treatment"])
+            # later read only what's needed:
+            # read_features(path_output / "feature_store", columns=["base_name", "redox_ratio_mean"],
+            #               filters=[("treatment", "==", "2DG")])
+
     #%% Aggregates all features into a single dataframe
 
     path_output_props = path_output / "summary"
     list_path_features_csv = list((path_output / "features").glob("*.csv"))
 
-    df_all_props = None
-    for path_feat_csv in tqdm(list_path_features_csv):
-        pass
-        # initialize first df entry else append to running df
-        df_omi = pd.read_csv(path_feat_csv)
-        df_all_props = (
-            df_omi
-            if df_all_props is None
-            else pd.concat([df_all_props, df_omi], ignore_index=True)
-        )
+    # concatenate once, appending to a running df copies it for every file
+    list_df_omi = [pd.read_csv(path_feat_csv) for path_feat_csv in tqdm(list_path_features_csv)]
+    df_all_props = pd.concat(list_df_omi, ignore_index=True)
 
     # label index of complete dictionary
     df_all_props = df_all_props.set_index("base_name", drop=True)
@@ -6,14 +6,36 @@ Created on Thu Oct 27 11:05:27 2022
 @author: nabiki
 """
 
+import zipfile
+
 import numpy as np
 import matplotlib.pylab as plt
 import matplotlib as mpl
 mpl.rcParams['figure.dpi'] = 300
+from numpy.lib.stride_tricks import sliding_window_view
 
 
-from cell_analysis_tools.flim import (bin_image
+from cell_analysis_tools.flim import (aggregate_roi_decays,
+                                      bin_image,
+                                      phasor_median_filter,
+                                      phasor_wavelet_filter,
+                                      phasor_calculator,
+                                      roi_phasor_table,
+                                      flim_time_series,
+                                      regionprops_omi,
+                                      omi_features,
+                                      omi_feature_names,
+                                      omi_feature_table,
+                                      FeatureTable,
+                                      FeatureTableAccumulator,
+                                      DerivedImageCache
                                       )
+from cell_analysis_tools.flim.simulate import (simulate_flim_image,
+                                               simulate_label_image,
+                                               simulate_omi_images
+                                               )
+from cell_analysis_tools.image_processing import LabelIndex
+from cell_analysis_tools.io import iter_sdt_rows
 
 class TestFLIM:
     
@@ -29,6 +51,273 @@ class TestFLIM:
         im_binned = bin_image(self.im, 2)
         plt.imshow(im_binned.sum(axis=2))
         plt.show()
+
+    def test_phasor_median_filter(self):
+        g = self.default_rng.random((64, 64))
+        s = self.default_rng.random((64, 64))
+        mask = np.ones(g.shape, dtype=bool)
+        mask[10:20, 30:40] = False
+
+        g_filtered, s_filtered = phasor_median_filter(g, s, repeats=1, mask=mask)
+
+        # nan aware median of each 3x3 window, masked pixels excluded
+        g_masked = np.where(mask, g, np.nan)
+        windows = sliding_window_view(
+            np.pad(g_masked, 1, constant_values=np.nan), (3, 3)
+        )
+        g_expected = np.nanmedian(windows, axis=(-2, -1))
+        g_expected[~mask] = np.nan
+        assert np.allclose(g_filtered, g_expected, equal_nan=True)
+
+        # stacks are filtered image by image
+        g_stack, s_stack = phasor_median_filter(
+            np.stack([g, g]), np.stack([s, s]), repeats=1, mask=mask
+        )
+        assert np.allclose(g_stack[1], g_filtered, equal_nan=True)
+        assert np.allclose(s_stack[0], s_filtered, equal_nan=True)
+
+    def test_phasor_wavelet_filter(self):
+        g = np.full((64, 64), 0.6) + self.default_rng.normal(0, 0.05, (64, 64))
+        s = np.full((64, 64), 0.3) + self.default_rng.normal(0, 0.05, (64, 64))
+        mask = np.ones(g.shape, dtype=bool)
+        mask[:5] = False
+
+        g_filtered, s_filtered = phasor_wavelet_filter(g, s, mask=mask)
+        assert np.isnan(g_filtered[:5]).all()
+        assert np.nanstd(g_filtered) < np.std(g[mask])
+        assert abs(np.nanmean(s_filtered) - 0.3) < 0.01
+
+    def test_simulate_flim_image(self):
+        label_image = simulate_label_image((64, 64), n_rois=5, seed=0)
+        sim = simulate_flim_image(label_image, lifetimes=[2e-9], photons=2000, seed=0)
+        sim_repeat = simulate_flim_image(label_image, lifetimes=[2e-9], photons=2000, seed=0)
+        assert sim.cube.shape == (64, 64, 256)
+        assert np.array_equal(sim.cube, sim_repeat.cube)
+        assert sim.cube[label_image == 0].sum() == 0
+
+        # irf calibrated phasor of a single exponential lies on the semicircle
+        f = 80e6
+        w = 2 * np.pi * f
+        _, _, g, s = phasor_calculator(f, sim.timebins, sim.cube.sum(axis=(0, 1)), sim.irf)
+        assert abs(g[0] - 1 / (1 + (w * 2e-9) ** 2)) < 0.02
+        assert abs(s[0] - (w * 2e-9) / (1 + (w * 2e-9) ** 2)) < 0.02
+
+    def test_aggregate_roi_decays(self, tmp_path):
+        label_image = simulate_label_image((256, 256), n_rois=40, seed=2)
+        sim = simulate_flim_image(label_image, lifetimes=[1e-9], photons=50,
+                                  background=10, seed=2)
+        decays, labels = aggregate_roi_decays(label_image, sim.cube)
+        assert decays.shape == (len(labels), 256)
+        for label, decay in zip(labels[::7], decays[::7]):
+            assert np.allclose(decay, sim.cube[label_image == label].sum(axis=0))
+
+        # streaming the same cube from an sdt file in blocks of rows
+        path_sdt = tmp_path / "roi_decays.sdt"
+        with zipfile.ZipFile(path_sdt, "w") as myzip:
+            myzip.writestr("data_block", sim.cube.astype(np.uint16)[np.newaxis].tobytes())
+        decays_streamed, _ = aggregate_roi_decays(
+            label_image, iter_sdt_rows(path_sdt, n_rows=50)
+        )
+        assert np.array_equal(decays_streamed, decays)
+
+    def test_roi_phasor_table(self):
+        label_image = simulate_label_image((128, 128), n_rois=12, seed=3)
+        n_labels = len(np.unique(label_image)) - 1
+        lifetimes = np.linspace(0.5e-9, 4e-9, n_labels)[:, np.newaxis]
+        sim = simulate_flim_image(label_image, lifetimes=lifetimes, photons=3000, seed=3)
+        f = 80e6
+        df = roi_phasor_table(label_image, sim.cube, sim.irf, f,
+                              timebins=sim.timebins, harmonics=(1, 2), image_id="sim")
+        assert len(df) == n_labels
+        assert df.index[0] == f"sim_{df['mask_label'].iloc[0]}"
+
+        # single exponentials: phase and modulation lifetimes match
+        assert np.allclose(df["tau_phi"], lifetimes[:, 0], rtol=0.05)
+        assert np.allclose(df["tau_m"], lifetimes[:, 0], rtol=0.05)
+        assert np.allclose(df["tau_phi_h2"], lifetimes[:, 0], rtol=0.05)
+
+        # same phasors as phasor_calculator on each summed decay
+        label = df["mask_label"].iloc[4]
+        decay = sim.cube[label_image == label].sum(axis=0)
+        _, _, g, s = phasor_calculator(f, sim.timebins, decay, sim.irf)
+        assert np.isclose(df["g"].iloc[4], g[0])
+        assert np.isclose(df["s"].iloc[4], s[0])
+        assert df["photons"].iloc[4] == decay.sum()
+
+    def test_flim_time_series(self):
+        label_image = simulate_label_image((64, 64), n_rois=5, seed=4)
+        frames = [simulate_flim_image(label_image, lifetimes=[2e-9], photons=50,
+                                      seed=seed) for seed in range(5)]
+        cubes = [frame.cube for frame in frames]
+        f = 80e6
+        timebins, irf = frames[0].timebins, frames[0].irf
+
+        # windowed sums match recomputing the last frames from scratch
+        results = list(flim_time_series(iter(cubes), f, timebins, irf,
+                                        label_image=label_image, window=2,
+                                        keep_cube=True))
+        assert [result.frame for result in results] == list(range(5))
+        cube_window = cubes[3] + cubes[4]
+        assert np.allclose(results[-1].cube, cube_window)
+        assert np.allclose(results[-1].intensity, cube_window.sum(axis=2))
+        decays, _ = aggregate_roi_decays(label_image, cube_window)
+        assert np.allclose(results[-1].roi_decays, decays)
+
+        _, _, g, s = phasor_calculator(f, timebins, decays, irf)
+        assert np.allclose(results[-1].roi_g, g)
+        assert np.allclose(results[-1].roi_s, s)
+
+        # a precomputed label index is reused for the roi sums
+        index = LabelIndex(label_image)
+        results_index = list(flim_time_series(iter(cubes), f, timebins, irf,
+                                              label_image=label_image, window=2,
+                                              label_index=index))
+        assert np.array_equal(results_index[-1].roi_decays, results[-1].roi_decays)
+        assert results_index[-1].labels is index.labels
+
+        # running totals include every frame
+        results = list(flim_time_series(iter(cubes), f, timebins, irf))
+        assert np.allclose(results[-1].intensity, np.sum(cubes, axis=0).sum(axis=2))
+        assert results[-1].roi_decays is None
+
+    def test_regionprops_omi(self):
+        label_image = simulate_label_image((64, 64), n_rois=6, seed=5)
+        images = simulate_omi_images(label_image, seed=5)
+        dict_omi = regionprops_omi("sim", label_image, **images)
+
+        labels = np.unique(label_image)[1:]
+        assert list(dict_omi) == [f"sim_{label}" for label in labels]
+        roi = dict_omi[f"sim_{labels[0]}"]
+        assert list(roi)[:5] == ["mask_label", "nadh_intensity_mean", "nadh_intensity_stdev",
+                                 "nadh_a1_mean", "nadh_a1_stdev"]
+        assert roi["fad_chi_median"] == np.median(images["im_fad_chi"][label_image == labels[0]])
+
+        mask = label_image == labels[0]
+        redox_ratio = images["im_nadh_intensity"][mask] / images["im_fad_intensity"][mask]
+        assert np.isclose(roi["redox_ratio_mean"], redox_ratio.mean())
+        assert np.isclose(roi["redox_ratio_stdev"], redox_ratio.std())
+        nadh_t1 = images["im_nadh_t1"][mask]
+        nadh_intensity = images["im_nadh_intensity"][mask]
+        assert np.isclose(roi["nadh_t1_intensity_weighted_mean"],
+                          np.average(nadh_t1, weights=nadh_intensity))
+
+        dict_quantiles = regionprops_omi("sim", label_image, **images, quantiles=[0.1, 0.9])
+        roi = dict_quantiles[f"sim_{labels[0]}"]
+        assert np.isclose(roi["nadh_t1_p10"], np.quantile(nadh_t1, 0.1))
+        assert np.isclose(roi["flirr_p90"], np.quantile(
+            images["im_nadh_a2"][mask] / images["im_fad_a1"][mask], 0.9))
+
+    def test_omi_features(self):
+        label_image = simulate_label_image((64, 64), n_rois=6, seed=6)
+        images = {key.replace("im_", "", 1): im
+                  for key, im in simulate_omi_images(label_image, seed=6).items()}
+        images["stain_intensity"] = images["nadh_intensity"] * 2
+
+        # same features as regionprops_omi when every parameter is requested
+        dict_legacy = regionprops_omi("sim", label_image,
+                                      **{f"im_{key}": im for key, im in images.items()
+                                         if not key.startswith("stain")})
+        dict_omi = omi_features("sim", label_image, images)
+        roi = dict_omi["sim_1"]
+        for key, value in dict_legacy["sim_1"].items():
+            assert np.isclose(roi[key], value, equal_nan=True)
+        assert "stain_intensity_mean" in roi
+        assert list(roi) == omi_feature_names(images)
+
+        # only images needed by the requested parameters are loaded
+        list_loaded = []
+        def loader(key):
+            def load():
+                list_loaded.append(key)
+                return images[key]
+            return load
+        lazy_images = {key: loader(key) for key in images}
+        dict_omi = omi_features("sim", label_image, lazy_images,
+                                parameters=["redox_ratio"], statistics=["mean"])
+        assert sorted(list_loaded) == ["fad_intensity", "nadh_intensity"]
+        assert list(dict_omi["sim_1"]) == ["mask_label", "redox_ratio_mean"]
+
+    def test_omi_feature_table(self):
+        label_image = simulate_label_image((64, 64), n_rois=6, seed=7)
+        images = {key.replace("im_", "", 1): im
+                  for key, im in simulate_omi_images(label_image, seed=7).items()}
+
+        # same values as the nested dictionary
+        table = omi_feature_table("sim", label_image, images, other_props=["area"])
+        dict_omi = omi_features("sim", label_image, images, other_props=["area"])
+        assert table.column_names == ["image_id"] + omi_feature_names(images, other_props=["area"])
+        assert table["nadh_t1_mean"].dtype == np.float64
+        for key, dict_roi in table.to_dict().items():
+            for feature, value in dict_roi.items():
+                assert np.isclose(dict_omi[key][feature], value, equal_nan=True)
+
+        # dataframe shares memory with the table
+        df = table.to_pandas(index_name="base_name")
+        assert np.shares_memory(df["nadh_t1_mean"].to_numpy(), table["nadh_t1_mean"])
+        assert df.index[0] == f"sim_{table['mask_label'][0]}"
+
+        # accumulate tables with different columns
+        accumulator = FeatureTableAccumulator(capacity=2)
+        accumulator.append(table)
+        accumulator.append(omi_feature_table("other", label_image, images,
+                                             parameters=["redox_ratio"]))
+        stacked = accumulator.to_table()
+        assert len(stacked) == 2 * len(table)
+        assert np.array_equal(stacked["redox_ratio_mean"][len(table):],
+                              table["redox_ratio_mean"])
+        assert np.all(np.isnan(stacked["nadh_t1_mean"][len(table):]))
+        assert list(stacked["image_id"][[0, -1]]) == ["sim", "other"]
+
+        # int columns keep their dtype, missing ints are nullable
+        assert stacked["mask_label"].dtype == np.int64
+        assert stacked.to_pandas(index_name="base_name").index[0] == f"sim_{table['mask_label'][0]}"
+
+        accumulator = FeatureTableAccumulator(capacity=1)
+        accumulator.append(FeatureTable({"image_id": ["base"], "mask_label": np.array([1]),
+                                         "n_nuclei": np.array([2], dtype=np.uint8)}))
+        accumulator.append(FeatureTable({"image_id": ["base"], "mask_label": np.array([2])}))
+        df = accumulator.to_table().to_pandas(index_name="base_name")
+        assert df["mask_label"].dtype == np.int64
+        assert list(df.index) == ["base_1", "base_2"]
+        assert str(df["n_nuclei"].dtype) == "UInt8"
+        assert df["n_nuclei"].iloc[0] == 2 and df["n_nuclei"].isna().iloc[1]
+
+        # wider floats promote the buffer instead of being truncated
+        accumulator = FeatureTableAccumulator()
+        accumulator.append(FeatureTable({"x": np.array([1.5], dtype=np.float32)}))
+        accumulator.append(FeatureTable({"x": np.array([1.0000001234567])}))
+        column = accumulator.to_table()["x"]
+        assert column.dtype == np.float64
+        assert list(column) == [1.5, 1.0000001234567]
+
+    def test_derived_image_cache(self):
+        label_image = simulate_label_image((64, 64), n_rois=6, seed=8)
+        images = {key.replace("im_", "", 1): im
+                  for key, im in simulate_omi_images(label_image, seed=8).items()}
+        masks = [label_image, label_image * (label_image % 2 == 0), label_image[::-1]]
+
+        # every derived image is computed once across the masks
+        cache = DerivedImageCache()
+        for mask in masks:
+            dict_cached = omi_features("sim", mask, images, cache=cache)
+            dict_omi = omi_features("sim", mask, images)
+            for key, dict_roi in dict_omi.items():
+                for feature, value in dict_roi.items():
+                    assert np.isclose(dict_cached[key][feature], value, equal_nan=True)
+        n_derived = 5  # nadh/fad tau_mean, redox_ratio, redox_ratio_norm, flirr
+        assert (cache.misses, cache.hits) == (n_derived, 2 * n_derived)
+
+        # reloaded images hit when keyed on content
+        cache = DerivedImageCache(by_content=True)
+        for _ in range(2):
+            omi_features("sim", label_image, {k: im.copy() for k, im in images.items()},
+                         parameters=["redox_ratio"], cache=cache)
+        assert (cache.misses, cache.hits) == (1, 1)
+
+        # memory stays within budget
+        cache = DerivedImageCache(max_bytes=2 * images["nadh_intensity"].nbytes)
+        omi_features("sim", label_image, images, cache=cache)
+        assert cache.nbytes <= cache.max_bytes and len(cache) <= 2
         
 
 if __name__ == "__main__":
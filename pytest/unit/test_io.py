@@ -0,0 +1,56 @@
+import importlib.util
+
+import numpy as np
+import pytest
+
+from cell_analysis_tools.flim import omi_feature_table
+from cell_analysis_tools.flim.simulate import (simulate_label_image,
+                                               simulate_omi_images)
+from cell_analysis_tools.io import read_features, write_features
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class TestFeatureStore:
+
+    label_image = simulate_label_image((64, 64), n_rois=5, seed=0)
+    images = {key.replace("im_", "", 1): im
+              for key, im in simulate_omi_images(label_image, seed=0).items()}
+
+    @pytest.mark.skipif(HAS_PYARROW, reason="pyarrow is installed")
+    def test_missing_pyarrow(self, tmp_path):
+        table = omi_feature_table("sim", self.label_image, self.images)
+        with pytest.raises(ImportError, match="pyarrow"):
+            write_features(table, tmp_path, "sim")
+
+    def test_write_read_features(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        path_store = tmp_path / "store"
+        for idx, treatment in enumerate(["control", "2DG", "2DG"]):
+            table = omi_feature_table(f"image{idx}", self.label_image, self.images)
+            write_features(table, path_store, f"image{idx}",
+                           metadata={"treatment": treatment, "dish": idx},
+                           partition_cols=["treatment"])
+        assert (path_store / "treatment=2DG").is_dir()
+
+        # projection and partition filter
+        df = read_features(path_store, columns=["image_id", "redox_ratio_mean"],
+                           filters=[("treatment", "==", "2DG")])
+        assert list(df.columns) == ["image_id", "redox_ratio_mean"]
+        assert sorted(set(df["image_id"])) == ["image1", "image2"]
+        assert np.allclose(df["redox_ratio_mean"][: len(table)], table["redox_ratio_mean"])
+
+        # rewriting an image replaces its rows
+        write_features(table, path_store, "image2",
+                       metadata={"treatment": "2DG", "dish": 2}, partition_cols=["treatment"])
+        df = read_features(path_store, filters=[("dish", "==", 2)])
+        assert len(df) == len(table)
+
+        # rewriting under a new partition value removes the old partition's rows
+        write_features(table, path_store, "image2",
+                       metadata={"treatment": "control", "dish": 2}, partition_cols=["treatment"])
+        df = read_features(path_store, filters=[("dish", "==", 2)])
+        assert len(df) == len(table)
+        assert set(df["treatment"]) == {"control"}
+        assert (path_store / "_image_files" / "image2.txt").read_text() == "treatment=control/image2-0.parquet\n"
+        assert len(read_features(path_store, filters=[("image_id", "==", "image1")])) == len(table)
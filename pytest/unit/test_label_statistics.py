@@ -0,0 +1,157 @@
+import matplotlib as mpl
+import numpy as np
+import numpy.ma as ma
+
+from cell_analysis_tools.flim.simulate import simulate_label_image
+from skimage.measure import label, regionprops
+
+from cell_analysis_tools.image_processing import (LabelIndex,
+                                                 label_centroids,
+                                                 four_color_theorem,
+                                                 four_color_to_unique,
+                                                 greedy_coloring,
+                                                 label_quantiles,
+                                                 label_statistics,
+                                                 label_weighted_statistics,
+                                                 region_adjacency_graph)
+from skimage.morphology import dilation, disk
+
+mpl.rcParams["figure.dpi"] = 300
+
+
+class TestLabelStatistics:
+
+    default_rng = np.random.default_rng(seed=0)
+    label_image = simulate_label_image((128, 128), n_rois=20, seed=0)
+    images = default_rng.random((3, 128, 128)) * 100
+
+    def test_label_statistics(self):
+        stats = label_statistics(self.label_image, self.images)
+        assert np.array_equal(stats.labels, np.unique(self.label_image)[1:])
+        assert stats.mean.shape == (3, len(stats.labels))
+
+        for idx_label, label in enumerate(stats.labels):
+            values = self.images[1][self.label_image == label]
+            assert stats.count[1, idx_label] == values.size
+            assert np.isclose(stats.sum[1, idx_label], values.sum())
+            assert np.isclose(stats.sum_squares[1, idx_label], np.sum(values ** 2))
+            assert np.isclose(stats.mean[1, idx_label], values.mean())
+            assert np.isclose(stats.stdev[1, idx_label], values.std())
+
+        # a single image returns one value per label
+        stats_single = label_statistics(self.label_image, self.images[2])
+        assert np.allclose(stats_single.mean, stats.mean[2])
+
+    def test_label_statistics_masked(self):
+        # masked pixels are excluded, a fully masked label has no mean
+        label = self.label_image.max()
+        mask = self.images[0] > 80
+        mask[self.label_image == label] = True
+        image = ma.masked_array(self.images[0], mask=mask)
+        stats = label_statistics(self.label_image, [image])
+
+        values = self.images[0][(self.label_image == 1) & ~mask]
+        assert np.isclose(stats.mean[0, 0], values.mean())
+        assert np.isclose(stats.stdev[0, 0], values.std())
+        assert stats.count[0, -1] == 0
+        assert np.isnan(stats.mean[0, -1])
+
+    def test_label_weighted_statistics(self):
+        weights = self.images[0].copy()
+        weights[self.label_image == 2] = 0
+        stats = label_weighted_statistics(self.label_image, self.images[1:], weights)
+        assert stats.mean.shape == (2, len(stats.labels))
+
+        mask = self.label_image == 1
+        mean = np.average(self.images[2][mask], weights=weights[mask])
+        variance = np.average((self.images[2][mask] - mean) ** 2, weights=weights[mask])
+        assert np.isclose(stats.mean[1, 0], mean)
+        assert np.isclose(stats.stdev[1, 0], np.sqrt(variance))
+
+        # labels without weight have no mean and zero stdev
+        assert np.isnan(stats.mean[0, 1])
+        assert stats.stdev[0, 1] == 0
+
+    def test_label_quantiles(self):
+        images = self.images.copy()
+        images[1][self.label_image == 3] = np.nan
+        result = label_quantiles(self.label_image, images, quantiles=[0.1, 0.5, 0.9])
+        assert result.values.shape == (3, len(result.labels), 3)
+
+        for idx_label, label in enumerate(result.labels[:5]):
+            values = images[0][self.label_image == label]
+            assert np.allclose(result.values[0, idx_label], np.quantile(values, [0.1, 0.5, 0.9]))
+
+        # labels with nan values have nan quantiles like np.quantile
+        assert np.isnan(result.values[1, 2]).all()
+
+
+class TestLabelIndex:
+
+    label_image = simulate_label_image((128, 128), n_rois=20, seed=1) * 7  # sparse label values
+
+    def test_label_index(self):
+        index = LabelIndex(self.label_image)
+        regions = regionprops(self.label_image)
+        assert np.array_equal(index.labels, [r.label for r in regions])
+        assert np.array_equal(index.areas, [r.area for r in regions])
+        assert np.array_equal(index.bboxes, [r.bbox for r in regions])
+        assert np.allclose(index.centroids(), [r.centroid for r in regions])
+        labels, centroids = label_centroids(self.label_image, label_index=index)
+        assert np.array_equal(labels, index.labels)
+        assert np.array_equal(centroids, index.centroids())
+        assert LabelIndex(np.zeros((4, 4), dtype=int)).centroids().shape == (0, 2)
+
+        label = index.labels[3]
+        assert np.array_equal(np.sort(index.pixels(label)),
+                              np.flatnonzero(self.label_image == label))
+        crop, slices = index.crop(label, padding=2)
+        assert np.array_equal(crop, self.label_image[slices] == label)
+        assert np.array_equal(index.compact(), index.relabel_map()[self.label_image])
+
+        # shared index gives the same statistics
+        image = np.random.default_rng(1).random(self.label_image.shape)
+        stats = label_statistics(self.label_image, image, label_index=index)
+        assert np.allclose(stats.mean, label_statistics(self.label_image, image).mean)
+
+
+class TestRegionAdjacency:
+
+    label_image = simulate_label_image((256, 256), n_rois=80, seed=1)
+
+    def test_region_adjacency_graph(self):
+        # neighbors within distance 3 are the labels under a disk(3) dilation
+        rag = region_adjacency_graph(self.label_image, distance=3)
+        for idx, label in enumerate(rag.labels):
+            dilated = dilation(self.label_image == label, disk(3))
+            neighbors = set(np.unique(self.label_image[dilated])) - {0, label}
+            assert neighbors == set(rag.labels[rag.adjacency[idx].indices])
+
+    def test_greedy_coloring(self):
+        adjacency = region_adjacency_graph(self.label_image, distance=3).adjacency.tocoo()
+        for strategy in ["largest_first", "dsatur"]:
+            colors = greedy_coloring(adjacency, strategy=strategy)
+            assert np.all(colors[adjacency.row] != colors[adjacency.col])
+            assert colors.max() < 6
+
+    def test_four_color_theorem(self):
+        four_color_mask, solution = four_color_theorem(self.label_image)
+        assert set(solution) == set(np.unique(self.label_image)[1:])
+        rag = region_adjacency_graph(self.label_image, distance=3)
+        adjacency = rag.adjacency.tocoo()
+        colors = np.array([solution[label] for label in rag.labels])
+        assert np.all(colors[adjacency.row] != colors[adjacency.col])
+        assert np.array_equal(four_color_mask == 0, self.label_image == 0)
+
+    def test_four_color_to_unique(self):
+        four_color_mask, _ = four_color_theorem(self.label_image)
+        mask_unique = four_color_to_unique(four_color_mask)
+
+        # every 4-connected roi piece gets back a unique value, numbered by centroid (row, col)
+        props = regionprops(mask_unique)
+        assert len(props) == label(self.label_image, connectivity=1).max()
+        assert [p.label for p in props] == list(range(1, len(props) + 1))
+        centroids = [p.centroid for p in props]
+        assert centroids == sorted(centroids)
+        for p in props:
+            assert len(np.unique(self.label_image[mask_unique == p.label])) == 1
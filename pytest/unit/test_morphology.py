@@ -0,0 +1,312 @@
+import math
+
+import numpy as np
+import numpy.ma as ma
+from scipy import ndimage
+from scipy.ndimage import find_objects
+from skimage.measure import regionprops as skimage_regionprops
+
+from cell_analysis_tools.flim.simulate import simulate_label_image
+from cell_analysis_tools.image_processing import (LabelIndex,
+                                                  region_adjacency_graph)
+from cell_analysis_tools.morphology import (fractal_dimension_binary,
+                                            fractal_dimension_binary_labels,
+                                            fractal_dimension_gray,
+                                            fractal_dimension_gray_labels,
+                                            label_intensity,
+                                            mitochondria_network_features,
+                                            neighborhood_features,
+                                            radius_features,
+                                            regionprops, regionprops_table,
+                                            track_labels, track_motion)
+from cell_analysis_tools.morphology.fractal_dimension.fractal_dim_gray import \
+    differential_box_counting
+from cell_analysis_tools.morphology.roi_distance import (radius_max,
+                                                         radius_mean,
+                                                         radius_median)
+
+
+def _box_counting_loop(im, s, mode):
+    """ differential box counting looping over the pixels of every box, nan pixels ignored """
+    M = im.shape[0]
+    ngrid = math.ceil(M / s)
+    h = 256 * (s / M)
+    Ns = 0
+    for i in range(ngrid):
+        for j in range(ngrid):
+            box = im[i * s: (i + 1) * s, j * s: (j + 1) * s].astype(float)
+            box = box[~np.isnan(box)]
+            maxg, ming = max(box.max(initial=0), 0), min(box.min(initial=255), 255)
+            if mode == "standard":
+                Ns += math.ceil(maxg / h) - math.ceil(ming / h) + 1
+            else:
+                Ns += math.ceil((maxg - ming + 1) / h)
+    return Ns
+
+
+class TestFractalDimension:
+
+    default_rng = np.random.default_rng(seed=0)
+    label_image = simulate_label_image((128, 128), n_rois=20, seed=0)
+    intensity = default_rng.random((128, 128)) * 255
+
+    def test_differential_box_counting(self):
+        # scales that don't divide the image size leave partial edge boxes
+        im = (self.default_rng.random((50, 50)) * 300).astype(np.uint16)
+        for s in [2, 3, 7, 16, 25]:
+            for mode in ["standard", "shifting"]:
+                assert differential_box_counting(im, s, mode=mode) == _box_counting_loop(im, s, mode)
+
+        # nan pixels, e.g. outside a masked roi, don't count
+        im = self.default_rng.random((50, 50)) * 255
+        im[self.default_rng.random((50, 50)) < 0.3] = np.nan
+        im[:10, :10] = np.nan
+        for s in [2, 3, 7, 16, 25]:
+            for mode in ["standard", "shifting"]:
+                assert differential_box_counting(im, s, mode=mode) == _box_counting_loop(im, s, mode)
+
+    def test_fractal_dimension_gray_labels(self):
+        labels, fd = fractal_dimension_gray_labels(self.label_image, self.intensity)
+        assert np.array_equal(labels, np.unique(self.label_image)[1:])
+        for props, value in zip(skimage_regionprops(self.label_image, self.intensity), fd):
+            assert np.isclose(fractal_dimension_gray(props.image, props.image_intensity), value)
+
+    def test_fractal_dimension_binary(self):
+        # sierpinski carpet, dimension log(8) / log(3)
+        carpet = np.ones((1, 1))
+        for _ in range(5):
+            carpet = np.block([[carpet, carpet, carpet],
+                               [carpet, np.zeros_like(carpet), carpet],
+                               [carpet, carpet, carpet]])
+        fd = fractal_dimension_binary(1 - carpet)
+        assert abs(fd - np.log(8) / np.log(3)) < 0.1
+
+    def test_fractal_dimension_binary_labels(self):
+        labels, fd, residuals = fractal_dimension_binary_labels(self.label_image)
+        assert np.array_equal(labels, np.unique(self.label_image)[1:])
+        assert fd.shape == residuals.shape == labels.shape
+        for label, value in zip(labels, fd):
+            roi = self.label_image[find_objects(self.label_image)[label - 1]] == label
+            if min(roi.shape) >= 8:
+                assert np.isclose(fractal_dimension_binary(1.0 - roi), value)
+
+
+class TestRadiusFeatures:
+
+    def test_radius_features(self):
+        # two touching squares and a separate disk
+        label_image = np.zeros((40, 40), dtype=np.uint16)
+        label_image[2:12, 2:12] = 1
+        label_image[2:12, 12:22] = 2
+        rows, cols = np.mgrid[:40, :40]
+        label_image[(rows - 28) ** 2 + (cols - 28) ** 2 <= 36] = 5
+
+        radii = radius_features(label_image, quantiles=[0.25, 0.75])
+        assert np.array_equal(radii.labels, [1, 2, 5])
+        assert radii.radius_quantiles.shape == (3, 2)
+
+        # touching squares are measured as if separated by background
+        foreground = label_image != 0
+        foreground[2:12, 11:13] = False
+        distance = ndimage.distance_transform_edt(foreground)
+        assert radii.radius_max[0] == radii.radius_max[1] == 5
+        for idx, label in enumerate(radii.labels):
+            values = distance[label_image == label]
+            assert np.isclose(radii.radius_max[idx], values.max())
+            assert np.isclose(radii.radius_mean[idx], values.mean())
+            assert np.isclose(radii.radius_median[idx], np.median(values))
+            assert np.allclose(radii.radius_quantiles[idx], np.quantile(values, [0.25, 0.75]))
+
+        # the disk's center is its farthest pixel from background
+        assert np.array_equal(radii.radius_argmax[2], [28, 28])
+
+
+class TestRegionprops:
+
+    default_rng = np.random.default_rng(seed=0)
+    label_image = simulate_label_image((128, 128), n_rois=20, seed=0)
+    intensity = default_rng.random((128, 128)) * 255
+
+    def test_regionprops_cached_extras(self):
+        regions = regionprops(self.label_image, self.intensity)
+        region = regions[0]
+        assert region._radii is None  # nothing computed until accessed
+        assert np.isclose(region.intensity_sum, region.image_intensity[region.image].sum())
+        assert region["area"] == region.area
+
+        # radii of the bounding box image, background included, like the
+        # radius functions applied to region.image
+        table = regionprops_table(self.label_image, properties=["label", "radius_max",
+                                                                "radius_mean", "radius_median"])
+        assert region.radius_mean == radius_mean(region.image)
+        assert set(region._radii) == {"radius_max", "radius_mean", "radius_median"}
+        distance = ndimage.distance_transform_edt(region.image)
+        assert region.radius_mean == distance.sum() / region.image.size
+        for idx, region in enumerate(regions):
+            assert region.radius_max == radius_max(region.image)
+            assert region.radius_mean == radius_mean(region.image)
+            assert region.radius_median == radius_median(region.image)
+            for prop in ["radius_max", "radius_mean", "radius_median"]:
+                assert region[prop] == table[prop][idx]
+
+    def test_regionprops_table(self):
+        table = regionprops_table(self.label_image, self.intensity,
+                                  properties=["label", "area", "intensity_sum", "radius_max"])
+        assert list(table) == ["label", "area", "intensity_sum", "radius_max"]
+        for idx, region in enumerate(regionprops(self.label_image, self.intensity)):
+            assert table["radius_max"][idx] == radius_max(region.image)
+            assert table["label"][idx] == region.label
+            assert np.isclose(table["intensity_sum"][idx], region.intensity_sum)
+
+        # extras are only computed when requested
+        assert list(regionprops_table(self.label_image, properties=["area"])) == ["area"]
+
+
+class TestTracking:
+
+    @staticmethod
+    def square(label_image, label, row, col, size=6):
+        label_image[row: row + size, col: col + size] = label
+
+    def test_track_labels(self):
+        frames = [np.zeros((64, 64), dtype=np.uint16) for _ in range(4)]
+        for frame, label_image in enumerate(frames):
+            # moving 3 pixels per frame, relabeled every frame
+            self.square(label_image, 10 + frame, 5, 5 + 3 * frame)
+            # disappears after frame 1
+            if frame <= 1:
+                self.square(label_image, 1, 40, 40)
+        # splits into two in frame 3
+        self.square(frames[2], 7, 30, 10, size=8)
+        self.square(frames[3], 7, 30, 10, size=4)
+        self.square(frames[3], 8, 34, 10, size=4)
+
+        tracks = track_labels(frames, max_distance=5)
+        moving = tracks[tracks["label"] >= 10]
+        assert moving["track_id"].nunique() == 1
+        assert np.array_equal(moving["label"], [10, 11, 12, 13])
+
+        track_gone = tracks.loc[tracks["label"] == 1, "track_id"].unique()
+        assert len(track_gone) == 1
+        assert tracks.loc[tracks["track_id"] == track_gone[0], "frame"].max() == 1
+
+        split = tracks[tracks["frame"] == 3].set_index("label")
+        parent = tracks.loc[(tracks["frame"] == 2) & (tracks["label"] == 7), "track_id"].iloc[0]
+        assert parent in split.loc[[7, 8], "track_id"].to_list()
+        child = split.loc[[7, 8]].query("track_id != @parent")
+        assert child["parent_track_id"].iloc[0] == parent
+
+        motion = track_motion(tracks, frame_interval=2)
+        track = motion.loc[moving["track_id"].iloc[0]]
+        assert track["n_frames"] == 4
+        assert np.isclose(track["path_length"], 9)
+        assert np.isclose(track["speed_mean"], 1.5)
+        assert np.isclose(track["velocity-1"], 1.5)
+        assert np.isclose(track["straightness"], 1)
+
+
+class TestMitochondriaNetwork:
+
+    def test_mitochondria_network_features(self):
+        mask = np.zeros((60, 60), dtype=np.uint16)
+        mask[5:8, 5:8] = 1  # punctate
+        mask[5:20, 30:45] = 2  # swollen
+        mask[30, 5:30] = 3  # rod
+        mask[45, 35:56] = 4  # networked, a cross
+        mask[35:56, 45] = 4
+        mask[30, 30:55] = 5  # touching rod 3 end to end
+        network = mitochondria_network_features(mask)
+
+        assert np.array_equal(network.labels, [1, 2, 3, 4, 5])
+        assert list(network.morphology) == ["punctate", "swollen", "rod", "networked", "rod"]
+        assert np.array_equal(network.area, [9, 225, 25, 41, 25])
+        assert network.n_branch_points[3] == 1
+        assert network.n_branches[3] == 4
+        assert network.n_endpoints[3] == 4
+        assert network.branch_length_max[3] == 9  # the junction is the center and its 4 neighbors
+
+        # touching rods are skeletonized separately, without their shared boundary
+        assert network.n_branches[2] == network.n_branches[4] == 1
+        assert network.skeleton_length[2] == 24
+        assert network.skeleton_length[4] == 24
+
+        # bool masks are labeled, integer masks are labels even with a single label
+        binary = (mask != 0) & (mask != 5)
+        network_bool = mitochondria_network_features(binary)
+        assert list(network_bool.morphology) == ["punctate", "swollen", "rod", "networked"]
+        assert np.array_equal(network_bool.area, [9, 225, 25, 41])
+        network_single = mitochondria_network_features(binary.astype(np.uint8))
+        assert np.array_equal(network_single.labels, [1])
+        assert np.array_equal(network_single.area, [300])
+        network_index = mitochondria_network_features(binary.astype(np.uint8),
+                                                      label_index=LabelIndex(binary.astype(np.uint8)))
+        assert np.array_equal(network_index.area, network_single.area)
+
+
+class TestNeighborhood:
+
+    def test_neighborhood_features(self):
+        default_rng = np.random.default_rng(seed=0)
+        centroids = default_rng.random((300, 2)) * 200
+        features = {"redox_ratio_mean": default_rng.random(300)}
+        features["redox_ratio_mean"][5] = np.nan
+        df = neighborhood_features(centroids, features, radii=[10, 25], k=2, pixel_size=0.5)
+
+        distance = np.linalg.norm(centroids[:, np.newaxis] - centroids[np.newaxis], axis=2) * 0.5
+        np.fill_diagonal(distance, np.inf)
+        for idx in range(0, 300, 7):
+            within = distance[idx] <= 10
+            assert df["n_neighbors_r10"][idx] == within.sum()
+            assert np.isclose(df["density_r10"][idx], within.sum() / (np.pi * 10 ** 2))
+            assert np.isclose(df["nn_distance_2"][idx], np.sort(distance[idx])[1])
+            values = features["redox_ratio_mean"][within]
+            values = values[np.isfinite(values)]
+            if len(values):
+                assert np.isclose(df["redox_ratio_mean_neighbors_r10"][idx], values.mean())
+            else:
+                assert np.isnan(df["redox_ratio_mean_neighbors_r10"][idx])
+
+    def test_region_adjacency(self):
+        label_image = np.zeros((20, 20), dtype=np.uint8)
+        label_image[2:8, 2:8] = 1
+        label_image[2:8, 8:14] = 2  # touches 1
+        label_image[10:15, 10:15] = 3  # 2 pixels diagonally from 2
+        rag = region_adjacency_graph(label_image)
+        assert rag.adjacency.toarray().astype(int).tolist() == [[0, 1, 0], [1, 0, 0], [0, 0, 0]]
+        rag = region_adjacency_graph(label_image, distance=3)
+        assert rag.adjacency[1, 2] and rag.adjacency[2, 1] and not rag.adjacency[0, 2]
+
+        centroids = np.array([[4.5, 4.5], [4.5, 10.5], [12, 12]])
+        df = neighborhood_features(centroids, {"area": [36, 36, 25]}, radii=[], k=0,
+                                   adjacency=rag.adjacency, index=rag.labels)
+        assert df["n_adjacent"].to_list() == [1, 2, 1]
+        assert df["area_adjacent"].to_list() == [36, 30.5, 36]
+
+
+class TestLabelIntensity:
+
+    default_rng = np.random.default_rng(seed=0)
+    label_image = simulate_label_image((64, 64), n_rois=10, seed=0)
+
+    def test_label_intensity(self):
+        cube = self.default_rng.integers(0, 100, (64, 64, 8)).astype(np.uint16)
+        result = label_intensity(self.label_image, cube)
+        assert result.sum.shape == (len(result.labels), 8)
+        for idx, label in enumerate(result.labels):
+            assert np.array_equal(result.sum[idx], cube[self.label_image == label].sum(axis=0))
+            assert np.all(result.count[idx] == np.sum(self.label_image == label))
+
+        # masked pixels are excluded
+        image = ma.masked_array(cube[..., 0].astype(float), mask=self.default_rng.random((64, 64)) > 0.5)
+        result = label_intensity(self.label_image, image)
+        for idx, label in enumerate(result.labels):
+            values = image[self.label_image == label].compressed()
+            assert np.isclose(result.sum[idx], values.sum())
+            assert result.count[idx] == values.size
+
+    def test_regionprops_table_timebins(self):
+        cube = self.default_rng.random((64, 64, 4))
+        table = regionprops_table(self.label_image, cube, properties=["label", "intensity_sum"])
+        assert list(table) == ["label"] + [f"intensity_sum-{idx}" for idx in range(4)]
+        for idx, label in enumerate(table["label"]):
+            assert np.isclose(table["intensity_sum-3"][idx], cube[..., 3][self.label_image == label].sum())
@@ -0,0 +1,126 @@
+import numpy as np
+import tifffile
+
+from cell_analysis_tools.__main__ import main
+from cell_analysis_tools.flim import omi_features
+from cell_analysis_tools.flim.regionprops_omi_stain import regionprops_omi_run
+from cell_analysis_tools.flim.simulate import (simulate_label_image,
+                                               simulate_omi_images)
+from cell_analysis_tools.pipeline import (build_manifest, collect_features,
+                                          feature_spec, run_omi_pipeline)
+
+
+def write_dataset(path_dataset, n_sets=3):
+    """ SPCImage style tiffs of simulated image sets, see runCALICO.py naming """
+    dict_images = {}
+    for idx in range(n_sets):
+        base = f"dish{idx}_"
+        label_image = simulate_label_image((64, 64), n_rois=5, seed=idx)
+        images = simulate_omi_images(label_image, seed=idx)
+        tifffile.imwrite(path_dataset / f"{base}n_photons_cellmask.tif", label_image)
+        for channel, letter in [("nadh", "n"), ("fad", "f")]:
+            for product, suffix in [("intensity", "_photons.tiff"), ("a1", "_a1[%].tiff"),
+                                    ("a2", "_a2[%].tiff"), ("t1", "_t1.tiff"), ("t2", "_t2.tiff")]:
+                tifffile.imwrite(path_dataset / f"{base}{letter}{suffix}",
+                                 images[f"im_{channel}_{product}"])
+        dict_images[base] = (label_image, images)
+    return dict_images
+
+
+class TestPipeline:
+
+    def test_build_manifest(self, tmp_path):
+        write_dataset(tmp_path)
+        (tmp_path / "dish1_f_t2.tiff").unlink()
+        df_manifest = build_manifest(tmp_path)
+        assert list(df_manifest.index) == ["dish0_", "dish2_"]
+        assert df_manifest.loc["dish0_", "fad_a1"].endswith("dish0_f_a1[%].tiff")
+
+    def test_run_omi_pipeline(self, tmp_path):
+        path_dataset = tmp_path / "dataset"
+        path_dataset.mkdir()
+        dict_images = write_dataset(path_dataset)
+        path_output = tmp_path / "outputs"
+        df_manifest = build_manifest(path_dataset)
+
+        spec = feature_spec(intensity_weighted=True)
+        summary = run_omi_pipeline(df_manifest, path_output, spec=spec, n_workers=2)
+        assert sorted(summary.completed) == sorted(dict_images)
+        assert summary.n_rois == sum(len(np.unique(li)) - 1 for li, _ in dict_images.values())
+
+        # same values as computing the images directly
+        df_features = collect_features(path_output)
+        label_image, images = dict_images["dish1_"]
+        dict_omi = omi_features("dish1_", label_image,
+                                {k.replace("im_", "", 1): im for k, im in images.items()
+                                 if not k.endswith("chi")},
+                                other_props=spec["other_props"])
+        for key, dict_roi in dict_omi.items():
+            for feature, value in dict_roi.items():
+                assert np.isclose(df_features.loc[key, feature], value, equal_nan=True)
+
+        # finished sets are skipped on rerun, removed partitions are recomputed
+        (path_output / "features" / "dish0_.csv").unlink()
+        summary = run_omi_pipeline(df_manifest, path_output, spec=spec)
+        assert summary.completed == ["dish0_"]
+        assert sorted(summary.skipped) == ["dish1_", "dish2_"]
+
+    def test_same_columns_as_regionprops_omi_run(self, tmp_path):
+        path_dataset = tmp_path / "dataset"
+        path_dataset.mkdir()
+        dict_images = write_dataset(path_dataset, n_sets=1)
+        path_output = tmp_path / "outputs"
+        spec = feature_spec(stain_intensity=False, stain_lifetime=False, intensity_weighted=True)
+        run_omi_pipeline(build_manifest(path_dataset), path_output, spec=spec)
+        df_features = collect_features(path_output)
+
+        label_image, images = dict_images["dish0_"]
+        dict_omi = regionprops_omi_run(
+            True, False, False, True, "dish0_", label_image,
+            other_props=spec["other_props"],
+            **{k: im for k, im in images.items() if not k.endswith("chi")},
+        )
+        columns = list(next(iter(dict_omi.values())))
+        assert sorted(df_features.columns.drop("base")) == sorted(columns)
+
+    def test_incremental_recompute(self, tmp_path):
+        path_dataset = tmp_path / "dataset"
+        path_dataset.mkdir()
+        write_dataset(path_dataset)
+        path_output = tmp_path / "outputs"
+        df_manifest = build_manifest(path_dataset)
+        run_omi_pipeline(df_manifest, path_output)
+
+        # rewriting a file with the same content doesn't trigger a recompute
+        path_mask = path_dataset / "dish2_n_photons_cellmask.tif"
+        tifffile.imwrite(path_mask, tifffile.imread(path_mask))
+        summary = run_omi_pipeline(df_manifest, path_output)
+        assert summary.completed == []
+
+        # only the set with a changed mask is recomputed and spliced in
+        label_image = simulate_label_image((64, 64), n_rois=8, seed=10)
+        tifffile.imwrite(path_mask, label_image)
+        summary = run_omi_pipeline(df_manifest, path_output)
+        assert summary.completed == ["dish2_"]
+        df_features = collect_features(path_output)
+        assert (df_features["base"] == "dish2_").sum() == len(np.unique(label_image)) - 1
+        assert (df_features["base"] == "dish0_").sum() == 5
+
+        # partitions of sets that are not in the manifest or the state are left out
+        df_features.loc[df_features["base"] == "dish0_"].to_csv(path_output / "features" / "old_.csv")
+        df_features = collect_features(path_output, manifest=df_manifest.drop("dish1_"))
+        assert sorted(df_features["base"].unique()) == ["dish0_", "dish2_"]
+        assert (df_features["base"] == "dish0_").sum() == 5
+        df_features = collect_features(path_output)
+        assert sorted(df_features["base"].unique()) == ["dish0_", "dish1_", "dish2_"]
+        assert (df_features["base"] == "dish0_").sum() == 5
+
+        # a different spec recomputes everything
+        summary = run_omi_pipeline(df_manifest, path_output, spec=feature_spec(other_props=["area"]))
+        assert sorted(summary.completed) == ["dish0_", "dish1_", "dish2_"]
+
+    def test_main(self, tmp_path):
+        write_dataset(tmp_path, n_sets=2)
+        assert main(["omi", str(tmp_path), "--workers", "1", "--no-resume"]) == 0
+        assert (tmp_path / "outputs" / "manifest.csv").exists()
+        assert (tmp_path / "outputs" / f"{tmp_path.stem}_features.csv").exists()
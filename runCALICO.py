@@ -3,7 +3,8 @@ import re
 from tqdm import tqdm
 import pandas as pd
 from cell_analysis_tools.io import load_image
-from cell_analysis_tools.flim import regionprops_omi_stain as reg
+from cell_analysis_tools.flim import (FeatureTableAccumulator, omi_feature_table,
+                                      omi_run_parameters)
 
 
 #%% Inputs
@@ -136,164 +137,57 @@ df_paths.index.name = "base"
 #%% load csv dicts with path sets 
      
 # iterate through rows(image sets) in dataframe,
-outputs = pd.DataFrame()
+# feature tables of every image are appended to one columnar table
+accumulator = FeatureTableAccumulator()
 for base, row_data in tqdm(list(df_paths.iterrows()), desc='Analyzing images'): # iterate through sets in csv file
             pass
 
             # load mask image
             label_image = load_image(Path(str(row_data['mask'])))
-            # load NADH images 
-            im_nadh_intensity = load_image(Path(str(row_data.nadh_photons)))
-            im_nadh_a1 = load_image(Path(str(row_data.nadh_a1)))
-            im_nadh_a2 = load_image(Path(str(row_data.nadh_a2)))
-            im_nadh_t1 = load_image(Path(str(row_data.nadh_t1)))
-            im_nadh_t2 = load_image(Path(str(row_data.nadh_t2)))
-            # load FAD images 
-            if FAD == True:
-                im_fad_intensity = load_image(Path(str(row_data.fad_photons)))
-                im_fad_a1 = load_image(Path(str(row_data.fad_a1)))
-                im_fad_a2 = load_image(Path(str(row_data.fad_a2)))
-                im_fad_t1 = load_image(Path(str(row_data.fad_t1)))
-                im_fad_t2 = load_image(Path(str(row_data.fad_t2)))
-            # load RED image
-            if Stain_intensity == True:
-                im_stain_intensity = load_image(Path(str(row_data.stain_photons)))
-            if Stain_lifetime == True:
-                im_stain_a1 = load_image(Path(str(row_data.stain_a1)))
-                im_stain_a2 = load_image(Path(str(row_data.stain_a2)))
-                im_stain_t1 = load_image(Path(str(row_data.stain_t1)))
-                im_stain_t2 = load_image(Path(str(row_data.stain_t2)))
-            
-            # compute ROI props
-            if FAD==True and Stain_intensity==True and Stain_lifetime==True:
-                omi_props = reg.regionprops_omi_run(
-                    Intensity_weighted_means = Intensity_weighted_means,
-                    FAD = FAD,
-                    Stain_intensity = Stain_intensity,
-                    Stain_lifetime = Stain_lifetime,
-                
-                    image_id = base,
-                    label_image = label_image,
-                    im_nadh_intensity = im_nadh_intensity,
-                    im_nadh_a1 = im_nadh_a1, 
-                    im_nadh_a2 = im_nadh_a2, 
-                    im_nadh_t1 = im_nadh_t1, 
-                    im_nadh_t2 = im_nadh_t2,
-                    im_fad_intensity = im_fad_intensity,
-                    im_fad_a1 = im_fad_a1,
-                    im_fad_a2 = im_fad_a2,
-                    im_fad_t1 = im_fad_t1,
-                    im_fad_t2 = im_fad_t2,
-                    im_stain_intensity = im_stain_intensity,
-                    im_stain_a1 = im_stain_a1,
-                    im_stain_a2 = im_stain_a2,
-                    im_stain_t1 = im_stain_t1,
-                    im_stain_t2 = im_stain_t2,
-                    other_props=other_props
-                    )
-            if FAD==True and Stain_intensity==True and Stain_lifetime==False:
-                omi_props = reg.regionprops_omi_run(
-                    Intensity_weighted_means = Intensity_weighted_means,
-                    FAD = FAD,
-                    Stain_intensity = Stain_intensity,
-                    Stain_lifetime = Stain_lifetime,
-                
-                    image_id = base,
-                    label_image = label_image,
-                    im_nadh_intensity = im_nadh_intensity,
-                    im_nadh_a1 = im_nadh_a1, 
-                    im_nadh_a2 = im_nadh_a2, 
-                    im_nadh_t1 = im_nadh_t1, 
-                    im_nadh_t2 = im_nadh_t2,
-                    im_fad_intensity = im_fad_intensity,
-                    im_fad_a1 = im_fad_a1,
-                    im_fad_a2 = im_fad_a2,
-                    im_fad_t1 = im_fad_t1,
-                    im_fad_t2 = im_fad_t2,
-                    im_stain_intensity = im_stain_intensity,
-                    other_props=other_props
-                    )
-            if FAD==True and Stain_intensity==False and Stain_lifetime==False:
-                omi_props = reg.regionprops_omi_run(
-                    Intensity_weighted_means = Intensity_weighted_means,
-                    FAD = FAD,
-                    Stain_intensity = Stain_intensity,
-                    Stain_lifetime = Stain_lifetime,
-                 
-                    image_id = base,
-                    label_image = label_image,
-                    im_nadh_intensity = im_nadh_intensity,
-                    im_nadh_a1 = im_nadh_a1, 
-                    im_nadh_a2 = im_nadh_a2, 
-                    im_nadh_t1 = im_nadh_t1, 
-                    im_nadh_t2 = im_nadh_t2,
-                    im_fad_intensity = im_fad_intensity,
-                    im_fad_a1 = im_fad_a1,
-                    im_fad_a2 = im_fad_a2,
-                    im_fad_t1 = im_fad_t1,
-                    im_fad_t2 = im_fad_t2,
-                    other_props=other_props
-                    )
-                
-            if FAD==False and Stain_intensity==False and Stain_lifetime==False:
-                omi_props = reg.regionprops_omi_run(
-                    Intensity_weighted_means = Intensity_weighted_means,
-                    FAD = FAD,
-                    Stain_intensity = Stain_intensity,
-                    Stain_lifetime = Stain_lifetime,
-                 
-                    image_id = base,
-                    label_image = label_image,
-                    im_nadh_intensity = im_nadh_intensity,
-                    im_nadh_a1 = im_nadh_a1, 
-                    im_nadh_a2 = im_nadh_a2, 
-                    im_nadh_t1 = im_nadh_t1, 
-                    im_nadh_t2 = im_nadh_t2,
-                    other_props=other_props
-                    )
-                
-            if FAD==False and Stain_intensity==False and Stain_lifetime==False:
-                    omi_props = reg.regionprops_omi_run(
-                        Intensity_weighted_means = Intensity_weighted_means,
-                        FAD = FAD,
-                        Stain_intensity = Stain_intensity,
-                        Stain_lifetime = Stain_lifetime,
-                     
-                        image_id = base,
-                        label_image = label_image,
-                        im_nadh_intensity = im_nadh_intensity,
-                        im_nadh_a1 = im_nadh_a1, 
-                        im_nadh_a2 = im_nadh_a2, 
-                        im_nadh_t1 = im_nadh_t1, 
-                        im_nadh_t2 = im_nadh_t2,
-                        other_props=other_props
-                        )
-            #create dataframe
-            df = pd.DataFrame(omi_props).transpose()
-            df.index.name = "base"
-            
-            # add other dictionary data to df
-            df["base"] = base
-            for item_key in row_data.keys():
-                df[item_key] = row_data[item_key]
 
-            # combine all image data into one csv
-            outputs = pd.concat([outputs, df], axis=0)
-            pass
+            # parameter images are loaded lazily, only when a feature needs them
+            images = {}
+            for path_key, path_image in row_data.items():
+                if path_key == "mask" or path_image == "":
+                    continue
+                channel, product = path_key.split("_", 1)
+                product = "intensity" if product == "photons" else product
+                images[f"{channel}_{product}"] = lambda path_image=path_image: load_image(Path(str(path_image)))
+
+            # same parameters as regionprops_omi_run for the selected channels
+            parameters, list_weighted = omi_run_parameters(
+                images,
+                fad = FAD,
+                stain_intensity = Stain_intensity,
+                stain_lifetime = Stain_lifetime,
+                intensity_weighted = Intensity_weighted_means,
+                )
+
+            # compute ROI props
+            table = omi_feature_table(
+                image_id = base,
+                label_image = label_image,
+                images = images,
+                parameters = parameters,
+                intensity_weighted = list_weighted,
+                other_props=other_props
+                )
+            accumulator.append(table)
+
+# one dataframe of all images, index is f"{base}_{label}"
+outputs = accumulator.to_table().to_pandas(index_name="base")
+outputs["base"] = outputs.pop("image_id")
 
 #%% Final df manipulations before export
 
 if 'stdev' in outputs.columns:
-    stdev_columns = [col for col in df.columns if 'stdev' in col.lower()] 
+    stdev_columns = [col for col in outputs.columns if 'stdev' in col.lower()] 
     outputs.drop(columns=stdev_columns, inplace=True) #removes stdev columns
     pass
 elif 'weighted' in outputs.columns:
-    weighted_columns = [col for col in df.columns if 'weighted' in col.lower()]
+    weighted_columns = [col for col in outputs.columns if 'weighted' in col.lower()]
     outputs.drop(columns=weighted_columns, inplace=True) #removes intensity weighted columns
     pass
 
-# remove path files from outputs csv
-outputs = outputs.iloc[:,:outputs.columns.get_loc("mask")]
-
 # finally.. export data
 outputs.to_csv(path_dataset/ f"{path_dataset.stem}_features.csv")
\ No newline at end of file